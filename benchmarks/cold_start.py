@@ -0,0 +1,84 @@
+"""Cold start of the API server: import time of `app.main`, time until `/ready`, and latency of the first
+and second `/predict/` requests, with and without model warm-up.
+
+Each configuration runs in a fresh process, like a new container. Needs the trained models in `models/`.
+
+Examples:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --workers 2
+"""
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+PROJECT_DIR     = Path(__file__).parent.parent
+BENCHMARK_DIR   = Path(__file__).parent
+sys.path.append(str(PROJECT_DIR / "src"))
+sys.path.append(str(BENCHMARK_DIR))
+
+
+def measure_cold_start(env: dict, video_path: str, output_dir: str, timeout: float = 300) -> dict:
+    """Start the server in this (fresh) process and time its startup, in secs"""
+    os.environ.update(env)
+    # Without the result cache, the second request is processed as well
+    os.environ["KITCHEN_CACHE_MB"] = "0"
+
+    start = time.perf_counter()
+    import app.main
+    import_s = time.perf_counter() - start
+
+    from fastapi.testclient import TestClient
+
+    timings = {"import_s": import_s, "torch_imported": "torch" in sys.modules}
+    with TestClient(app.main.app) as client:
+        while client.get("/ready").status_code != 200:
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Not ready after {timeout} secs: {client.get('/ready').json()}")
+            time.sleep(0.05)
+        timings["ready_s"] = time.perf_counter() - start
+
+        for request in ("first_request_s", "second_request_s"):
+            request_start   = time.perf_counter()
+            response        = client.post("/predict/", json={
+                "in_video_path": video_path,
+                "out_video_path": str(Path(output_dir) / f"cold_start_{request}.mp4"),
+                "conf": 0.25,
+                "iou": 0.7,
+                "device": "cpu",
+            })
+            timings[request] = time.perf_counter() - request_start
+            if not response.json()["output_video"]:
+                raise RuntimeError(f"Prediction failed: {response.json()}")
+
+    return timings
+
+
+if __name__ == "__main__":
+    from synthetic import make_kitchen_video
+
+    parser = ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0, help="KITCHEN_MODEL_WORKERS")
+    parser.add_argument("--frames", type=int, default=25)
+    args = parser.parse_args()
+
+    cache_dir   = BENCHMARK_DIR / ".cache"
+    output_dir  = cache_dir / "outputs"
+    video_path  = cache_dir / f"cold_start_{args.frames}f.mp4"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if not video_path.exists():
+        make_kitchen_video(str(video_path), n_frames=args.frames)
+
+    results = {}
+    for name, warmup in (("warmup", "1"), ("no_warmup", "0")):
+        env = {"KITCHEN_WARMUP": warmup, "KITCHEN_MODEL_WORKERS": str(args.workers)}
+        print(f"Measuring {name}")
+        # A fresh process per configuration, as in a new container
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results[name] = executor.submit(measure_cold_start, env, str(video_path), str(output_dir)).result()
+
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,267 @@
+"""End-to-end benchmark of `process_video`: fps, per-stage latency and peak RSS for a set of scenarios,
+saved as JSON and optionally compared against a baseline with regression thresholds.
+
+Each scenario runs in a fresh process, so that peak RSS and model warm-up are measured per scenario.
+Runs on CPU without network access: if the trained weights are not in `models/`, the base weights in
+`models/base/` are used, and otherwise randomly initialized yolo11n models.
+
+Examples:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scenarios baseline pipeline --save-baseline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --video data/sample_video/short_30s.mp4
+"""
+import json
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import cv2
+
+PROJECT_DIR     = Path(__file__).parent.parent
+BENCHMARK_DIR   = Path(__file__).parent
+sys.path.append(str(PROJECT_DIR / "src"))
+sys.path.append(str(BENCHMARK_DIR))
+
+from synthetic import make_kitchen_video  # noqa: E402
+
+
+# process_video options of each scenario
+SCENARIOS = {
+    "baseline": {},
+    "pipeline": {"pipeline": True},
+    "stride3": {"detect_stride": 3},
+    "motion_gate": {"motion_threshold": 0.01},
+}
+
+STAGES = ("decode", "motion", "detect_track", "classify", "draw", "write", "ffmpeg")
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def load_benchmark_models(models_dir: Path) -> tuple[dict, str]:
+    """Trained models if available, otherwise local base weights, otherwise random yolo11n models.
+    Never downloads anything.
+
+    Returns
+    -------
+    tuple[dict, str]
+        Models by argument name of `process_video`, and which weights were used
+    """
+    from ultralytics import YOLO
+
+    trained = {
+        "detector": models_dir / "detector/best.pt",
+        "dish_classifier": models_dir / "dish_classifier/best.pt",
+        "tray_classifier": models_dir / "tray_classifier/best.pt",
+    }
+    if all(path.exists() for path in trained.values()):
+        return {
+            name: YOLO(path, task="detect" if name == "detector" else "classify")
+            for name, path in trained.items()
+        }, "trained"
+
+    base_detector   = models_dir / "base/yolo11n.pt"
+    base_classifier = models_dir / "base/yolo11n-cls.pt"
+    if base_detector.exists() and base_classifier.exists():
+        return {
+            "detector": YOLO(base_detector, task="detect"),
+            "dish_classifier": YOLO(base_classifier, task="classify"),
+            "tray_classifier": YOLO(base_classifier, task="classify"),
+        }, "base"
+
+    return {
+        "detector": YOLO("yolo11n.yaml", task="detect"),
+        "dish_classifier": YOLO("yolo11n-cls.yaml", task="classify"),
+        "tray_classifier": YOLO("yolo11n-cls.yaml", task="classify"),
+    }, "random"
+
+
+def run_scenario(name: str, video_path: str, warmup_path: str, output_dir: str, models_dir: str, options: dict) -> dict:
+    """Run one scenario, in its own process"""
+    import torch
+    from kitchen.inference import process_video
+
+    torch.set_num_threads(options.pop("torch_threads"))
+    models, weights = load_benchmark_models(Path(models_dir))
+    kwargs          = {**options, **SCENARIOS[name]}
+
+    # Warm-up: lazy model initialization and first-call overheads are not benchmarked
+    process_video(warmup_path, str(Path(output_dir) / f"warmup_{name}.mp4"), **models, **kwargs)
+
+    start   = time.perf_counter()
+    result  = process_video(video_path, str(Path(output_dir) / f"{name}.mp4"), **models, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    n_frames = int(cv2.VideoCapture(video_path).get(cv2.CAP_PROP_FRAME_COUNT))
+
+    return {
+        "weights": weights,
+        "n_frames": n_frames,
+        "elapsed_s": elapsed,
+        "fps": n_frames / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": result.stats.get("stages", {}),
+        "stats": {key: value for key, value in result.stats.items() if key != "stages"},
+    }
+
+
+def prepare_videos(args) -> tuple[str, str]:
+    """Benchmark video and a short warm-up video with the same resolution"""
+    cache_dir = BENCHMARK_DIR / ".cache"
+    cache_dir.mkdir(exist_ok=True)
+
+    if args.video is not None:
+        cap = cv2.VideoCapture(args.video)
+        if not cap.isOpened() or int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 0:
+            # e.g. sample videos that are Git LFS pointers
+            raise ValueError(f"Cannot read video {args.video}, run without --video to use a synthetic video")
+        width, height   = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        video_path      = args.video
+        cap.release()
+    else:
+        width, height   = args.width, args.height
+        video_path      = cache_dir / f"kitchen_{width}x{height}_{args.frames}f_{args.fps}fps_seed{args.seed}.mp4"
+        if not video_path.exists():
+            make_kitchen_video(str(video_path), width, height, args.frames, args.fps, seed=args.seed)
+
+    warmup_path = cache_dir / f"warmup_{width}x{height}.mp4"
+    if not warmup_path.exists():
+        make_kitchen_video(str(warmup_path), width, height, n_frames=5, seed=args.seed)
+
+    return str(video_path), str(warmup_path)
+
+
+def compare(results: dict, baseline: dict, args) -> list[str]:
+    """Regressions of the results compared to the baseline, as messages"""
+    regressions = []
+
+    for name, current in results["scenarios"].items():
+        reference = baseline["scenarios"].get(name)
+        if reference is None:
+            continue
+
+        if current["fps"] < reference["fps"] * (1 - args.fps_tolerance):
+            regressions.append(f"{name}: fps {current['fps']:.2f} < baseline {reference['fps']:.2f}")
+
+        if current["peak_rss_mb"] and reference["peak_rss_mb"]:
+            if current["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + args.rss_tolerance):
+                regressions.append(
+                    f"{name}: peak RSS {current['peak_rss_mb']:.0f} MB > baseline {reference['peak_rss_mb']:.0f} MB"
+                )
+
+        for stage, timing in current["stages"].items():
+            reference_timing = reference["stages"].get(stage)
+            if reference_timing is None:
+                continue
+            # Ignore sub-millisecond noise on cheap stages
+            increase = timing["mean_ms"] - reference_timing["mean_ms"]
+            if increase > args.min_latency_ms and timing["mean_ms"] > reference_timing["mean_ms"] * (1 + args.latency_tolerance):
+                regressions.append(
+                    f"{name}: {stage} {timing['mean_ms']:.2f} ms > baseline {reference_timing['mean_ms']:.2f} ms"
+                )
+
+    return regressions
+
+
+def print_results(results: dict, baseline: dict | None = None):
+    header = f"{'scenario':<12} {'fps':>8} {'rss MB':>8} " + " ".join(f"{stage:>12}" for stage in STAGES)
+    print(f"\nWeights: {results['meta']['weights']}, video: {results['meta']['video']}")
+    print("Mean stage latency in ms")
+    print(header)
+
+    for name, metrics in results["scenarios"].items():
+        stages  = " ".join(
+            f"{metrics['stages'][stage]['mean_ms']:>12.2f}" if stage in metrics["stages"] else f"{'-':>12}"
+            for stage in STAGES
+        )
+        rss     = f"{metrics['peak_rss_mb']:>8.0f}" if metrics["peak_rss_mb"] else f"{'-':>8}"
+        line    = f"{name:<12} {metrics['fps']:>8.2f} {rss} {stages}"
+
+        if baseline is not None and name in baseline["scenarios"]:
+            line += f"   (baseline {baseline['scenarios'][name]['fps']:.2f} fps)"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--scenarios", "-s", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--video", "-v", type=str, default=None, help="Benchmark on this video instead of a synthetic one")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--frames", type=int, default=90)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models-dir", "-m", type=str, default=str(PROJECT_DIR / "models"))
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--torch-threads", type=int, default=4)
+    parser.add_argument("--output", "-o", type=str, default=None, help="Results JSON, by default benchmarks/results/<timestamp>.json")
+    parser.add_argument("--baseline", "-b", type=str, default=None, help="Compare the results with this baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Also save the results as benchmarks/baseline.json")
+    parser.add_argument("--fps-tolerance", type=float, default=0.10, help="Allowed relative fps drop")
+    parser.add_argument("--latency-tolerance", type=float, default=0.20, help="Allowed relative stage latency increase")
+    parser.add_argument("--min-latency-ms", type=float, default=0.5, help="Stage latency increases below this are ignored")
+    parser.add_argument("--rss-tolerance", type=float, default=0.15, help="Allowed relative peak RSS increase")
+
+    args                    = parser.parse_args()
+    video_path, warmup_path = prepare_videos(args)
+    output_dir              = BENCHMARK_DIR / ".cache" / "outputs"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    options = {"conf": args.conf, "iou": args.iou, "device": "cpu", "torch_threads": args.torch_threads}
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor(),
+            "video": Path(video_path).name,
+            "options": options,
+        },
+        "scenarios": {},
+    }
+
+    for name in args.scenarios:
+        print(f"Running scenario {name}")
+        # A fresh process per scenario isolates peak RSS and warm-up
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results["scenarios"][name] = executor.submit(
+                run_scenario, name, video_path, warmup_path, str(output_dir), args.models_dir, dict(options)
+            ).result()
+
+    results["meta"]["weights"] = next(iter(results["scenarios"].values()))["weights"]
+
+    output_path = Path(args.output) if args.output else BENCHMARK_DIR / "results" / f"{datetime.now():%Y%m%d_%H%M%S}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        (BENCHMARK_DIR / "baseline.json").write_text(json.dumps(results, indent=2))
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_results(results, baseline)
+    print(f"\nResults saved to {output_path}")
+
+    if baseline is not None:
+        if baseline["meta"].get("weights") != results["meta"]["weights"] or baseline["meta"].get("video") != results["meta"]["video"]:
+            print("Warning: the baseline was run with other weights or another video")
+
+        regressions = compare(results, baseline, args)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regression")
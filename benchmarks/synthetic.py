@@ -0,0 +1,101 @@
+"""Deterministic synthetic videos that look roughly like the kitchen counter camera:
+a static textured counter with dishes and trays sliding across it, with pauses where nothing moves.
+"""
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.encoder import FFmpegWriter  # noqa: E402
+
+
+def make_background(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """Wall on the top third, wooden counter with grain below"""
+    background  = np.empty((height, width, 3), dtype=np.uint8)
+    wall_height = height // 3
+
+    background[:wall_height] = (200, 205, 210)
+    rows    = np.arange(height - wall_height, dtype=np.float32)[:, None]
+    grain   = 12 * np.sin(rows / 3.0 + rng.uniform(0, 2 * np.pi, size=(1, width)).astype(np.float32) * 0.05)
+    wood    = np.stack([60 + grain, 105 + grain, 150 + grain], axis=-1)
+    background[wall_height:] = np.clip(wood, 0, 255).astype(np.uint8)
+
+    noise = rng.normal(0, 4, size=background.shape)
+    return np.clip(background + noise, 0, 255).astype(np.uint8)
+
+
+def make_objects(width: int, height: int, n_objects: int, rng: np.random.Generator) -> list[dict]:
+    wall_height = height // 3
+    scale       = min(width, height)
+    food_colors = [None, (40, 90, 200), (60, 160, 60), (230, 230, 250)]  # empty, sauce, greens, shaved ice
+
+    objects = []
+    for i in range(n_objects):
+        objects.append({
+            "kind": "tray" if i % 3 == 2 else "dish",
+            "size": int(scale * rng.uniform(0.08, 0.14)),
+            "x": rng.uniform(-0.2, 1.0) * width,
+            "y": rng.uniform(wall_height + 0.1 * height, 0.9 * height),
+            "speed": rng.uniform(0.004, 0.012) * width * rng.choice([-1, 1]),
+            "food": food_colors[rng.integers(len(food_colors))],
+        })
+    return objects
+
+
+def draw_object(frame: np.ndarray, obj: dict, x: float):
+    center  = (int(x), int(obj["y"]))
+    size    = obj["size"]
+
+    if obj["kind"] == "tray":
+        top_left        = (center[0] - size, center[1] - size // 2)
+        bottom_right    = (center[0] + size, center[1] + size // 2)
+        cv2.rectangle(frame, top_left, bottom_right, (70, 70, 80), -1)
+        cv2.rectangle(frame, top_left, bottom_right, (40, 40, 45), 3)
+    else:
+        cv2.ellipse(frame, center, (size, int(size * 0.7)), 0, 0, 360, (235, 235, 235), -1)
+        cv2.ellipse(frame, center, (size, int(size * 0.7)), 0, 0, 360, (180, 180, 185), 2)
+
+    if obj["food"] is not None:
+        cv2.ellipse(frame, center, (size // 2, int(size * 0.35)), 0, 0, 360, obj["food"], -1)
+
+
+def make_kitchen_video(
+    output_path: str,
+    width: int = 640,
+    height: int = 360,
+    n_frames: int = 90,
+    fps: float = 25,
+    n_objects: int = 6,
+    pause_every: int = 60,
+    pause_length: int = 15,
+    seed: int = 0
+) -> str:
+    """Write a synthetic kitchen video. The same arguments always give the same frames.
+
+    Objects move at constant speeds and wrap around the frame. Every `pause_every` frames,
+    everything stops for `pause_length` frames, so that static scenes are covered as well.
+    """
+    rng         = np.random.default_rng(seed)
+    background  = make_background(width, height, rng)
+    objects     = make_objects(width, height, n_objects, rng)
+    out         = FFmpegWriter(output_path, width, height, fps, preset="veryfast", crf=23)
+    moved       = 0
+
+    for frame_idx in range(n_frames):
+        if pause_every == 0 or frame_idx % pause_every >= pause_length:
+            moved += 1
+
+        frame = background.copy()
+        for obj in objects:
+            span    = width + 4 * obj["size"]
+            x       = (obj["x"] + obj["speed"] * moved) % span - 2 * obj["size"]
+            draw_object(frame, obj, x)
+
+        out.write(frame)
+
+    out.release()
+    return output_path
@@ -0,0 +1,45 @@
+"""Crop the labeled boxes of YOLO detection datasets into the classification datasets of the dish / tray
+classifiers (`<output>/<dish|tray>/<empty|kakigori|not_empty>/`), ready for scripts/train_yolo.py.
+
+Subclasses come from the class names of --data if they are named `<object>-<subclass>`, otherwise from
+the JSON annotations next to the labels (written by the Reannotate tab and scripts/export_dataset.py).
+Rebuilds only process the label files changed since the last build, unless --full is given.
+
+Examples:
+    python scripts/build_crops.py -s data/retrain/detection data/retrain/auto_label -o data/classification
+    python scripts/build_crops.py -s data/roboflow --data data/roboflow/data.yaml -o data/classification --full
+"""
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.datasets import build_classification_crops  # noqa: E402
+from utils.file_tools import read_yaml_file  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--source-dirs", "-s", type=str, nargs="+", required=True)
+    parser.add_argument("--output-dir", "-o", type=str, default=str(PROJECT_DIR / "data/classification"))
+    parser.add_argument("--data", type=str, default=str(PROJECT_DIR / "data/detection/dataset.yaml"), help="YAML file with the class names")
+    parser.add_argument("--full", action="store_true", help="Process all label files, not only the changed ones")
+    parser.add_argument("--min-size", type=int, default=8, help="Skip boxes smaller than this, in pixels")
+    parser.add_argument("--workers", "-w", type=int, default=4)
+
+    args    = parser.parse_args()
+    names   = read_yaml_file(args.data)["names"]
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+
+    counts = build_classification_crops(
+        args.source_dirs,
+        args.output_dir,
+        names,
+        incremental=not args.full,
+        min_size=args.min_size,
+        n_workers=args.workers,
+    )
+    print(counts)
@@ -0,0 +1,60 @@
+"""Pre-label frames sampled from videos with the current models, and export them as a YOLO detection dataset
+with a data.yaml, ready for scripts/train_yolo.py. Exporting more videos to the same directory grows the dataset.
+
+Examples:
+    python scripts/export_dataset.py -i data/sample_video/short_30s.mp4 -o data/retrain/auto_label --stride 15
+    python scripts/export_dataset.py -i cam1.mp4 cam2.mp4 -o data/retrain/auto_label --policy motion --stride 10
+    python scripts/train_yolo.py --base-model yolo11m.pt --data data/retrain/auto_label/data.yaml -imgsz 640 -o models/detector
+"""
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.backends import BACKEND_WEIGHTS, load_models  # noqa: E402
+from kitchen.datasets import SAMPLING_POLICIES, export_yolo_dataset  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--input-videos", "-i", type=str, nargs="+", required=True)
+    parser.add_argument("--output-dir", "-o", type=str, required=True)
+    parser.add_argument("--model-dir", "-m", type=str, default=str(PROJECT_DIR / "models"))
+    parser.add_argument("--backend", type=str, default="pytorch", choices=list(BACKEND_WEIGHTS))
+    parser.add_argument("--policy", "-p", type=str, default="stride", choices=SAMPLING_POLICIES)
+    parser.add_argument("--stride", "-s", type=int, default=30, help="Sample every n frames, or minimum gap with --policy motion")
+    parser.add_argument("--n-samples", "-n", type=int, default=200, help="Number of frames per video with --policy uniform")
+    parser.add_argument("--motion-threshold", type=float, default=0.05)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--batch", "-b", type=int, default=8)
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--skip-empty", action="store_true", help="Do not export frames without detections")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Processes encoding and writing the samples")
+
+    args    = parser.parse_args()
+    models  = load_models(args.model_dir, args.backend)
+
+    for input_video in args.input_videos:
+        counts = export_yolo_dataset(
+            input_video,
+            args.output_dir,
+            **models,
+            policy=args.policy,
+            stride=args.stride,
+            n_samples=args.n_samples,
+            motion_threshold=args.motion_threshold,
+            conf=args.conf,
+            iou=args.iou,
+            imgsz=args.imgsz,
+            device=args.device,
+            batch_size=args.batch,
+            val_fraction=args.val_fraction,
+            skip_empty=args.skip_empty,
+            n_workers=args.workers,
+        )
+        print(counts)
@@ -0,0 +1,236 @@
+"""Export the trained models to ONNX / OpenVINO, optionally with INT8 post-training quantization,
+and write an accuracy and throughput parity report against the PyTorch models.
+
+Examples:
+    python scripts/export_models.py --format onnx openvino --int8
+    python scripts/export_models.py --report-only
+"""
+import shutil
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.backends import BACKEND_WEIGHTS, MODEL_TASKS, model_path  # noqa: E402
+from utils.file_tools import list_files, write_json_file  # noqa: E402
+
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+
+
+def preprocess(image_path: Path, imgsz: int, task: str) -> np.ndarray:
+    """Preprocess an image the way ultralytics does before inference, for INT8 calibration.
+    Detection: letterbox to a square image. Classification: resize the short side then center crop.
+    """
+    img = cv2.imread(str(image_path))
+    height, width = img.shape[:2]
+
+    if task == "detect":
+        scale   = imgsz / max(height, width)
+        resized = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+        canvas  = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+        top     = (imgsz - resized.shape[0]) // 2
+        left    = (imgsz - resized.shape[1]) // 2
+        canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+        img     = canvas
+    else:
+        scale   = imgsz / min(height, width)
+        resized = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+        top     = (resized.shape[0] - imgsz) // 2
+        left    = (resized.shape[1] - imgsz) // 2
+        img     = resized[top:top + imgsz, left:left + imgsz]
+
+    img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR HWC -> RGB CHW
+    return np.ascontiguousarray(img, dtype=np.float32)[None] / 255
+
+
+def quantize_onnx(float_model: Path, int8_model: Path, calibration_images: list[Path], imgsz: int, task: str):
+    """Static INT8 quantization of an ONNX model with onnxruntime, calibrated on the given images"""
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnx.load(str(float_model), load_external_data=False).graph.input[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration_images)
+
+        def get_next(self):
+            image_path = next(self.images, None)
+            return None if image_path is None else {input_name: preprocess(image_path, imgsz, task)}
+
+    quantize_static(
+        str(float_model),
+        str(int8_model),
+        ImageReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+    # Keep the ultralytics metadata (class names, image size, task) so that YOLO() can load the model
+    float_proto = onnx.load(str(float_model), load_external_data=False)
+    int8_proto  = onnx.load(str(int8_model))
+    del int8_proto.metadata_props[:]
+    int8_proto.metadata_props.extend(float_proto.metadata_props)
+    onnx.save(int8_proto, str(int8_model))
+
+
+def export_model(model_dir: Path, model_name: str, fmt: str, int8: bool, data: str, imgsz: int, n_calibration: int):
+    weights = model_path(model_dir, model_name, "pytorch")
+    task    = MODEL_TASKS[model_name]
+    model   = YOLO(weights, task=task)
+
+    # Dynamic shapes: the detector runs at the video resolution and the classifiers on batches of crops
+    if fmt == "onnx":
+        exported = Path(model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+
+        if int8:
+            calibration_images = list_files(calibration_dir(data, task), IMAGE_EXTENSIONS)
+            rng = np.random.default_rng(0)
+            calibration_images = [
+                calibration_images[i]
+                for i in sorted(rng.choice(len(calibration_images), min(n_calibration, len(calibration_images)), replace=False))
+            ]
+            quantize_onnx(exported, model_path(model_dir, model_name, "onnx_int8"), calibration_images, imgsz, task)
+
+    elif fmt == "openvino":
+        # ultralytics calibrates the INT8 model with NNCF on the `data` dataset
+        model.export(format="openvino", imgsz=imgsz, dynamic=True)
+        if int8:
+            model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=True, data=data, fraction=1.0)
+
+
+def calibration_dir(data: str, task: str) -> Path:
+    """Image directory used to calibrate a model: the detection training images or the classification folder"""
+    if task == "detect":
+        return PROJECT_DIR / "data/detection/train/images"
+    return Path(data)
+
+
+def detector_metrics(weights: Path, data: str, imgsz: int) -> dict:
+    metrics = YOLO(weights, task="detect").val(data=data, imgsz=imgsz, batch=1, plots=False, verbose=False)
+    return {"map50": float(metrics.box.map50), "map50_95": float(metrics.box.map)}
+
+
+def classifier_metrics(weights: Path, data: str, max_images: int, reference: dict | None = None) -> tuple[dict, dict]:
+    """Top-1 accuracy on the classification folders, and agreement with the reference predictions"""
+    model       = YOLO(weights, task="classify")
+    predictions = {}
+
+    for class_dir in sorted(Path(data).iterdir()):
+        if not class_dir.is_dir():
+            continue
+        for image_path in list_files(class_dir, IMAGE_EXTENSIONS)[:max_images]:
+            result = model(str(image_path), verbose=False)[0]
+            predictions[str(image_path)] = (class_dir.name, model.names[result.probs.top1])
+
+    metrics = {"top1_acc": float(np.mean([label == pred for label, pred in predictions.values()]))}
+    if reference is not None:
+        metrics["agreement_with_pytorch"] = float(np.mean([
+            pred == reference[path][1] for path, (_, pred) in predictions.items() if path in reference
+        ]))
+
+    return metrics, predictions
+
+
+def throughput(weights: Path, task: str, images: list[Path], imgsz: int, batch: int) -> dict:
+    """Mean latency per image, after a warmup call"""
+    model   = YOLO(weights, task=task)
+    frames  = [cv2.imread(str(path)) for path in images]
+    kwargs  = {"imgsz": imgsz, "verbose": False}
+
+    model(frames[:batch], **kwargs)
+
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        model(frames[i:i + batch], **kwargs)
+    elapsed = time.perf_counter() - start
+
+    return {"ms_per_image": elapsed * 1000 / len(frames), "images_per_sec": len(frames) / elapsed}
+
+
+def parity_report(model_dir: Path, args) -> dict:
+    report = {}
+
+    for model_name, task in MODEL_TASKS.items():
+        data        = args.detection_data if task == "detect" else str(PROJECT_DIR / f"data/classification/{model_name.split('_')[0]}")
+        imgsz       = args.detector_imgsz if task == "detect" else args.classifier_imgsz
+        batch       = 1 if task == "detect" else args.classifier_batch
+        images      = list_files(calibration_dir(data, task), IMAGE_EXTENSIONS)[:args.n_speed_images]
+        reference   = None
+        report[model_name] = {}
+
+        for backend in BACKEND_WEIGHTS:
+            weights = model_path(model_dir, model_name, backend)
+            if not weights.exists():
+                continue
+
+            print(f"Evaluating {model_name} ({backend})")
+            if task == "detect":
+                metrics = detector_metrics(weights, data, imgsz)
+            else:
+                metrics, predictions = classifier_metrics(weights, data, args.max_eval_images, reference)
+                if backend == "pytorch":
+                    reference = predictions
+
+            metrics.update(throughput(weights, task, images, imgsz, batch))
+            report[model_name][backend] = metrics
+
+    return report
+
+
+def print_report(report: dict):
+    for model_name, backends in report.items():
+        print(f"\n{model_name}")
+        baseline = backends.get("pytorch", {}).get("ms_per_image")
+        for backend, metrics in backends.items():
+            speedup = f"{baseline / metrics['ms_per_image']:.2f}x" if baseline else "-"
+            values  = ", ".join(f"{key}={value:.4f}" for key, value in metrics.items())
+            print(f"  {backend:<15} speedup={speedup:<7} {values}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--model-dir", "-m", type=str, default=str(PROJECT_DIR / "models"))
+    parser.add_argument("--format", "-f", nargs="+", default=["onnx", "openvino"], choices=["onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="Also export INT8 quantized models")
+    parser.add_argument("--detection-data", type=str, default=str(PROJECT_DIR / "data/detection/dataset.yaml"))
+    parser.add_argument("--detector-imgsz", type=int, default=640)
+    parser.add_argument("--classifier-imgsz", type=int, default=240)
+    parser.add_argument("--classifier-batch", type=int, default=16)
+    parser.add_argument("--n-calibration", type=int, default=300, help="Number of images used to calibrate ONNX INT8 models")
+    parser.add_argument("--n-speed-images", type=int, default=64)
+    parser.add_argument("--max-eval-images", type=int, default=200, help="Max number of images per class to evaluate classifiers")
+    parser.add_argument("--report-only", action="store_true", help="Skip the export and only write the parity report")
+    parser.add_argument("--report", "-r", type=str, default=None, help="Output JSON report, by default <model-dir>/backend_report.json")
+
+    args        = parser.parse_args()
+    MODEL_DIR   = Path(args.model_dir)
+
+    if not args.report_only:
+        for model_name, task in MODEL_TASKS.items():
+            data    = args.detection_data if task == "detect" else str(PROJECT_DIR / f"data/classification/{model_name.split('_')[0]}")
+            imgsz   = args.detector_imgsz if task == "detect" else args.classifier_imgsz
+
+            for fmt in args.format:
+                print(f"Exporting {model_name} to {fmt}{' (+ INT8)' if args.int8 else ''}")
+                export_model(MODEL_DIR, model_name, fmt, args.int8, data, imgsz, args.n_calibration)
+
+        # ultralytics writes the calibration cache of classification datasets next to the data
+        for cache_dir in (PROJECT_DIR / "data/classification").glob("*/.cache"):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    report      = parity_report(MODEL_DIR, args)
+    report_path = Path(args.report) if args.report else MODEL_DIR / "backend_report.json"
+    write_json_file(report, report_path)
+    print_report(report)
+    print(f"\nReport saved to {report_path}")
@@ -0,0 +1,41 @@
+"""Print statistics and problems of the YOLO labels of detection datasets. The labels are indexed in
+`<dataset>/.label_index/` on the first run, later runs only parse the label files changed since.
+
+Examples:
+    python scripts/label_stats.py -s data/detection
+    python scripts/label_stats.py -s data/detection data/retrain/detection --validate --min-size 0.01
+"""
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from pprint import pprint
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.label_index import LabelIndex  # noqa: E402
+from utils.file_tools import read_yaml_file  # noqa: E402
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--source-dirs", "-s", type=str, nargs="+", required=True)
+    parser.add_argument("--data", type=str, default=str(PROJECT_DIR / "data/detection/dataset.yaml"), help="YAML file with the class names")
+    parser.add_argument("--validate", action="store_true", help="Also list the problems of the labels")
+    parser.add_argument("--min-size", type=float, default=0.0, help="Report boxes with a normalized width or height up to this")
+
+    args    = parser.parse_args()
+    names   = read_yaml_file(args.data)["names"]
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+
+    for source_dir in args.source_dirs:
+        index = LabelIndex(source_dir, names=names)
+        print(f"\n{source_dir}")
+        pprint(index.stats(), sort_dicts=False)
+
+        if args.validate:
+            issues = index.validate(min_size=args.min_size)
+            for issue in issues:
+                print(f"{issue['key']}, row {issue['row']}: {issue['issue']}")
+            print(f"{len(issues)} problems")
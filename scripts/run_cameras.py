@@ -0,0 +1,68 @@
+"""Process several cameras at once in one process: their frames are batched into shared detector calls,
+while each camera keeps its own tracker and writes its own output (<output-dir>/<camera>.mp4 or .npz).
+
+Sources are given as <camera>=<source>, the source being a video file, an RTSP / HTTP URL or a device index.
+
+Examples:
+    python scripts/run_cameras.py -s pass=data/sample_video/short_30s.mp4 tray=data/sample_video/short_30s.mp4 -o data/cameras
+    python scripts/run_cameras.py -s pass=rtsp://10.0.0.2/stream dish_return=0 --camera-configs pass=counter --output-mode detections --max-frames 9000
+"""
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIR / "src"))
+
+from kitchen.backends import BACKEND_WEIGHTS, load_models  # noqa: E402
+from kitchen.camera import load_camera_config  # noqa: E402
+from kitchen.multicam import OUTPUT_MODES, process_cameras  # noqa: E402
+
+
+def parse_pairs(values: list[str]) -> dict[str, str]:
+    pairs = {}
+    for value in values:
+        name, sep, target = value.partition("=")
+        if not sep:
+            raise ValueError(f"Expected <camera>=<value>, got '{value}'")
+        pairs[name] = target
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sources", "-s", type=str, nargs="+", required=True, help="<camera>=<source> pairs")
+    parser.add_argument("--output-dir", "-o", type=str, required=True)
+    parser.add_argument("--output-mode", type=str, default="video", choices=OUTPUT_MODES)
+    parser.add_argument("--camera-configs", type=str, nargs="*", default=[], help="<camera>=<config in configs/cameras> pairs")
+    parser.add_argument("--model-dir", "-m", type=str, default=str(PROJECT_DIR / "models"))
+    parser.add_argument("--backend", type=str, default="pytorch", choices=list(BACKEND_WEIGHTS))
+    parser.add_argument("--imgsz", type=int, default=640, help="Detector input size of the cameras without one in their config")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--max-batch", "-b", type=int, default=8, help="Maximum number of frames per detector call")
+    parser.add_argument("--max-frames", type=int, default=None, help="Stop each camera after this many processed frames")
+    parser.add_argument("--realtime", action="store_true", help="Replay video files at their native fps, like live cameras")
+
+    args            = parser.parse_args()
+    sources         = parse_pairs(args.sources)
+    camera_configs  = {name: load_camera_config(config) for name, config in parse_pairs(args.camera_configs).items()}
+    models          = load_models(args.model_dir, args.backend)
+
+    summary = process_cameras(
+        sources,
+        args.output_dir,
+        **models,
+        conf=args.conf,
+        iou=args.iou,
+        device=args.device,
+        output_mode=args.output_mode,
+        camera_configs=camera_configs,
+        max_batch=args.max_batch,
+        imgsz=args.imgsz,
+        max_frames=args.max_frames,
+        realtime=args.realtime or None,
+    )
+    for name, camera in summary["cameras"].items():
+        print(f"{name}: {camera['n_frames']} frames, {camera['n_detections']} detections -> {camera['output_path']}")
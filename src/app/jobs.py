@@ -0,0 +1,150 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from kitchen.inference import ProcessingCancelled
+from utils.schemas import JobStatus, PredictionInput, PredictionOutput
+
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class Job:
+    """State of one prediction job, updated by the worker thread running it"""
+
+    def __init__(self, pred_input: PredictionInput):
+        self.job_id             = str(uuid.uuid4())
+        self.pred_input         = pred_input
+        self.status             = "queued"
+        self.frames_processed   = 0
+        self.n_frames           = 0
+        self.started_at         = None
+        self.result             = None
+        self.error              = None
+        self.cancel_event       = threading.Event()
+        self.future             = None
+
+    def update_progress(self, frames_processed: int, n_frames: int):
+        self.frames_processed   = frames_processed
+        self.n_frames           = n_frames
+
+    def to_status(self) -> JobStatus:
+        fps = 0.0
+        eta = None
+
+        if self.started_at is not None and self.frames_processed > 0:
+            fps = self.frames_processed / max(time.monotonic() - self.started_at, 1e-6)
+            if self.status == "running":
+                eta = max(self.n_frames - self.frames_processed, 0) / fps
+
+        return JobStatus(
+            job_id=self.job_id,
+            status=self.status,
+            frames_processed=self.frames_processed,
+            n_frames=self.n_frames,
+            fps=fps,
+            eta=eta,
+            result=self.result,
+            error=self.error,
+        )
+
+
+class JobManager:
+    """Run prediction jobs in a bounded pool of worker threads.
+
+    Parameters
+    ----------
+    run_fn : Callable
+        `run_fn(pred_input, progress_callback, cancel_event) -> PredictionOutput`
+    max_workers : int, optional
+        Number of jobs running at the same time, by default 1
+    max_pending : int, optional
+        Maximum number of queued and running jobs, by default 16
+    max_history : int, optional
+        Number of finished jobs kept for status queries, by default 100
+    """
+
+    def __init__(
+        self,
+        run_fn: Callable[..., PredictionOutput],
+        max_workers: int = 1,
+        max_pending: int = 16,
+        max_history: int = 100
+    ):
+        self.run_fn         = run_fn
+        self.max_pending    = max_pending
+        self.max_history    = max_history
+        self.executor       = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs           = OrderedDict()
+        self.lock           = threading.Lock()
+
+    def n_active(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status not in FINISHED_STATUSES)
+
+    def status_counts(self) -> dict[str, int]:
+        """Number of queued and running jobs"""
+        counts = {"queued": 0, "running": 0}
+        for job in list(self.jobs.values()):
+            if job.status in counts:
+                counts[job.status] += 1
+        return counts
+
+    def submit(self, pred_input: PredictionInput) -> Job | None:
+        """Queue a job. Return None if too many jobs are already pending"""
+        with self.lock:
+            if self.n_active() >= self.max_pending:
+                return None
+
+            job = Job(pred_input)
+            self.jobs[job.job_id] = job
+            self._trim_history()
+
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+
+        return job
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel_event.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            return
+
+        job.status      = "running"
+        job.started_at  = time.monotonic()
+
+        try:
+            job.result = self.run_fn(job.pred_input, job.update_progress, job.cancel_event)
+            job.status = "done"
+        except ProcessingCancelled:
+            job.status = "cancelled"
+            Path(job.pred_input.out_video_path).unlink(missing_ok=True)
+        except Exception as e:
+            print(e)
+            job.status  = "failed"
+            job.error   = str(e)
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:max(len(finished) - self.max_history, 0)]:
+            del self.jobs[job_id]
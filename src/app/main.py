@@ -1,30 +1,81 @@
+import os
+import threading
+import time
 import uvicorn
-from fastapi import FastAPI
-from ultralytics import YOLO
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import ValidationError
 from pathlib import Path
 
-from kitchen.inference import process_video
-from utils.schemas import PredictionInput, PredictionOutput
+from app.jobs import FINISHED_STATUSES, JobManager
+from app.metrics import KitchenMetrics
+from app.result_cache import ResultCache
+from kitchen.backends import MODEL_TASKS, ModelRegistry, model_path
+from kitchen.camera import list_camera_configs, load_camera_config
+from kitchen.datasets import export_yolo_dataset
+from kitchen.inference import ProcessingCancelled, render_detections
+from kitchen.sharding import process_video_sharded
+from kitchen.workers import WORKER_FUNCTIONS, ModelWorkerPool
+from utils.schemas import ExportInput, ExportOutput, JobStatus, PredictionInput, PredictionOutput, RenderInput
 
 
 # Init model
 PROJECT_DIR     = Path(__file__).parent.parent.parent 
 CACHE_DIR       = PROJECT_DIR / "cache"
-detector        = YOLO(PROJECT_DIR / "models/detector/best.pt")
-dish_classifier = YOLO(PROJECT_DIR / "models/dish_classifier/best.pt")
-tray_classifier = YOLO(PROJECT_DIR / "models/tray_classifier/best.pt")
+MODELS_DIR      = PROJECT_DIR / "models"
 
-# DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-# TODO: Clear cache when starting up
+# With KITCHEN_MODEL_WORKERS > 0, each video is processed in a worker process holding its own models
+# and tracker. Otherwise the models are loaded here and shared by all requests.
+MODEL_WORKERS   = int(os.environ.get("KITCHEN_MODEL_WORKERS", 0))
+TORCH_THREADS   = int(os.environ.get("KITCHEN_TORCH_THREADS", 1))
 
-if CACHE_DIR.exists():
-    for file in CACHE_DIR.glob("*"):
-        file.unlink()
+# Disk budget of the cache directory (outputs and cached results). 0 disables the result cache.
+CACHE_MB        = int(os.environ.get("KITCHEN_CACHE_MB", 2048))
+
+# Run the models once on a dummy frame after loading them, so that the first request is not slower
+WARMUP          = os.environ.get("KITCHEN_WARMUP", "1") != "0"
+
+metrics = KitchenMetrics()
+
+# Nothing is loaded when this module is imported: the models are loaded in the background
+# when the server starts, see `lifespan` and `/ready`
+if MODEL_WORKERS > 0:
+    worker_pool     = ModelWorkerPool(
+        MODELS_DIR, MODEL_WORKERS, TORCH_THREADS, on_load=metrics.record_model_load, warmup=WARMUP
+    )
+    model_registry  = None
 else:
-    CACHE_DIR.mkdir(parents=True)
+    # Models of other backends than PyTorch are loaded on their first request
+    worker_pool     = None
+    model_registry  = ModelRegistry(MODELS_DIR, on_load=metrics.record_model_load, warmup=WARMUP)
+
+# The /export/ endpoint has its own models, loaded on the first export, so that it never shares
+# predictor state with a running job. Exports run one at a time.
+export_registry = ModelRegistry(MODELS_DIR)
+export_lock     = threading.Lock()
+
+# Outputs are kept across restarts, and evicted when the cache is over budget
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+result_cache = ResultCache(CACHE_DIR, CACHE_MB * 2**20) if CACHE_MB > 0 else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the models with the server rather than on the first request, without blocking the startup
+    if worker_pool is not None:
+        worker_pool.start()
+    else:
+        model_registry.load_in_background("pytorch")
+    if result_cache is not None:
+        result_cache.evict()
+    yield
+    job_manager.shutdown()
+    if worker_pool is not None:
+        worker_pool.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -32,26 +83,262 @@ def read_root():
     return {"app_name": "Kitchen Monitoring"}
 
 
+@app.get("/ready")
+def ready():
+    """200 once the PyTorch models are loaded and warmed up (in all workers with KITCHEN_MODEL_WORKERS), 503 before"""
+    if worker_pool is not None:
+        n_ready     = worker_pool.n_ready()
+        is_ready    = n_ready == worker_pool.n_workers
+        content     = {"ready": is_ready, "workers_ready": n_ready, "workers": worker_pool.n_workers}
+    else:
+        is_ready    = model_registry.is_ready("pytorch")
+        content     = {"ready": is_ready, "load_times": model_registry.load_times.get("pytorch")}
+        if "pytorch" in model_registry.errors:
+            content["error"] = model_registry.errors["pytorch"]
+
+    return JSONResponse(content, status_code=200 if is_ready else 503)
+
+
+@app.get("/backends")
+def list_backends():
+    """Inference backends whose weights are available for all models"""
+    return {"backends": ModelRegistry(MODELS_DIR).available_backends()}
+
+
+@app.get("/cameras")
+def list_cameras():
+    """Camera configs available in configs/cameras"""
+    return {"cameras": list_camera_configs()}
+
+
+@app.get("/cache")
+def get_cache_stats():
+    """Hit / miss statistics and disk usage of the result cache"""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics: stage latencies, throughput, classifier calls, model load times, jobs and result cache"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def run_prediction(pred_input: PredictionInput, progress_callback=None, cancel_event=None) -> PredictionOutput:
+    """Process the video, and record the processing metrics of the result"""
+    try:
+        result = cached_prediction(pred_input, progress_callback, cancel_event)
+    except ProcessingCancelled:
+        metrics.predictions.inc(status="cancelled")
+        raise
+    except Exception:
+        metrics.predictions.inc(status="failed")
+        raise
+
+    if result.stats.get("result_cache") == "hit":
+        metrics.predictions.inc(status="cached")
+    else:
+        metrics.predictions.inc(status="done")
+        metrics.record_result(result.stats)
+    return result
+
+
+def cached_prediction(pred_input: PredictionInput, progress_callback=None, cancel_event=None) -> PredictionOutput:
+    """Return the cached result of an identical earlier request if there is one, otherwise process the video.
+    Traced requests are always processed, since the trace profiles the processing.
+    """
+    if result_cache is None or pred_input.trace:
+        return process_prediction(pred_input, progress_callback, cancel_event)
+
+    camera_config   = load_camera_config(pred_input.camera)
+    model_paths     = [model_path(MODELS_DIR, model_name, pred_input.backend) for model_name in MODEL_TASKS]
+    key             = result_cache.key(pred_input, model_paths, extra={"camera": camera_config.model_dump()})
+
+    result = result_cache.get(key, pred_input)
+    if result is not None:
+        print(f"Result cache hit: {key}")
+        return result
+
+    result = process_prediction(pred_input, progress_callback, cancel_event)
+    result_cache.put(key, result)
+    return result
+
+
+def process_prediction(pred_input: PredictionInput, progress_callback=None, cancel_event=None) -> PredictionOutput:
+    task = dict(
+        input_video=pred_input.in_video_path,
+        conf=pred_input.conf,
+        iou=pred_input.iou,
+        device=pred_input.device,
+        reclassify_interval=pred_input.reclassify_interval,
+        reclassify_iou=pred_input.reclassify_iou,
+        reclassify_conf=pred_input.reclassify_conf,
+        detect_stride=pred_input.detect_stride,
+        adaptive_stride=pred_input.adaptive_stride,
+        motion_threshold=pred_input.motion_threshold,
+        motion_regions=pred_input.motion_regions,
+        camera_config=load_camera_config(pred_input.camera),
+        backend=pred_input.backend,
+    )
+
+    # Analytics mode saves the detections next to the requested output path instead of rendering a video
+    if pred_input.output_mode == "detections":
+        function = "analyze_video"
+        task["output_detections"] = str(Path(pred_input.out_video_path).with_suffix(".npz"))
+    else:
+        function = "process_video"
+        task.update(
+            output_video=pred_input.out_video_path,
+            pipeline=pred_input.pipeline,
+            queue_size=pred_input.queue_size,
+            encoder_preset=pred_input.encoder_preset,
+            encoder_crf=pred_input.encoder_crf,
+        )
+        if pred_input.save_detections:
+            task["output_detections"] = str(Path(pred_input.out_video_path).with_suffix(".npz"))
+        if pred_input.trace and pred_input.n_shards <= 1:
+            task["trace_path"] = str(Path(pred_input.out_video_path).with_suffix(".trace.json"))
+
+    if pred_input.n_shards > 1:
+        if worker_pool is not None:
+            return process_video_sharded(
+                output_video=pred_input.out_video_path,
+                worker_pool=worker_pool,
+                n_shards=pred_input.n_shards,
+                overlap=pred_input.shard_overlap,
+                output_mode=pred_input.output_mode,
+                progress_callback=progress_callback,
+                cancel_event=cancel_event,
+                **{key: value for key, value in task.items() if key != "output_video"}
+            )
+        print("Sharded processing requires KITCHEN_MODEL_WORKERS > 0, processing the video in one piece")
+
+    if worker_pool is not None:
+        return worker_pool.run(task, progress_callback=progress_callback, cancel_event=cancel_event, function=function)
+
+    models = model_registry.get(task.pop("backend"))
+    return WORKER_FUNCTIONS[function](
+        **models,
+        progress_callback=progress_callback,
+        cancel_event=cancel_event,
+        **task
+    )
+
+
+# In-process jobs share the models above, so by default only one runs at a time and the others wait in queue.
+# With a worker pool, one job runs per worker process.
+job_manager = JobManager(
+    run_prediction,
+    max_workers=int(os.environ.get("KITCHEN_MAX_JOBS", max(MODEL_WORKERS, 1))),
+    max_pending=int(os.environ.get("KITCHEN_MAX_PENDING_JOBS", 16))
+)
+
+metrics.registry.gauge(
+    "kitchen_active_jobs", "Queued and running jobs", ("status",),
+    callback=lambda: {(status,): count for status, count in job_manager.status_counts().items()}
+)
+if worker_pool is not None:
+    metrics.registry.gauge(
+        "kitchen_free_model_workers", "Model worker processes waiting for a task",
+        callback=lambda: {(): worker_pool.n_free()}
+    )
+if result_cache is not None:
+    metrics.registry.gauge(
+        "kitchen_result_cache", "Result cache hits, misses, evictions and size",
+        ("stat",),
+        callback=lambda: {
+            (stat,): value for stat, value in result_cache.stats().items()
+            if stat in ("hits", "misses", "evictions", "n_results", "size_mb")
+        }
+    )
+
+
 @app.post("/predict/", response_model=PredictionOutput)
 def predict(content: dict):
     try:
         pred_input = PredictionInput(**content)
-        result = process_video(
-            pred_input.in_video_path,
-            pred_input.out_video_path,
-            detector, 
-            dish_classifier, 
-            tray_classifier,
-            pred_input.conf,
-            pred_input.iou,
-            pred_input.device
-        )
+        result = run_prediction(pred_input)
         return result
     except ValidationError as e:
         print(e)
         return PredictionOutput(output_video="")
 
 
+@app.post("/render/", response_model=PredictionOutput)
+def render(render_input: RenderInput):
+    """Render the annotated video from detections saved in analytics mode"""
+    if not Path(render_input.detections_path).is_file():
+        raise HTTPException(status_code=404, detail=f"Detections not found: {render_input.detections_path}")
+
+    return render_detections(
+        render_input.in_video_path,
+        render_input.detections_path,
+        render_input.out_video_path,
+        encoder_preset=render_input.encoder_preset,
+        encoder_crf=render_input.encoder_crf
+    )
+
+
+@app.post("/export/", response_model=ExportOutput)
+def export_dataset(export_input: ExportInput):
+    """Pre-label sampled frames of a video with the current models and add them to a YOLO dataset"""
+    if not Path(export_input.in_video_path).is_file():
+        raise HTTPException(status_code=404, detail=f"Video not found: {export_input.in_video_path}")
+
+    options = export_input.model_dump(exclude={"in_video_path", "output_dir", "backend"})
+    with export_lock:
+        counts = export_yolo_dataset(
+            export_input.in_video_path,
+            export_input.output_dir,
+            **export_registry.get(export_input.backend),
+            **options
+        )
+    return ExportOutput(**counts)
+
+
+@app.post("/jobs/", response_model=JobStatus)
+def submit_job(pred_input: PredictionInput):
+    job = job_manager.submit(pred_input)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many pending jobs")
+    return job.to_status()
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_status()
+
+
+@app.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str, interval: float = 0.5):
+    """Stream the job status as server-sent events until the job is finished"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    def event_stream():
+        while True:
+            status = job.to_status()
+            yield f"data: {status.model_dump_json()}\n\n"
+            if status.status in FINISHED_STATUSES:
+                break
+            time.sleep(interval)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.delete("/jobs/{job_id}", response_model=JobStatus)
+def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_status()
+
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000)
 
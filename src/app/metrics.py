@@ -0,0 +1,227 @@
+import threading
+from bisect import bisect_left
+from typing import Callable
+
+from kitchen.profiling import LATENCY_BUCKETS
+
+
+def format_labels(labels: dict) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of the metrics exposed in the Prometheus text format, with one series per label set"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name           = name
+        self.documentation  = documentation
+        self.label_names    = tuple(label_names)
+        self.series         = {}
+        self.lock           = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """(name, labels, value) of each sample"""
+        with self.lock:
+            return [(self.name, dict(zip(self.label_names, key)), value) for key, value in self.series.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        if value < 0:
+            raise ValueError("A counter can only increase")
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """Gauge set explicitly, or read from `callback() -> {label values: value}` on each scrape"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        callback: Callable[[], dict[tuple, float]] | None = None
+    ):
+        super().__init__(name, documentation, label_names)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = value
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        if self.callback is None:
+            return super().samples()
+        return [
+            (self.name, dict(zip(self.label_names, key)), value)
+            for key, value in self.callback().items()
+        ]
+
+
+class Histogram(Metric):
+    """Histogram with fixed bucket upper bounds. Observations can be added one by one,
+    or merged as per-bucket counts, e.g. from the summary of a `StageTimer`.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def _series(self, key: tuple) -> dict:
+        if key not in self.series:
+            self.series[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        return self.series[key]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self._series(key)
+            series["buckets"][bisect_left(self.buckets, value)] += 1
+            series["sum"]   += value
+            series["count"] += 1
+
+    def merge(self, bucket_counts: list[int], total: float, **labels):
+        """Add per-bucket (non-cumulative) counts, the last one being over the largest bound"""
+        if len(bucket_counts) != len(self.buckets) + 1:
+            raise ValueError(f"Expected {len(self.buckets) + 1} bucket counts, got {len(bucket_counts)}")
+        key = self._key(labels)
+        with self.lock:
+            series = self._series(key)
+            series["buckets"] = [a + b for a, b in zip(series["buckets"], bucket_counts)]
+            series["sum"]   += total
+            series["count"] += sum(bucket_counts)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        samples = []
+        with self.lock:
+            for key, series in self.series.items():
+                labels      = dict(zip(self.label_names, key))
+                cumulative  = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["buckets"]):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", {**labels, "le": format_value(bound)}, cumulative))
+                samples.append((f"{self.name}_sum", labels, series["sum"]))
+                samples.append((f"{self.name}_count", labels, series["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for the /metrics endpoint"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: tuple[str, ...] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name: str, documentation: str, label_names: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+class KitchenMetrics:
+    """Metrics of the prediction service.
+
+    Processing metrics are merged from the stats of each finished prediction (`record_result`),
+    so videos processed in worker processes are counted as well. Stages and counters come from
+    the `StageTimer` of `process_video` / `analyze_video`, see `stats["stages"]` and `stats["counters"]`.
+    """
+
+    def __init__(self, registry: MetricsRegistry | None = None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        registry      = self.registry
+
+        self.stage_seconds          = registry.histogram(
+            "kitchen_stage_duration_seconds", "Duration of each processing stage, per frame", ("stage",)
+        )
+        self.frames                 = registry.counter("kitchen_frames_processed_total", "Processed video frames")
+        self.detections             = registry.counter("kitchen_detections_total", "Tracked objects over all frames")
+        self.classifier_calls       = registry.counter("kitchen_classifier_calls_total", "Classifier forward passes")
+        self.classified_crops       = registry.counter("kitchen_classified_crops_total", "Crops sent to the classifiers")
+        self.processing_seconds     = registry.counter("kitchen_processing_seconds_total", "Wall time spent processing videos")
+        self.predictions            = registry.counter(
+            "kitchen_predictions_total", "Finished predictions, by outcome", ("status",)
+        )
+        self.frames_per_second      = registry.gauge("kitchen_frames_per_second", "Frames per second of the last prediction")
+        self.detections_per_second  = registry.gauge(
+            "kitchen_detections_per_second", "Detections per second of the last prediction"
+        )
+        self.classifier_calls_per_frame = registry.gauge(
+            "kitchen_classifier_calls_per_frame", "Classifier forward passes per frame of the last prediction"
+        )
+        self.model_load_seconds     = registry.gauge(
+            "kitchen_model_load_seconds", "Time to load each model (and warm them up), by backend", ("backend", "model")
+        )
+
+    def record_model_load(self, backend: str, load_times: dict[str, float]):
+        for model_name, secs in load_times.items():
+            self.model_load_seconds.set(secs, backend=backend, model=model_name)
+
+    def record_result(self, stats: dict):
+        """Merge the stage timings and counters of a processed video"""
+        for stage, timing in stats.get("stages", {}).items():
+            if "buckets" in timing:
+                self.stage_seconds.merge(timing["buckets"], timing["total_s"], stage=stage)
+
+        counters    = stats.get("counters", {})
+        n_frames    = counters.get("frames", 0)
+        elapsed     = stats.get("elapsed_s", 0.0)
+
+        self.frames.inc(n_frames)
+        self.detections.inc(counters.get("detections", 0))
+        self.classifier_calls.inc(counters.get("classifier_calls", 0))
+        self.classified_crops.inc(counters.get("classified_crops", 0))
+        self.processing_seconds.inc(elapsed)
+
+        if n_frames > 0 and elapsed > 0:
+            self.frames_per_second.set(n_frames / elapsed)
+            self.detections_per_second.set(counters.get("detections", 0) / elapsed)
+            self.classifier_calls_per_frame.set(counters.get("classifier_calls", 0) / n_frames)
+
+    def render(self) -> str:
+        return self.registry.render()
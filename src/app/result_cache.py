@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from utils.schemas import PredictionInput, PredictionOutput
+
+
+# Bump when a code change alters the outputs, so that older cached results are not reused
+CACHE_VERSION = 1
+
+# Options that change how fast a video is processed, but not the result
+NON_RESULT_FIELDS = {"in_video_path", "out_video_path", "pipeline", "queue_size"}
+
+
+def file_digest(path: Path | str, chunk_size: int = 2**20) -> str:
+    """SHA-256 of a file's content, or of all files of a directory (e.g. an OpenVINO model)"""
+    path    = Path(path)
+    digest  = hashlib.sha256()
+    files   = sorted(file for file in path.rglob("*") if file.is_file()) if path.is_dir() else [path]
+
+    for file in files:
+        digest.update(str(file.relative_to(path)).encode() if path.is_dir() else b"")
+        with open(file, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of prediction results, stored in `cache_dir/results/<key>/`.
+
+    The key hashes the content of the input video, the content of the model weights, and the request
+    options that affect the result. A cached result is linked (or copied) to the requested output paths,
+    so a repeated request returns immediately.
+
+    The whole `cache_dir`, including the outputs written outside of `results/`, is kept under
+    `max_bytes` by evicting the least recently used results and files. Files modified in the last
+    `min_age` secs are never evicted, since they may belong to a running job.
+    """
+
+    def __init__(self, cache_dir: Path | str, max_bytes: int, min_age: float = 60):
+        self.cache_dir      = Path(cache_dir)
+        self.results_dir    = self.cache_dir / "results"
+        self.max_bytes      = max_bytes
+        self.min_age        = min_age
+        self.lock           = threading.Lock()
+        self.digests        = {}
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+
+    def digest(self, path: Path | str) -> str:
+        """`file_digest`, memoized until the file changes"""
+        stat    = os.stat(path)
+        memo    = (str(path), stat.st_size, stat.st_mtime_ns)
+        if memo not in self.digests:
+            self.digests[memo] = file_digest(path)
+        return self.digests[memo]
+
+    def key(self, pred_input: PredictionInput, model_paths: list[Path], extra: dict | None = None) -> str:
+        options = pred_input.model_dump(exclude=NON_RESULT_FIELDS)
+        content = {
+            "version": CACHE_VERSION,
+            "input_video": self.digest(pred_input.in_video_path),
+            "models": [self.digest(path) for path in model_paths],
+            "options": options,
+            "extra": extra or {},
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str, pred_input: PredictionInput) -> PredictionOutput | None:
+        """The cached result, linked to the output paths of `pred_input`, or None on a miss"""
+        entry_dir   = self.results_dir / key
+        meta_path   = entry_dir / "result.json"
+
+        with self.lock:
+            if not meta_path.exists():
+                self.misses += 1
+                return None
+
+            meta    = json.loads(meta_path.read_text())
+            result  = PredictionOutput(output_video="", stats={**meta["stats"], "result_cache": "hit"})
+
+            for field, file_name in meta["files"].items():
+                destination = output_path(pred_input, field)
+                link_file(entry_dir / file_name, destination)
+                setattr(result, field, str(destination))
+
+            # Mark as recently used
+            os.utime(meta_path)
+            self.hits += 1
+
+        return result
+
+    def put(self, key: str, result: PredictionOutput):
+        """Store the output files of a result, then evict old results if the cache is over budget"""
+        entry_dir   = self.results_dir / key
+        temp_dir    = self.results_dir / f".{key}.{threading.get_ident()}"
+        files       = {}
+
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        for field in ("output_video", "detections_path", "detections_ndjson_path"):
+            path = getattr(result, field)
+            if path:
+                files[field] = f"{field}{Path(path).suffix}"
+                link_file(path, temp_dir / files[field])
+
+        meta = {"files": files, "stats": result.stats, "created_at": time.time()}
+        (temp_dir / "result.json").write_text(json.dumps(meta, default=str))
+
+        with self.lock:
+            if entry_dir.exists():
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            else:
+                temp_dir.rename(entry_dir)
+
+        self.evict()
+
+    def _items(self) -> list[tuple[float, Path, list[os.stat_result]]]:
+        """Evictable items of the cache dir: result directories and other files, with their last use time"""
+        items = []
+
+        for path in self.cache_dir.iterdir():
+            if path == self.results_dir:
+                continue
+            if path.is_dir():
+                files = [file for file in path.rglob("*") if file.is_file()]
+                stats = [file.stat() for file in files]
+                items.append((max([stat.st_mtime for stat in stats], default=path.stat().st_mtime), path, stats))
+            elif path.is_file():
+                stat = path.stat()
+                items.append((stat.st_mtime, path, [stat]))
+
+        for entry_dir in self.results_dir.iterdir():
+            meta_path = entry_dir / "result.json"
+            # Skip the results being stored
+            if entry_dir.name.startswith(".") or not meta_path.exists():
+                continue
+            stats = [file.stat() for file in entry_dir.iterdir() if file.is_file()]
+            items.append((meta_path.stat().st_mtime, entry_dir, stats))
+
+        return sorted(items, key=lambda item: item[0])
+
+    def evict(self) -> int:
+        """Delete the least recently used items until the cache dir fits in `max_bytes`.
+        Hard-linked files are counted once. Returns the number of evicted items.
+        """
+        with self.lock:
+            items       = self._items()
+            links       = {}
+            sizes       = {}
+            for _, _, stats in items:
+                for stat in stats:
+                    links[stat.st_ino] = links.get(stat.st_ino, 0) + 1
+                    sizes[stat.st_ino] = stat.st_size
+
+            total       = sum(sizes.values())
+            n_evicted   = 0
+            now         = time.time()
+
+            for last_used, path, stats in items:
+                if total <= self.max_bytes:
+                    break
+                if now - last_used < self.min_age:
+                    continue
+
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+
+                for stat in stats:
+                    links[stat.st_ino] -= 1
+                    if links[stat.st_ino] == 0:
+                        total -= sizes[stat.st_ino]
+                n_evicted += 1
+
+            self.evictions += n_evicted
+
+        if n_evicted > 0:
+            print(f"Result cache: evicted {n_evicted} items, {total / 2**20:.0f} MB left")
+        return n_evicted
+
+    def stats(self) -> dict:
+        with self.lock:
+            total   = self.hits + self.misses
+            entries = [
+                path for path in self.results_dir.iterdir()
+                if not path.name.startswith(".") and (path / "result.json").exists()
+            ]
+            inodes  = {
+                file.stat().st_ino: file.stat().st_size
+                for file in self.cache_dir.rglob("*") if file.is_file()
+            }
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0.0,
+                "evictions": self.evictions,
+                "n_results": len(entries),
+                "size_mb": sum(inodes.values()) / 2**20,
+                "max_size_mb": self.max_bytes / 2**20,
+            }
+
+
+def output_path(pred_input: PredictionInput, field: str) -> Path:
+    """Where a request expects each output file, see `run_prediction`"""
+    out_video_path = Path(pred_input.out_video_path)
+    if field == "detections_path":
+        return out_video_path.with_suffix(".npz")
+    if field == "detections_ndjson_path":
+        return out_video_path.with_suffix(".ndjson")
+    return out_video_path
+
+
+def link_file(source: Path | str, destination: Path | str):
+    """Hard-link a file, or copy it if the destination is on another file system"""
+    source, destination = Path(source), Path(destination)
+    if source.resolve() == destination.resolve():
+        return
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
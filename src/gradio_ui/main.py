@@ -1,5 +1,4 @@
 import os
-import torch
 import gradio as gr
 import uvicorn
 import webbrowser
@@ -14,17 +13,18 @@ from gradio_ui.tabs.inference import in_video as infr_in_video
 from gradio_ui.tabs.inference import out_video as infr_out_video
 from gradio_ui.tabs.inference import video_stats as infr_video_stats
 from gradio_ui.tabs.inference import result_collection as infr_result_collection
+from gradio_ui.tabs.inference import detections_path as infr_detections_path
 
 from gradio_ui.tabs.reannotate import reannotate_block
 from gradio_ui.tabs.reannotate import video_stats as reann_video_stats
 from gradio_ui.tabs.reannotate import in_video as reann_in_video
 from gradio_ui.tabs.reannotate import out_video as reann_out_video
+from gradio_ui.tabs.reannotate import detections_path as reann_detections_path
 
 APP_URL             = "http://0.0.0.0:8000"
 PROJECT_DIR         = Path(__file__).parent.parent.parent
 GRADIO_CACHE_DIR    = ".gradio_cache"
 GRADIO_CUSTOM_PATH  = "/gradio"
-DEVICE              = "cuda" if torch.cuda.is_available() else "cpu"
 DATA_DIR            = PROJECT_DIR / "data/"
 GRADIO_URL          = urljoin("http://0.0.0.0:8000/", GRADIO_CUSTOM_PATH)
 
@@ -104,6 +104,12 @@ with gr.Blocks(
         outputs=[reann_video_stats]
     )
 
+    infr_detections_path.change(
+        sync_gradio_object_state,
+        inputs=[infr_detections_path, reann_detections_path],
+        outputs=[reann_detections_path]
+    )
+
 # Mount the Gradio demo on top of base app
 app = gr.mount_gradio_app(app, demo, path=GRADIO_CUSTOM_PATH)
 
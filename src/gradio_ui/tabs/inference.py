@@ -1,12 +1,12 @@
 import os
 import uuid
-import torch
 import requests
+from functools import cache
 import gradio as gr
 from pathlib import Path
 
 from kitchen.inference import get_video_stats, get_video_frame
-from utils.schemas import PredictionInput
+from utils.schemas import JobStatus, PredictionInput
 
 
 APP_URL             = "http://0.0.0.0:8000"
@@ -14,12 +14,18 @@ PROJECT_DIR         = Path(__file__).parent.parent.parent.parent
 
 GRADIO_CACHE_DIR    = ".gradio_cache"
 GRADIO_CUSTOM_PATH  = "/gradio"
-DEVICE              = "cuda" if torch.cuda.is_available() else "cpu"
 DATA_DIR            = PROJECT_DIR / "data/"
 
 os.environ["GRADIO_CACHE_DIR"]  = GRADIO_CACHE_DIR
 
 
+@cache
+def get_device() -> str:
+    # Imported on first use, since importing torch takes seconds
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
 def set_video_stats(video_path):
     stats = get_video_stats(video_path)
     stats["in_video_path"] = video_path
@@ -38,22 +44,40 @@ def detect_objects(in_video, conf, iou, result_collection: list):
         out_video_path=temp_out_video,
         conf=conf,
         iou=iou,
-        device=DEVICE
+        device=get_device(),
+        save_detections=True
     )
 
-    progress(0.0, desc="Inferencing...")
+    progress(0.0, desc="Submitting...")
     response = requests.post(
-        APP_URL + "/predict", 
+        APP_URL + "/jobs/", 
         json=pred_input.model_dump(), 
     )
-    progress(1, "Done")
 
-    if response.status_code == 200:
-        output_video = response.json()["output_video"]
-        return result_collection + [output_video]
-    else:
+    if response.status_code != 200:
         raise gr.Error(f"API Error: {response.status_code}")
 
+    # Follow the job progress until it is finished
+    job = JobStatus(**response.json())
+    with requests.get(APP_URL + f"/jobs/{job.job_id}/events", stream=True) as events:
+        for line in events.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+
+            job = JobStatus.model_validate_json(line[len("data: "):])
+            if job.n_frames > 0:
+                eta = f", ETA {job.eta:.0f}s" if job.eta is not None else ""
+                progress(
+                    job.frames_processed / job.n_frames, 
+                    desc=f"Inferencing... {job.fps:.1f} fps{eta}"
+                )
+
+    if job.status == "done":
+        progress(1, "Done")
+        return result_collection + [job.result.output_video], job.result.detections_path
+    else:
+        raise gr.Error(f"Job {job.status}: {job.error}")
+
 
 def activate():
     return gr.update(interactive=True)
@@ -78,6 +102,7 @@ with gr.Blocks() as inference_block:
     gr.Markdown("Upload a video to start")
     result_collection = gr.State([])
     video_stats = gr.State({})
+    detections_path = gr.State()
     
     with gr.Row():
         in_video = gr.Video(label="Upload video", sources="upload")
@@ -104,7 +129,7 @@ with gr.Blocks() as inference_block:
     submit_btn.click(deactivate, None, [submit_btn]).then(
         detect_objects,
         inputs=[in_video, conf, iou, result_collection],
-        outputs=[result_collection],
+        outputs=[result_collection, detections_path],
         show_progress="full",
         show_progress_on=[out_video]
     ).then(activate, None, [submit_btn])
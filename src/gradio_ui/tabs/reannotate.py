@@ -5,7 +5,9 @@ from pathlib import Path
 from PIL import Image
 from gradio_image_annotation import image_annotator
 
-from kitchen.inference import get_video_frame
+from kitchen.detections import load_detection_store
+from kitchen.frames import FRAME_SERVER
+from kitchen.inference import draw_stored_detections, get_video_frame
 from kitchen.visual_tasks import bbox_xyxy_to_yolo_format
 from utils.file_tools import write_json_file, write_list_to_text_file
 
@@ -18,13 +20,42 @@ def display_first_frame(video_path: str):
     return get_video_frame(video_path, 1)
 
 
+def show_frame(in_video: str, out_video: str, detections_path: str | None, frame_idx: float):
+    """Display a frame (counting from 1) and pre-fill the annotator with the model's boxes.
+
+    With stored detections, the annotated frame is drawn on the original frame, so only the input video
+    is decoded. Otherwise, the annotated frame is decoded from the output video.
+    """
+    frame_idx   = int(frame_idx) - 1
+    ori_frame   = FRAME_SERVER.get_frame(in_video, frame_idx)
+
+    if detections_path is None or not Path(detections_path).exists():
+        out_frame = np.asarray(get_video_frame(out_video, frame_idx + 1))
+        return out_frame, ori_frame, get_annotator(ori_frame)
+
+    store       = load_detection_store(detections_path)
+    out_frame   = draw_stored_detections(ori_frame, store, frame_idx)
+    boxes       = [
+        {
+            "xmin": int(round(det["bbox"][0])),
+            "ymin": int(round(det["bbox"][1])),
+            "xmax": int(round(det["bbox"][2])),
+            "ymax": int(round(det["bbox"][3])),
+            "label": f"{det['name']}-{det['subclass']}" if det["subclass"] else det["name"],
+        }
+        for det in store[frame_idx]
+    ]
+
+    return out_frame, ori_frame, get_annotator(ori_frame, boxes)
+
+
 def get_bbox(annotations):
     return annotations["boxes"]
 
 
-def get_annotator(ori_frame_disp):
+def get_annotator(ori_frame_disp, boxes: list[dict] | None = None):
     annotator = image_annotator(
-        value={"image": ori_frame_disp},
+        value={"image": ori_frame_disp, "boxes": boxes or []},
         show_remove_button=True,
         show_clear_button=True
     )
@@ -73,6 +104,7 @@ with gr.Blocks() as reannotate_block:
     gr.Markdown("Drag the slider to select a frame you want to reannotate, then draw bounding box and add labels in the lower image.")
 
     video_stats = gr.State()
+    detections_path = gr.State()
     in_video = gr.Video(visible=False)
     out_video = gr.Video(visible=False)
     out_frame_disp = gr.Image(label="Annotated frame", interactive=False)
@@ -82,9 +114,11 @@ with gr.Blocks() as reannotate_block:
     @gr.render(inputs=[video_stats], triggers=[video_stats.change])
     def frame_slider(video_stats):
         frame_idx = gr.Slider(label="Frame", minimum=1, maximum=video_stats["n_frames"], step=1)  
-        frame_idx.change(get_video_frame, inputs=[out_video, frame_idx], outputs=[out_frame_disp])
-        frame_idx.change(get_video_frame, inputs=[in_video, frame_idx], outputs=[ori_frame_disp])
-        frame_idx.change(get_annotator, [ori_frame_disp], [annotator])
+        frame_idx.change(
+            show_frame,
+            inputs=[in_video, out_video, detections_path, frame_idx],
+            outputs=[out_frame_disp, ori_frame_disp, annotator]
+        )
 
     # Render an annotator with a blank placeholder image
     annotator = image_annotator(
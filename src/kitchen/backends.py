@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+# ultralytics imports torch, which takes seconds: it is only imported when models are loaded
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+
+# Weights file (or directory) of each inference backend, inside each model directory.
+# Exported versions are produced by scripts/export_models.py
+BACKEND_WEIGHTS = {
+    "pytorch": "best.pt",
+    "onnx": "best.onnx",
+    "onnx_int8": "best_int8.onnx",
+    "openvino": "best_openvino_model",
+    "openvino_int8": "best_int8_openvino_model",
+}
+
+MODEL_TASKS = {
+    "detector": "detect",
+    "dish_classifier": "classify",
+    "tray_classifier": "classify",
+}
+
+
+def model_path(models_dir: Path | str, model_name: str, backend: str = "pytorch") -> Path:
+    """Path of the weights of a model for a backend, e.g. models/detector/best.onnx"""
+    if backend not in BACKEND_WEIGHTS:
+        raise ValueError(f"Unknown backend '{backend}', must be one of {list(BACKEND_WEIGHTS)}")
+    return Path(models_dir) / model_name / BACKEND_WEIGHTS[backend]
+
+
+def load_models(models_dir: Path | str, backend: str = "pytorch", load_times: dict | None = None) -> dict[str, YOLO]:
+    """Load the detector and the two classifiers for a backend.
+    If `load_times` is given, the load time in secs of each model is stored in it.
+
+    Returns
+    -------
+    dict[str, YOLO]
+        With keys: detector, dish_classifier, tray_classifier
+    """
+    from ultralytics import YOLO
+
+    models = {}
+    for model_name, task in MODEL_TASKS.items():
+        path = model_path(models_dir, model_name, backend)
+        if not path.exists():
+            raise FileNotFoundError(f"{model_name} weights for backend '{backend}' not found: {path}")
+        start               = time.perf_counter()
+        models[model_name]  = YOLO(path, task=task)
+        if load_times is not None:
+            load_times[model_name] = time.perf_counter() - start
+    return models
+
+
+def warmup_models(models: dict[str, YOLO], imgsz: int = 640, device="cpu"):
+    """Run the models once on dummy inputs, so that the first request does not pay for the lazy
+    initialization of the predictors and the tracker, or the first ONNX Runtime / OpenVINO inference
+    """
+    from kitchen.inference import reset_tracker
+
+    frame   = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    crop    = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    models["detector"].track(frame, persist=True, imgsz=imgsz, device=device, verbose=False)
+    reset_tracker(models["detector"])
+    for model_name in ("dish_classifier", "tray_classifier"):
+        models[model_name]([crop], device=device, verbose=False)
+
+
+class ModelRegistry:
+    """Load the models of each backend on first use, or in the background with `load_in_background`,
+    and keep them for later requests. With `warmup`, the models are run once on dummy inputs
+    after loading, see `warmup_models`.
+
+    `on_load(backend, load_times)` is called after the models of a backend are loaded,
+    with the load time in secs of each model, and of the warm-up under "warmup".
+    """
+
+    def __init__(
+        self,
+        models_dir: Path | str,
+        on_load: Callable[[str, dict[str, float]], None] | None = None,
+        warmup: bool = False,
+        device="cpu"
+    ):
+        self.models_dir = Path(models_dir)
+        self.on_load    = on_load
+        self.warmup     = warmup
+        self.device     = device
+        self.models     = {}
+        self.load_times = {}
+        self.errors     = {}
+        self.lock       = threading.Lock()
+
+    def get(self, backend: str = "pytorch") -> dict[str, YOLO]:
+        with self.lock:
+            if backend not in self.models:
+                load_times  = {}
+                models      = load_models(self.models_dir, backend, load_times)
+                if self.warmup:
+                    start = time.perf_counter()
+                    warmup_models(models, device=self.device)
+                    load_times["warmup"] = time.perf_counter() - start
+
+                # Only marked as loaded once warmed up, see `is_ready`
+                self.models[backend]        = models
+                self.load_times[backend]    = load_times
+                self.errors.pop(backend, None)
+                if self.on_load is not None:
+                    self.on_load(backend, load_times)
+            return self.models[backend]
+
+    def load_in_background(self, backend: str = "pytorch") -> threading.Thread:
+        """Load the models of a backend in a background thread. Requests needing them meanwhile
+        wait in `get` until they are loaded. A loading error is kept in `errors`.
+        """
+        def load():
+            try:
+                self.get(backend)
+            except Exception as e:
+                self.errors[backend] = repr(e)
+                print(f"Failed to load the {backend} models: {e!r}")
+
+        thread = threading.Thread(target=load, name=f"load-{backend}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, backend: str = "pytorch") -> bool:
+        return backend in self.models
+
+    def available_backends(self) -> list[str]:
+        """Backends whose weights exist for all three models"""
+        return [
+            backend for backend in BACKEND_WEIGHTS
+            if all(model_path(self.models_dir, name, backend).exists() for name in MODEL_TASKS)
+        ]
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+from pathlib import Path
+
+from utils.file_tools import read_yaml_file
+from utils.schemas import CameraConfig
+
+
+CAMERA_CONFIGS_DIR = Path(__file__).parent.parent.parent / "configs" / "cameras"
+
+
+def load_camera_config(camera: str | None = None, configs_dir: Path | str = CAMERA_CONFIGS_DIR) -> CameraConfig:
+    """Load the config of a camera from `configs_dir/<camera>.yaml`, or the default config if `camera` is None"""
+    if camera is None:
+        return CameraConfig()
+
+    config_path = Path(configs_dir) / f"{camera}.yaml"
+    if not config_path.exists():
+        raise FileNotFoundError(f"Camera config not found: {config_path}")
+
+    return CameraConfig(**{"name": camera, **read_yaml_file(config_path)})
+
+
+def list_camera_configs(configs_dir: Path | str = CAMERA_CONFIGS_DIR) -> list[str]:
+    return sorted(path.stem for path in Path(configs_dir).glob("*.yaml"))
+
+
+class InferenceRegion:
+    """Part of the frames fed to the detector, and the resolution it runs at, for one camera.
+
+    Frames are cropped to the bounding box of the camera's ROI polygons (plus `roi_padding`),
+    and the pixels farther than `roi_padding` from the polygons are filled with gray,
+    so that the detector only sees the regions of interest. The detector letterboxes the crop
+    to `imgsz` on its longest side. Boxes detected in the crop are mapped back to full-frame
+    coordinates with `to_frame`.
+
+    Parameters
+    ----------
+    width, height : int
+        Size of the full frames
+    config : CameraConfig | None, optional
+        By default, the whole frame at its native resolution
+    """
+
+    def __init__(self, width: int, height: int, config: CameraConfig | None = None):
+        config      = config or CameraConfig()
+        self.mask   = None
+        self.rect   = (0, 0, width, height)
+
+        if len(config.rois) > 0:
+            polygons    = [np.array(roi, dtype=np.float32).reshape(-1, 2) for roi in config.rois]
+            points      = np.concatenate(polygons)
+            x1, y1      = np.floor(points.min(axis=0)).astype(int) - config.roi_padding
+            x2, y2      = np.ceil(points.max(axis=0)).astype(int) + config.roi_padding
+            self.rect   = (int(max(x1, 0)), int(max(y1, 0)), int(min(x2, width)), int(min(y2, height)))
+
+            if self.rect[2] <= self.rect[0] or self.rect[3] <= self.rect[1]:
+                raise ValueError(f"Regions of interest of camera '{config.name}' are outside the {width}x{height} frame")
+
+            offset      = np.array(self.rect[:2], dtype=np.float32)
+            self.mask   = np.zeros((self.rect[3] - self.rect[1], self.rect[2] - self.rect[0]), dtype=np.uint8)
+            cv2.fillPoly(self.mask, [np.round(polygon - offset).astype(np.int32) for polygon in polygons], 255)
+
+            if config.roi_padding > 0:
+                kernel      = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * config.roi_padding + 1,) * 2)
+                self.mask   = cv2.dilate(self.mask, kernel)
+
+            # No need to mask anything if the polygons cover their whole bounding box
+            if self.mask.all():
+                self.mask = None
+
+        self.full_frame = len(config.rois) == 0
+
+        crop_width  = self.rect[2] - self.rect[0]
+        crop_height = self.rect[3] - self.rect[1]
+
+        # ultralytics takes the image size as (height, width)
+        self.imgsz  = config.imgsz if config.imgsz is not None else (crop_height, crop_width)
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """Image fed to the detector"""
+        if self.full_frame:
+            return frame
+
+        x1, y1, x2, y2  = self.rect
+        image           = frame[y1:y2, x1:x2]
+
+        if self.mask is not None:
+            image = np.where(self.mask[..., None] > 0, image, np.uint8(114))
+
+        return image
+
+    def to_frame(self, bbox: list[float]) -> list[float]:
+        """Map a xyxy box from the cropped image to full-frame coordinates"""
+        x_offset, y_offset = self.rect[:2]
+        return [bbox[0] + x_offset, bbox[1] + y_offset, bbox[2] + x_offset, bbox[3] + y_offset]
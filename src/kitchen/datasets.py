@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import cv2
+import numpy as np
+import yaml
+
+from kitchen.inference import ProcessingCancelled, classify_boxes
+from kitchen.motion import MotionGate
+from kitchen.visual_tasks import bboxes_xyxy_to_yolo, format_yolo_labels, parse_yolo_labels, yolo_to_bboxes_xyxy
+from utils.file_tools import read_json_file, write_json_file, write_list_to_text_file
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+
+SAMPLING_POLICIES = ("stride", "uniform", "motion")
+SUBCLASSES = ("empty", "kakigori", "not_empty")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Folder names of the YOLO label / image / annotation files: `labels` and `images` for YOLO datasets
+# and `export_yolo_dataset`, `label` and `image` for the Reannotate tab
+LABEL_DIRS = ("labels", "label")
+IMAGE_DIRS = ("images", "image")
+
+
+def sample_frames(
+    cap: cv2.VideoCapture,
+    policy: str = "stride",
+    stride: int = 30,
+    n_samples: int = 200,
+    motion_threshold: float = 0.05
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Yield (frame index counting from 0, BGR frame) of the sampled frames of a video.
+
+    - "stride": every `stride` frames
+    - "uniform": `n_samples` frames evenly spread over the video
+    - "motion": frames where more than `motion_threshold` of the pixels changed since the last sampled frame,
+      at least `stride` frames apart, see `MotionGate`
+
+    Skipped frames are only grabbed, not converted, except with "motion" which compares every frame.
+    """
+    assert policy in SAMPLING_POLICIES, f"policy must be one of {SAMPLING_POLICIES}"
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    if policy == "motion":
+        # Compare with the last sampled frame rather than the previous one, so that slow changes add up
+        motion_gate = MotionGate(motion_threshold, max_static_frames=0)
+        last_idx    = -stride
+        frame_idx   = 0
+        while True:
+            has_frame, frame = cap.read()
+            if not has_frame:
+                break
+            if frame_idx - last_idx >= stride and not motion_gate.is_static(frame):
+                last_idx = frame_idx
+                yield frame_idx, frame
+            frame_idx += 1
+        return
+
+    if policy == "uniform":
+        indices = np.unique(np.linspace(0, max(n_frames - 1, 0), min(n_samples, n_frames)).round().astype(int))
+    else:
+        indices = np.arange(0, n_frames, stride)
+
+    frame_idx = 0
+    for sample_idx in indices:
+        while frame_idx < sample_idx:
+            if not cap.grab():
+                return
+            frame_idx += 1
+
+        has_frame, frame = cap.read()
+        if not has_frame:
+            return
+        frame_idx += 1
+        yield int(sample_idx), frame
+
+
+def split_of(sample_name: str, val_fraction: float) -> str:
+    """Train / val split of a sample, stable across exports since it only depends on the sample name"""
+    return "val" if zlib.crc32(sample_name.encode()) % 1000 < val_fraction * 1000 else "train"
+
+
+def _write_sample(
+    output_dir: str,
+    split: str,
+    sample_name: str,
+    frame: np.ndarray,
+    label_lines: list[str],
+    boxes: list[dict],
+    jpeg_quality: int
+):
+    """Encode and write the image, YOLO label and JSON annotation of a sample, in a worker process"""
+    output_dir = Path(output_dir)
+    image_path = output_dir / "images" / split / f"{sample_name}.jpg"
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+
+    cv2.imwrite(str(image_path), frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    write_list_to_text_file(label_lines, output_dir / "labels" / split / f"{sample_name}.txt")
+    write_json_file(boxes, output_dir / "json" / split / f"{sample_name}.json")
+
+
+def write_data_yaml(output_dir: Path | str, names: dict[int, str]) -> Path:
+    """Write the `data.yaml` of a YOLO detection dataset, usable with `scripts/train_yolo.py --data`"""
+    output_dir  = Path(output_dir).resolve()
+    data_path   = output_dir / "data.yaml"
+    val_dir     = output_dir / "images/val"
+    has_val     = val_dir.exists() and any(val_dir.iterdir())
+    if not has_val:
+        print(f"No validation images in {output_dir}, validating on the training images")
+
+    data        = {
+        "path": str(output_dir),
+        "train": "images/train",
+        "val": "images/val" if has_val else "images/train",
+        "names": {int(class_id): name for class_id, name in names.items()},
+        "nc": len(names),
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    return data_path
+
+
+def export_yolo_dataset(
+    input_video: str,
+    output_dir: str,
+    detector: YOLO,
+    dish_classifier: YOLO,
+    tray_classifier: YOLO,
+    policy: str = "stride",
+    stride: int = 30,
+    n_samples: int = 200,
+    motion_threshold: float = 0.05,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    imgsz: int = 640,
+    device="cpu",
+    batch_size: int = 8,
+    val_fraction: float = 0.1,
+    skip_empty: bool = False,
+    jpeg_quality: int = 95,
+    n_workers: int = 4,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None
+) -> dict:
+    """Pre-label sampled frames of a video with the current models, and save them as a YOLO detection dataset.
+
+    Sampled frames (see `sample_frames` for `policy`, `stride`, `n_samples` and `motion_threshold`) are detected
+    in batches of `batch_size`, then their boxes classified into sub-classes. Each sample is written
+    by a pool of `n_workers` processes as:
+    - `images/<split>/<video>_<frame>.jpg`
+    - `labels/<split>/<video>_<frame>.txt`: YOLO boxes with the detector classes
+    - `json/<split>/<video>_<frame>.json`: boxes with "<class>-<subclass>" labels, in the format of the Reannotate tab
+
+    Samples are split into train / val by `split_of`, and `data.yaml` is (re)written, so that the dataset
+    can be trained on directly. Exporting more videos to the same `output_dir` grows the dataset.
+
+    Returns
+    -------
+    dict
+        With keys: data_yaml, n_samples, n_boxes, n_train, n_val
+    """
+    cap         = cv2.VideoCapture(input_video)
+    n_frames    = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    n_expected  = min(n_samples, n_frames) if policy == "uniform" else -(-n_frames // stride)
+    video_name  = Path(input_video).stem
+    counts      = {"n_samples": 0, "n_boxes": 0, "n_train": 0, "n_val": 0}
+    pending     = []
+
+    def label_batch(batch: list[tuple[int, np.ndarray]]):
+        results = detector([frame for _, frame in batch], conf=conf, iou=iou, imgsz=imgsz, device=device, verbose=False)
+
+        for (frame_idx, frame), result in zip(batch, results):
+            boxes   = result.boxes.xyxy.cpu().numpy()
+            classes = result.boxes.cls.int().cpu().tolist()
+            if skip_empty and len(boxes) == 0:
+                continue
+
+            subclass_names  = classify_boxes(frame, boxes, classes, dish_classifier, tray_classifier, device=device)
+            height, width   = frame.shape[:2]
+            sample_name     = f"{video_name}_{frame_idx:06d}"
+            split           = split_of(sample_name, val_fraction)
+            label_lines     = format_yolo_labels(classes, bboxes_xyxy_to_yolo(boxes, width, height))
+            json_boxes      = [
+                {
+                    "xmin": int(round(bbox[0])),
+                    "ymin": int(round(bbox[1])),
+                    "xmax": int(round(bbox[2])),
+                    "ymax": int(round(bbox[3])),
+                    "label": f"{detector.names[cls]}-{subclass}",
+                }
+                for bbox, cls, subclass in zip(boxes, classes, subclass_names)
+            ]
+
+            # Bound the frames waiting to be written
+            while len(pending) >= 2 * n_workers:
+                pending.pop(0).result()
+            pending.append(executor.submit(
+                _write_sample, output_dir, split, sample_name, frame, label_lines, json_boxes, jpeg_quality
+            ))
+
+            counts["n_samples"]     += 1
+            counts["n_boxes"]       += len(boxes)
+            counts[f"n_{split}"]    += 1
+
+    # Spawned workers do not inherit the models and torch threads of this process
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn")) as executor:
+        try:
+            batch = []
+            for frame_idx, frame in sample_frames(cap, policy, stride, n_samples, motion_threshold):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ProcessingCancelled(f"Export of {input_video} was cancelled")
+
+                batch.append((frame_idx, frame))
+                if len(batch) == batch_size:
+                    label_batch(batch)
+                    batch = []
+                    if progress_callback is not None:
+                        progress_callback(counts["n_samples"], n_expected)
+
+            if len(batch) > 0:
+                label_batch(batch)
+
+            for future in pending:
+                future.result()
+        finally:
+            cap.release()
+
+    data_yaml = write_data_yaml(output_dir, detector.names)
+    print(f"Exported {counts['n_samples']} frames of {input_video} to {output_dir}")
+    return {"data_yaml": str(data_yaml), **counts}
+
+
+# Classification crops
+
+def find_label_sources(source_dir: Path | str) -> list[dict]:
+    """Find the YOLO label files under `source_dir` with their image and (optional) JSON annotation.
+
+    The image of `<root>/labels/<...>/<name>.txt` is looked up in `<root>/images/<...>/<name>.<ext>` and its
+    annotation in `<root>/json/<...>/<name>.json` (same with `label` / `image`). Each source gets a `key`
+    made of its path relative to `source_dir` without the label folder, e.g. `train_img_000001`,
+    used to name its crops.
+    """
+    source_dir  = Path(source_dir)
+    sources     = []
+
+    for label_path in sorted(source_dir.rglob("*.txt")):
+        relative_parts  = label_path.relative_to(source_dir).parts
+        label_dir_idx   = next(
+            (i for i in range(len(relative_parts) - 2, -1, -1) if relative_parts[i] in LABEL_DIRS), None
+        )
+        if label_dir_idx is None:
+            continue
+
+        # Not `with_suffix`, names like `frame0_jpg.rf.5c6e9f1a` contain dots
+        root        = source_dir.joinpath(*relative_parts[:label_dir_idx])
+        inner_dir   = Path(*relative_parts[label_dir_idx + 1:-1])
+        name        = label_path.stem
+        image_path  = next(
+            (
+                root / image_dir / inner_dir / f"{name}{ext}"
+                for image_dir in IMAGE_DIRS for ext in IMAGE_EXTENSIONS
+                if (root / image_dir / inner_dir / f"{name}{ext}").exists()
+            ),
+            None
+        )
+        if image_path is None:
+            print(f"No image found for {label_path}, skipping")
+            continue
+
+        json_path = root / "json" / inner_dir / f"{name}.json"
+        sources.append({
+            "key": "_".join(relative_parts[:label_dir_idx] + inner_dir.parts + (name,)),
+            "label_path": str(label_path),
+            "image_path": str(image_path),
+            "json_path": str(json_path) if json_path.exists() else None,
+        })
+
+    return sources
+
+
+def source_signature(source: dict) -> list:
+    """Modification time and size of the files of a source, to detect changed labels between builds"""
+    signature = []
+    for path_key in ("label_path", "image_path", "json_path"):
+        if source[path_key] is None:
+            signature.append(None)
+            continue
+        stat = os.stat(source[path_key])
+        signature.append([stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+def read_yolo_labels(label_path: Path | str) -> tuple[np.ndarray, np.ndarray]:
+    """Read a YOLO label file into an (N,) array of class ids and an (N, 4) array of YOLO boxes"""
+    with open(label_path, "r", encoding="utf-8") as f:
+        return parse_yolo_labels(f.read())
+
+
+def box_subclasses(
+    class_ids: np.ndarray,
+    names: dict[int, str],
+    json_path: str | None
+) -> list[tuple[str, str] | None]:
+    """(object, subclass) of each box, from class names like `dish-empty`, or else from the `<object>-<subclass>`
+    labels of the JSON annotation, which lists the boxes in the same order as the label file.
+    Boxes whose subclass is unknown get None.
+    """
+    json_labels = None
+    if json_path is not None:
+        json_labels = [box["label"] for box in read_json_file(json_path)]
+        if len(json_labels) != len(class_ids):
+            print(f"{json_path} has {len(json_labels)} boxes instead of {len(class_ids)}, ignoring it")
+            json_labels = None
+
+    labels = []
+    for idx, class_id in enumerate(class_ids):
+        label = names.get(int(class_id), "")
+        if "-" not in label and json_labels is not None:
+            label = json_labels[idx]
+
+        object_name, _, subclass = label.partition("-")
+        labels.append((object_name, subclass) if subclass in SUBCLASSES else None)
+    return labels
+
+
+def _write_source_crops(
+    source: dict,
+    output_dir: str,
+    names: dict[int, str],
+    min_size: int,
+    jpeg_quality: int
+) -> tuple[list[str], int]:
+    """Decode the image of a source once and write the crop of each of its labeled boxes, in a worker process.
+
+    Returns the crop paths relative to `output_dir` and the number of boxes skipped for lack of subclass
+    """
+    class_ids, yolo_boxes = read_yolo_labels(source["label_path"])
+    if len(class_ids) == 0:
+        return [], 0
+
+    image           = cv2.imread(source["image_path"])
+    height, width   = image.shape[:2]
+    boxes           = yolo_to_bboxes_xyxy(yolo_boxes, width, height).round().astype(int)
+    boxes           = np.clip(boxes, 0, [width, height, width, height])
+    large_enough    = ((boxes[:, 2] - boxes[:, 0]) >= min_size) & ((boxes[:, 3] - boxes[:, 1]) >= min_size)
+    subclasses      = box_subclasses(class_ids, names, source["json_path"])
+
+    crop_paths  = []
+    n_unlabeled = 0
+    for idx in np.flatnonzero(large_enough):
+        if subclasses[idx] is None:
+            n_unlabeled += 1
+            continue
+
+        object_name, subclass   = subclasses[idx]
+        xmin, ymin, xmax, ymax  = boxes[idx]
+        crop_path               = Path(object_name) / subclass / f"{source['key']}_{class_ids[idx]}_{idx}.jpg"
+        (Path(output_dir) / crop_path).parent.mkdir(parents=True, exist_ok=True)
+
+        cv2.imwrite(str(Path(output_dir) / crop_path), image[ymin:ymax, xmin:xmax], [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        crop_paths.append(str(crop_path))
+
+    return crop_paths, n_unlabeled
+
+
+def build_classification_crops(
+    source_dirs: list[str],
+    output_dir: str,
+    names: dict[int, str],
+    incremental: bool = True,
+    min_size: int = 8,
+    jpeg_quality: int = 95,
+    n_workers: int = 4,
+    chunksize: int = 16,
+    progress_callback: Callable[[int, int], None] | None = None
+) -> dict:
+    """Crop the labeled boxes of YOLO detection datasets into a classification dataset:
+    `<output_dir>/<object>/<subclass>/<source key>_<class_id>_<box idx>.jpg`, the layout of `data/classification`.
+
+    The subclass of a box comes from its class name if the classes are named `<object>-<subclass>`,
+    otherwise from the JSON annotation next to the label file (see `find_label_sources` and `box_subclasses`).
+    Each image is decoded once, and the images are processed by a pool of `n_workers` processes.
+
+    The sources and their crops are recorded in `<output_dir>/crops_manifest.json`. With `incremental`, only the
+    sources whose label, annotation or image changed since the last build are processed again, otherwise all of
+    them. The crops of changed or deleted sources are removed first; other files in `output_dir` are left untouched.
+
+    Returns
+    -------
+    dict
+        With keys: n_sources, n_processed, n_removed, n_crops, n_unlabeled
+    """
+    output_dir      = Path(output_dir)
+    manifest_path   = output_dir / "crops_manifest.json"
+    manifest        = read_json_file(manifest_path) if manifest_path.exists() else {}
+
+    sources = {}
+    for source_dir in source_dirs:
+        for source in find_label_sources(source_dir):
+            if source["key"] in sources:
+                raise ValueError(f"{source['label_path']} and {sources[source['key']]['label_path']} have the same crop names")
+            source["signature"]     = source_signature(source)
+            sources[source["key"]]  = source
+
+    # Sources which changed or were deleted since the last build, or all of them for a full rebuild
+    outdated = [
+        key for key, entry in manifest.items()
+        if not incremental or key not in sources or sources[key]["signature"] != entry["signature"]
+    ]
+    for key in outdated:
+        for crop_path in manifest.pop(key)["crops"]:
+            (output_dir / crop_path).unlink(missing_ok=True)
+
+    todo    = [source for key, source in sources.items() if key not in manifest]
+    counts  = {
+        "n_sources": len(sources),
+        "n_processed": len(todo),
+        "n_removed": len([key for key in outdated if key not in sources]),
+        "n_crops": 0,
+        "n_unlabeled": 0,
+    }
+    print(f"{len(sources)} label files, {len(todo)} to process")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn")) as executor:
+            results = executor.map(
+                _write_source_crops,
+                todo,
+                [str(output_dir)] * len(todo),
+                [names] * len(todo),
+                [min_size] * len(todo),
+                [jpeg_quality] * len(todo),
+                chunksize=chunksize,
+            )
+            for idx, (source, (crop_paths, n_unlabeled)) in enumerate(zip(todo, results)):
+                manifest[source["key"]] = {
+                    "label_path": source["label_path"],
+                    "signature": source["signature"],
+                    "crops": crop_paths,
+                }
+                counts["n_crops"]       += len(crop_paths)
+                counts["n_unlabeled"]   += n_unlabeled
+                if progress_callback is not None:
+                    progress_callback(idx + 1, len(todo))
+    finally:
+        # Keep the sources done so far if interrupted, the next build resumes from them
+        write_json_file(manifest, manifest_path)
+
+    print(f"Wrote {counts['n_crops']} crops to {output_dir}")
+    return counts
@@ -0,0 +1,153 @@
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+
+from utils.file_tools import append_ndjson_file
+
+
+class DetectionWriter:
+    """Collect per-frame detections into compact columnar arrays saved as a `.npz` file.
+
+    Columns (one row per detection):
+    - frame_idx (int32): index of the frame, counting from 0
+    - track_id (int32)
+    - class_id (int16)
+    - name_id, subclass_id (int16): indices into the `labels` vocabulary
+    - bbox (float32, N x 4): xyxy box
+
+    If `ndjson_path` is given, detections are also streamed to an NDJSON file, one line per frame.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        ndjson_path: str | None = None,
+        video_stats: dict | None = None,
+        flush_every: int = 100
+    ):
+        self.output_path    = Path(output_path)
+        self.ndjson_path    = Path(ndjson_path) if ndjson_path is not None else None
+        self.video_stats    = video_stats or {}
+        self.flush_every    = flush_every
+        self.labels         = {}
+        self.columns        = {"frame_idx": [], "track_id": [], "class_id": [], "name_id": [], "subclass_id": [], "bbox": []}
+        self.ndjson_lines   = []
+        self.n_frames       = 0
+        self.n_detections   = 0
+
+        if self.ndjson_path is not None:
+            self.ndjson_path.unlink(missing_ok=True)
+
+    def label_id(self, label: str) -> int:
+        if label not in self.labels:
+            self.labels[label] = len(self.labels)
+        return self.labels[label]
+
+    def add_frame(self, frame_idx: int, detections: list[dict]):
+        for det in detections:
+            self.columns["frame_idx"].append(frame_idx)
+            self.columns["track_id"].append(det["track_id"])
+            self.columns["class_id"].append(det["class_id"])
+            self.columns["name_id"].append(self.label_id(det["name"]))
+            self.columns["subclass_id"].append(self.label_id(det["subclass"]))
+            self.columns["bbox"].append(det["bbox"])
+
+        self.n_frames       = max(self.n_frames, frame_idx + 1)
+        self.n_detections   += len(detections)
+
+        if self.ndjson_path is not None:
+            self.ndjson_lines.append({"frame_idx": frame_idx, "detections": detections})
+            if len(self.ndjson_lines) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        if self.ndjson_path is not None and len(self.ndjson_lines) > 0:
+            append_ndjson_file(self.ndjson_lines, self.ndjson_path)
+            self.ndjson_lines = []
+
+    def close(self):
+        self.flush()
+
+        if not self.output_path.parent.exists():
+            self.output_path.parent.mkdir(parents=True)
+
+        np.savez_compressed(
+            self.output_path,
+            frame_idx=np.array(self.columns["frame_idx"], dtype=np.int32),
+            track_id=np.array(self.columns["track_id"], dtype=np.int32),
+            class_id=np.array(self.columns["class_id"], dtype=np.int16),
+            name_id=np.array(self.columns["name_id"], dtype=np.int16),
+            subclass_id=np.array(self.columns["subclass_id"], dtype=np.int16),
+            bbox=np.array(self.columns["bbox"], dtype=np.float32).reshape(-1, 4),
+            labels=np.array(list(self.labels), dtype=str),
+            n_frames=np.int64(max(self.n_frames, self.video_stats.get("n_frames", 0))),
+            fps=np.float64(self.video_stats.get("fps", 0)),
+        )
+
+
+def load_detection_arrays(detections_path: str) -> dict[str, np.ndarray]:
+    """Load the columns saved by `DetectionWriter`"""
+    with np.load(detections_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+class DetectionStore:
+    """Frame-indexed, read-only access to the detections saved by `DetectionWriter`.
+
+    The columns are loaded once and sorted by frame, so that the detections of any frame
+    are a slice of the arrays.
+    """
+
+    def __init__(self, detections_path: str):
+        arrays          = load_detection_arrays(detections_path)
+        order           = np.argsort(arrays["frame_idx"], kind="stable")
+        self.labels     = arrays["labels"].tolist()
+        self.n_frames   = int(arrays["n_frames"])
+        self.fps        = float(arrays["fps"])
+        self.columns    = {
+            key: arrays[key][order]
+            for key in ("frame_idx", "track_id", "class_id", "name_id", "subclass_id", "bbox")
+        }
+        self.offsets    = np.searchsorted(self.columns["frame_idx"], np.arange(self.n_frames + 1))
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __getitem__(self, frame_idx: int) -> list[dict]:
+        """Detections of a frame (counting from 0), in the format returned by `track_frame`"""
+        if frame_idx < 0 or frame_idx >= self.n_frames:
+            return []
+
+        rows = slice(self.offsets[frame_idx], self.offsets[frame_idx + 1])
+        return [
+            {
+                "track_id": track_id,
+                "class_id": class_id,
+                "name": self.labels[name_id],
+                "subclass": self.labels[subclass_id],
+                "bbox": bbox,
+            }
+            for track_id, class_id, name_id, subclass_id, bbox in zip(
+                self.columns["track_id"][rows].tolist(),
+                self.columns["class_id"][rows].tolist(),
+                self.columns["name_id"][rows].tolist(),
+                self.columns["subclass_id"][rows].tolist(),
+                self.columns["bbox"][rows].tolist(),
+            )
+        ]
+
+
+@lru_cache(maxsize=8)
+def _cached_store(detections_path: str, mtime: int) -> DetectionStore:
+    return DetectionStore(detections_path)
+
+
+def load_detection_store(detections_path: str) -> DetectionStore:
+    """`DetectionStore` of a detections file, kept in memory for the next calls until the file changes"""
+    return _cached_store(str(detections_path), Path(detections_path).stat().st_mtime_ns)
+
+
+def load_detections(detections_path: str) -> list[list[dict]]:
+    """Load the detections saved by `DetectionWriter`, as a list of detections per frame"""
+    store = DetectionStore(detections_path)
+    return [store[frame_idx] for frame_idx in range(len(store))]
@@ -0,0 +1,75 @@
+import subprocess
+import numpy as np
+
+
+class FFmpegWriter:
+    """Encode BGR frames to H.264 in a single pass by piping raw frames to ffmpeg's stdin.
+
+    Has the same `write` / `release` interface as `cv2.VideoWriter`.
+
+    Parameters
+    ----------
+    output_path : str
+    width : int
+    height : int
+    fps : float
+    preset : str, optional
+        libx264 preset, by default "medium"
+    crf : int, optional
+        libx264 constant rate factor (lower is better quality), by default 23
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        width: int,
+        height: int,
+        fps: float,
+        preset: str = "medium",
+        crf: int = 23
+    ):
+        self.output_path    = output_path
+        self.width          = width
+        self.height         = height
+        self.n_frames       = 0
+
+        args = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", str(fps),
+            "-i", "-",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264",
+            "-preset", preset,
+            "-crf", str(crf),
+            "-pix_fmt", "yuv420p",
+            output_path,
+        ]
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray):
+        assert frame.shape[:2] == (self.height, self.width), \
+            f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match {self.width}x{self.height}"
+
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        except BrokenPipeError:
+            self.release()
+
+        self.n_frames += 1
+
+    def release(self):
+        if self.process.stdin is not None and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        stderr = self.process.stderr.read().decode(errors="replace") if self.process.stderr else ""
+        return_code = self.process.wait()
+
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg exited with code {return_code}: {stderr.strip()}")
@@ -0,0 +1,227 @@
+import bisect
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def probe_keyframes(video_path: str) -> list[int] | None:
+    """Indices of the keyframes of the first video stream, in presentation order, read from the
+    packet headers with ffprobe (no decoding). Returns None if ffprobe is not available or fails.
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+
+    args = [
+        ffprobe, "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+
+    packets = []
+    for line in result.stdout.splitlines():
+        fields = line.split(",")
+        if len(fields) < 2 or fields[0] in ("", "N/A"):
+            continue
+        packets.append((float(fields[0]), "K" in fields[1]))
+
+    # Packets come in decoding order, frame indices follow the presentation order
+    packets.sort()
+    keyframes = [i for i, (_, is_key) in enumerate(packets) if is_key]
+
+    return keyframes if len(keyframes) > 0 else None
+
+
+class VideoReader:
+    """An open capture of one video, with the index of its keyframes.
+
+    `get_frames` decodes forward from the current position when the target frame is within `max_forward`
+    frames or in the same group of pictures, and otherwise seeks by frame number: OpenCV then jumps to
+    the previous keyframe and decodes forward to the exact frame, unlike seeking by timestamp.
+    """
+
+    def __init__(self, video_path: str, max_forward: int = 60):
+        self.video_path     = video_path
+        self.cap            = cv2.VideoCapture(video_path)
+        self.mtime          = os.stat(video_path).st_mtime_ns
+        self.lock           = threading.Lock()
+        self.max_forward    = max_forward
+        self.position       = 0  # index of the next frame read by the capture
+
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video: {video_path}")
+
+        self.width      = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height     = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps        = self.cap.get(cv2.CAP_PROP_FPS)
+        self.n_frames   = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.keyframes  = probe_keyframes(video_path)
+        self.n_seeks    = 0
+        self.n_decoded  = 0
+
+    def keyframe_before(self, frame_idx: int) -> int:
+        return self.keyframes[max(bisect.bisect_right(self.keyframes, frame_idx) - 1, 0)]
+
+    def get_frames(self, frame_idx: int, before: int = 0, after: int = 0) -> dict[int, np.ndarray]:
+        """Decode the frame and up to `before` / `after` neighbouring frames on the way.
+
+        Returns
+        -------
+        dict[int, np.ndarray]
+            RGB frames by index (counting from 0). Empty if the frame cannot be read.
+        """
+        with self.lock:
+            # Decoding forward is cheaper than seeking when the target is close ahead,
+            # or in the same group of pictures as the current position
+            seek_to = max(frame_idx - before, 0)
+            forward = 0 <= self.position <= frame_idx and (
+                frame_idx - self.position <= self.max_forward
+                or (self.keyframes is not None and self.keyframe_before(frame_idx) <= self.position)
+            )
+
+            if not forward:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, seek_to)
+                self.position   = seek_to
+                self.n_seeks    += 1
+
+            frames = {}
+            while self.position <= frame_idx + after:
+                # Frames before the neighbourhood only need to be decoded, not converted
+                if self.position < frame_idx - before:
+                    has_frame = self.cap.grab()
+                    frame = None
+                else:
+                    has_frame, frame = self.cap.read()
+
+                if not has_frame:
+                    self.position = -1  # unknown, seek on the next call
+                    break
+
+                if frame is not None:
+                    frames[self.position] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.position   += 1
+                self.n_decoded  += 1
+
+            return frames
+
+    def stats(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "n_frames": self.n_frames,
+            "length": self.n_frames * 1000 / self.fps if self.fps > 0 else 0,
+            "fps": self.fps,
+        }
+
+    def release(self):
+        with self.lock:
+            self.cap.release()
+
+
+class FrameServer:
+    """Random access to the frames of videos, for scrubbing through them.
+
+    Keeps a `VideoReader` (open capture and keyframe index) per video, for up to `max_videos` videos,
+    and an LRU cache of decoded frames bounded to `max_bytes`. Each decoded frame brings its
+    `neighbours` previous and next frames into the cache, so that moving the slider by a few frames
+    does not decode anything. Readers are re-created when their video file changes.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20, max_videos: int = 4, neighbours: int = 4):
+        self.max_bytes      = max_bytes
+        self.max_videos     = max_videos
+        self.neighbours     = neighbours
+        self.readers        = OrderedDict()
+        self.frames         = OrderedDict()
+        self.n_bytes        = 0
+        self.lock           = threading.Lock()
+        self.hits           = 0
+        self.misses         = 0
+
+    def reader(self, video_path: str) -> VideoReader:
+        video_path = str(video_path)
+        with self.lock:
+            reader = self.readers.get(video_path)
+            if reader is not None and reader.mtime != os.stat(video_path).st_mtime_ns:
+                self._drop_video(video_path)
+                reader = None
+
+            if reader is None:
+                reader = VideoReader(video_path)
+                self.readers[video_path] = reader
+                while len(self.readers) > self.max_videos:
+                    self._drop_video(next(iter(self.readers)))
+
+            self.readers.move_to_end(video_path)
+            return reader
+
+    def get_frame(self, video_path: str, frame_idx: int) -> np.ndarray:
+        """RGB frame `frame_idx` (counting from 0) of the video"""
+        video_path  = str(video_path)
+        reader      = self.reader(video_path)
+        frame_idx   = min(max(int(frame_idx), 0), max(reader.n_frames - 1, 0))
+        key         = (video_path, frame_idx)
+
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frames = reader.get_frames(frame_idx, self.neighbours, self.neighbours)
+        if frame_idx not in frames:
+            raise ValueError(f"Cannot read frame {frame_idx} of {video_path}")
+
+        with self.lock:
+            for idx, decoded in frames.items():
+                self._put((video_path, idx), decoded)
+
+        return frames[frame_idx]
+
+    def video_stats(self, video_path: str) -> dict:
+        return self.reader(video_path).stats()
+
+    def _put(self, key: tuple, frame: np.ndarray):
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return
+
+        self.frames[key]    = frame
+        self.n_bytes        += frame.nbytes
+
+        while self.n_bytes > self.max_bytes and len(self.frames) > 1:
+            _, evicted      = self.frames.popitem(last=False)
+            self.n_bytes    -= evicted.nbytes
+
+    def _drop_video(self, video_path: str):
+        self.readers.pop(video_path).release()
+        for key in [key for key in self.frames if key[0] == video_path]:
+            self.n_bytes -= self.frames.pop(key).nbytes
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0.0,
+                "cached_frames": len(self.frames),
+                "cached_mb": self.n_bytes / 2**20,
+                "seeks": sum(reader.n_seeks for reader in self.readers.values()),
+                "decoded_frames": sum(reader.n_decoded for reader in self.readers.values()),
+            }
+
+
+FRAME_SERVER = FrameServer(max_bytes=int(os.environ.get("KITCHEN_FRAME_CACHE_MB", 512)) * 2**20)
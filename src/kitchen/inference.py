@@ -1,17 +1,39 @@
+from __future__ import annotations
+
+import copy
 import cv2
 import numpy as np
-import subprocess
+import threading
+import time
 from PIL import Image
 from PIL.Image import Image as PILImage
-from collections import defaultdict
-from ultralytics import YOLO
-from ultralytics.utils.plotting import Annotator, colors
+from collections import deque
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from kitchen.camera import InferenceRegion
+from kitchen.detections import DetectionStore, DetectionWriter, load_detections
+from kitchen.encoder import FFmpegWriter
+from kitchen.frames import FRAME_SERVER
+from kitchen.motion import MotionGate
+from kitchen.pipeline import END_OF_STREAM, FrameQueue, StageThread
+from kitchen.profiling import ChromeTrace, StageTimer, timed
+from kitchen.tracks import TrackStore
+from kitchen.visual_tasks import box_iou, crops_to_batch
+from utils.schemas import CameraConfig, PredictionOutput
+
+# ultralytics imports torch, which takes seconds: models are loaded by kitchen.backends,
+# and the plotting helpers are imported on first use
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
 
-from kitchen.visual_tasks import crop_image
-from utils.schemas import PredictionOutput
+class ProcessingCancelled(Exception):
+    """Raised by process_video when its cancel event is set"""
 
 
-temp_video = "cache/temp_video.mp4"
+# Classifier input batches, reused across frames. One per thread, since jobs can run in parallel threads
+_CROP_BUFFERS = threading.local()
 
 
 def get_video_stats(video_path: str):
@@ -34,15 +56,468 @@ def get_video_stats(video_path: str):
 
 
 def get_video_frame(video_path: str, frame_idx: float) -> PILImage:
-    frame_idx = frame_idx - 1 # Count from 1
-    stats = get_video_stats(video_path)
-    frame_msecs = frame_idx * 1000 / stats["fps"]
+    """Exact frame of a video, counting from 1, served from the shared `FrameServer` and its cache"""
+    frame_idx = int(frame_idx) - 1 # Count from 1
+    return Image.fromarray(FRAME_SERVER.get_frame(video_path, frame_idx))
+
+
+def classify_crops(
+    classifier: YOLO,
+    crops: list,
+    device="cpu",
+    batch_size: int = 32,
+    timer: StageTimer | None = None
+) -> list[tuple[str, np.ndarray]]:
+    """Classify a list of crops with one forward pass per batch.
+
+    The crops can come from a single frame or be collected across several frames,
+    the results are returned in the same order as the input crops.
+
+    Parameters
+    ----------
+    classifier : YOLO
+        Classification model
+    crops : list | np.ndarray
+        List of cropped images (PIL images or numpy arrays), or a preprocessed batch from `crops_to_batch`
+    device : str, optional
+        By default "cpu"
+    batch_size : int, optional
+        Maximum number of crops sent to the classifier in one call, by default 32
+    timer : StageTimer | None, optional
+        If given, counts the classifier calls ("classifier_calls") and crops ("classified_crops")
+
+    Returns
+    -------
+    list[tuple[str, np.ndarray]]
+        List of (subclass name, class probabilities), one per crop
+    """
+    results     = []
+    is_batch    = isinstance(crops, np.ndarray) and crops.ndim == 4
+    if is_batch:
+        import torch
+
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size]
+        # Tensors skip the resizing and normalization of the classifier, the batch is already preprocessed
+        preds = classifier(torch.from_numpy(batch) if is_batch else batch, device=device)
+        if timer is not None:
+            timer.count("classifier_calls")
+            timer.count("classified_crops", len(batch))
+
+        for pred in preds:
+            results.append((classifier.names[pred.probs.top1], pred.probs.data.cpu().numpy()))
+
+    return results
+
+
+class ClassificationCache:
+    """Cache the sub-class of each track to avoid re-classifying it on every frame.
+
+    A cached result is reused until one of the following happens:
+    - `interval` frames have passed since the track was last classified
+    - the box moved or resized so that its IoU with the cached box drops below `min_iou`
+    - the top-1 confidence of the cached result is lower than `min_conf`
+
+    Tracks that have not been seen for more than `max_age` frames are evicted.
+    """
+
+    def __init__(self, interval: int = 30, min_iou: float = 0.7, min_conf: float = 0.5, max_age: int = 30):
+        self.interval   = interval
+        self.min_iou    = min_iou
+        self.min_conf   = min_conf
+        self.max_age    = max_age
+        self.entries    = {}
+        self.hits       = 0
+        self.misses     = 0
+
+    def get(self, track_id: int, bbox, frame_idx: int) -> tuple[str, np.ndarray] | None:
+        """Return the cached (subclass name, probabilities) of a track if it is still valid"""
+        entry = self.entries.get(track_id)
+
+        if (
+            entry is None
+            or frame_idx - entry["frame_idx"] >= self.interval
+            or entry["probs"].max() < self.min_conf
+            or box_iou(entry["bbox"], bbox) < self.min_iou
+        ):
+            self.misses += 1
+            return None
+
+        entry["last_seen"] = frame_idx
+        self.hits += 1
+        return entry["name"], entry["probs"]
+
+    def put(self, track_id: int, bbox, frame_idx: int, name: str, probs: np.ndarray):
+        self.entries[track_id] = {
+            "bbox": [float(v) for v in bbox],
+            "frame_idx": frame_idx,
+            "last_seen": frame_idx,
+            "name": name,
+            "probs": probs,
+        }
+
+    def evict(self, frame_idx: int):
+        """Remove tracks that the tracker has dropped"""
+        expired = [
+            track_id for track_id, entry in self.entries.items()
+            if frame_idx - entry["last_seen"] > self.max_age
+        ]
+        for track_id in expired:
+            del self.entries[track_id]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0,
+            "n_tracks": len(self.entries),
+        }
+
+
+def classifier_input_size(classifier: YOLO, device="cpu") -> int:
+    """Input image size of a classifier, set by its predictor from the training args or the exported model"""
+    if getattr(classifier, "predictor", None) is None:
+        classifier(np.zeros((32, 32, 3), dtype=np.uint8), device=device, verbose=False)
+    return int(max(classifier.predictor.imgsz))
+
+
+def preprocess_crops(frame: np.ndarray, boxes: np.ndarray, classifier: YOLO, device="cpu") -> np.ndarray:
+    """Crop boxes from a frame into an input batch of the classifier (see `crops_to_batch`), written
+    in a buffer reused by the next frames of the same thread
+    """
+    size    = classifier_input_size(classifier, device)
+    buffer  = getattr(_CROP_BUFFERS, "buffer", None)
+    batch   = crops_to_batch(frame, boxes, size, out=buffer)
+    if batch.base is not buffer:
+        _CROP_BUFFERS.buffer = batch.base
+    return batch
+
+
+def classify_boxes(
+    frame: np.ndarray,
+    boxes,
+    classes,
+    dish_classifier: YOLO,
+    tray_classifier: YOLO,
+    device="cpu",
+    track_ids: list[int] | None = None,
+    cache: ClassificationCache | None = None,
+    frame_idx: int = 0,
+    timer: StageTimer | None = None
+) -> list[str]:
+    """Crop detected boxes from a frame and classify them into sub-classes.
+    Dish crops and tray crops are each sent to their classifier as a single batch.
+    If a cache is provided, only tracks without a valid cached result are classified.
+
+    Returns
+    -------
+    list[str]
+        Sub-class name of each box, in the same order as `boxes`
+    """
+    subclass_names  = [""] * len(boxes)
+    classifiers     = {0: dish_classifier, 1: tray_classifier}
+    use_cache       = cache is not None and track_ids is not None
+
+    for cls_id, classifier in classifiers.items():
+        indices = []
+
+        for i, cls in enumerate(classes):
+            if int(cls) != cls_id:
+                continue
+
+            cached = cache.get(track_ids[i], boxes[i], frame_idx) if use_cache else None
+            if cached is not None:
+                subclass_names[i] = cached[0]
+            else:
+                indices.append(i)
+
+        if len(indices) == 0:
+            continue
+
+        crops   = preprocess_crops(frame, np.asarray(boxes)[indices], classifier, device=device)
+        results = classify_crops(classifier, crops, device=device, timer=timer)
+
+        for i, (subclass_name, probs) in zip(indices, results):
+            subclass_names[i] = subclass_name
+            if use_cache:
+                cache.put(track_ids[i], boxes[i], frame_idx, subclass_name, probs)
+
+    if use_cache:
+        cache.evict(frame_idx)
+
+    return subclass_names
+
+
+def reset_tracker(detector: YOLO):
+    """Clear the tracker state kept on the detector by `track(persist=True)`,
+    so that tracks from a previous video do not leak into the next one.
+    """
+    predictor = getattr(detector, "predictor", None)
+    for tracker in getattr(predictor, "trackers", []):
+        tracker.reset()
+
+
+def predict_tracks(
+    detector: YOLO,
+    cls_cache: ClassificationCache,
+    steps: float,
+    region: InferenceRegion | None = None
+) -> list[dict] | None:
+    """Predict the boxes of the active tracks `steps` tracker updates after the last one,
+    using the Kalman state of the detector's tracker, without changing the tracker state.
+    Sub-classes are taken from the classification cache. Boxes are mapped back to full-frame
+    coordinates if the detector runs on a `region` of the frames.
+
+    Returns
+    -------
+    list[dict] | None
+        Detections in the format returned by `track_frame`, or None if the detector has no tracker
+    """
+    trackers = getattr(getattr(detector, "predictor", None), "trackers", [])
+    if len(trackers) == 0:
+        return None
+
+    detections = []
+    for track in trackers[0].tracked_stracks:
+        if not track.is_activated or track.mean is None:
+            continue
+
+        # Constant velocity extrapolation of the Kalman mean, on a copy of the track
+        predicted       = copy.copy(track)
+        predicted.mean  = track.mean.copy()
+        predicted.mean[:4] += predicted.mean[4:8] * steps
+
+        entry   = cls_cache.entries.get(track.track_id)
+        bbox    = [float(v) for v in predicted.xyxy]
+        detections.append({
+            "track_id": int(track.track_id),
+            "class_id": int(track.cls),
+            "name": detector.names[int(track.cls)],
+            "subclass": entry["name"] if entry is not None else "",
+            "bbox": region.to_frame(bbox) if region is not None else bbox,
+        })
+
+    return detections
+
+
+class StridedTracking:
+    """Run the detector every `stride` frames only. On the frames in between, boxes are predicted
+    from the tracker's motion model and the sub-classes are reused from the classification cache.
+
+    With `adaptive=True`, the stride is halved when many tracks are created or lost between two
+    detector runs (more than `churn_threshold` of the tracks), and grows back by one up to `stride`
+    when the scene is stable.
+    """
+
+    def __init__(
+        self,
+        detector: YOLO,
+        cls_cache: ClassificationCache,
+        stride: int = 1,
+        adaptive: bool = False,
+        churn_threshold: float = 0.3,
+        region: InferenceRegion | None = None
+    ):
+        self.detector           = detector
+        self.cls_cache          = cls_cache
+        self.max_stride         = max(stride, 1)
+        self.stride             = self.max_stride
+        self.adaptive           = adaptive
+        self.churn_threshold    = churn_threshold
+        self.region             = region
+        self.since_detection    = 0
+        self.last_interval      = 1
+        self.last_detections    = []
+        self.n_detected         = 0
+        self.n_predicted        = 0
+
+    def __call__(self, detect: Callable[[], list[dict]]) -> list[dict]:
+        """Return the detections of the next frame, calling `detect` if the detector has to run"""
+        if self.n_detected == 0 or self.since_detection >= self.stride:
+            detections = detect()
+            self._update_stride(detections)
+            self.last_interval      = max(self.since_detection, 1)
+            self.since_detection    = 1
+            self.last_detections    = detections
+            self.n_detected         += 1
+            return detections
+
+        # Tracker velocities are per tracker update, i.e. per `last_interval` frames
+        detections = predict_tracks(
+            self.detector, self.cls_cache, self.since_detection / self.last_interval, self.region
+        )
+        if detections is None:
+            detections = self.last_detections
+
+        self.since_detection    += 1
+        self.n_predicted        += 1
+        return detections
+
+    def _update_stride(self, detections: list[dict]):
+        if not self.adaptive or self.n_detected == 0:
+            return
+
+        prev_ids    = {det["track_id"] for det in self.last_detections}
+        curr_ids    = {det["track_id"] for det in detections}
+        churn       = len(prev_ids ^ curr_ids) / max(len(prev_ids | curr_ids), 1)
+
+        if churn > self.churn_threshold:
+            self.stride = max(self.stride // 2, 1)
+        else:
+            self.stride = min(self.stride + 1, self.max_stride)
 
-    cap = cv2.VideoCapture(video_path)
-    cap.set(cv2.CAP_PROP_POS_MSEC, frame_msecs)
-    ret, frame = cap.read()
-    frame_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-    return frame_img
+    def stats(self) -> dict:
+        return {
+            "detected_frames": self.n_detected,
+            "predicted_frames": self.n_predicted,
+            "stride": self.stride,
+        }
+
+
+def track_frame(
+    frame: np.ndarray,
+    detector: YOLO,
+    dish_classifier: YOLO,
+    tray_classifier: YOLO,
+    cls_cache: ClassificationCache | None = None,
+    frame_idx: int = 0,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    imgsz: tuple | int = 640,
+    device="cpu",
+    region: InferenceRegion | None = None,
+    timer: StageTimer | None = None
+) -> list[dict]:
+    """Detect and track objects in a frame, then classify them into sub-classes.
+    If `region` is given, only the regions of interest of the frame are fed to the detector.
+    If `timer` is given, the "detect_track" and "classify" stages are timed and the classifier calls counted.
+
+    Returns
+    -------
+    list[dict]
+        One dict per tracked object, with keys: track_id, class_id, name, subclass, bbox (xyxy, full-frame coordinates)
+    """
+    image = region.crop(frame) if region is not None else frame
+
+    with timed(timer, "detect_track"):
+        tracking_results = detector.track(
+            image, 
+            persist=True, 
+            conf=conf, 
+            iou=iou, 
+            imgsz=imgsz,
+            device=device
+        )
+
+    detections = []
+
+    if tracking_results[0].boxes.is_track and tracking_results[0].boxes is not None:
+        boxes       = tracking_results[0].boxes.xyxy
+        classes     = tracking_results[0].boxes.cls.int()
+        names       = [detector.names[i.item()] for i in  classes]
+        track_ids   = tracking_results[0].boxes.id.int().cpu().tolist()
+
+        # Classify all dishes and trays of the frame in one batch per classifier
+        with timed(timer, "classify"):
+            subclass_names = classify_boxes(
+                image, boxes, classes, dish_classifier, tray_classifier, device=device,
+                track_ids=track_ids, cache=cls_cache, frame_idx=frame_idx, timer=timer
+            )
+
+        for bbox, cls, name, subclass_name, track_id in zip(boxes, classes, names, subclass_names, track_ids):
+            bbox = bbox.cpu().tolist()
+            detections.append({
+                "track_id": track_id,
+                "class_id": int(cls),
+                "name": name,
+                "subclass": subclass_name,
+                "bbox": region.to_frame(bbox) if region is not None else bbox,
+            })
+
+    return detections
+
+
+def draw_detections(frame: np.ndarray, detections: list[dict], track_store: TrackStore, frame_idx: int | None = None) -> np.ndarray:
+    """Add the detections of the frame to the track store, then draw boxes, labels and tracking lines
+    on the frame in place. See `TrackStore.update` for `frame_idx`.
+    """
+    from ultralytics.utils.plotting import Annotator, colors
+
+    # Track centers of the boxes
+    track_store.update(detections, frame_idx)
+    polylines = track_store.polylines([det["track_id"] for det in detections])
+
+    # Initate an annotator to draw ion the frame
+    annotator = Annotator(frame, line_width=2, font_size=20)
+
+    for det, points in zip(detections, polylines):
+        # Draw bbox
+        track_color = colors(int(det["track_id"]), True)
+        annotator.box_label(box=det["bbox"], color=track_color, label=f"{det['name']}-{det['subclass']}")
+
+        # Draw tracking line
+        cv2.polylines(frame, [points], isClosed=False, color=track_color, thickness=5)
+
+    return frame
+
+
+def draw_stored_detections(frame: np.ndarray, store: DetectionStore, frame_idx: int, history_length: int = 30) -> np.ndarray:
+    """Draw the stored detections of a frame (counting from 0) on a copy of the RGB frame,
+    as they appear in the annotated video, with tracking lines from the previous frames.
+    """
+    track_store = TrackStore(history_length)
+    for prev_idx in range(max(frame_idx - history_length + 1, 0), frame_idx):
+        track_store.update(store[prev_idx], prev_idx)
+
+    # Boxes are drawn in BGR like in `process_video`
+    annotated = draw_detections(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), store[frame_idx], track_store, frame_idx)
+    return cv2.cvtColor(annotated, cv2.COLOR_BGR2RGB)
+
+
+def decode_frames(
+    cap: cv2.VideoCapture,
+    frame_queue: FrameQueue,
+    stop_event: threading.Event,
+    timer: StageTimer | None = None
+):
+    """Decoder stage: read frames from the capture into the queue"""
+    frame_idx = 0
+    try:
+        while not stop_event.is_set():
+            with timed(timer, "decode"):
+                has_frame, frame = cap.read()
+            if not has_frame:
+                break
+
+            frame_idx += 1
+            frame_queue.put((frame_idx, frame), stop_event)
+    finally:
+        frame_queue.put(END_OF_STREAM, stop_event)
+
+
+def encode_frames(
+    frame_queue: FrameQueue,
+    out: FFmpegWriter,
+    track_store: TrackStore,
+    stop_event: threading.Event,
+    timer: StageTimer | None = None
+):
+    """Drawing / encoding stage: annotate inferred frames and write them to the output"""
+    while True:
+        item = frame_queue.get(stop_event)
+        if item is END_OF_STREAM:
+            break
+
+        frame, detections = item
+        write_frame(out, frame, detections, track_store, timer)
+
+
+def write_frame(out: FFmpegWriter, frame: np.ndarray, detections: list[dict], track_store: TrackStore, timer: StageTimer | None = None):
+    with timed(timer, "draw"):
+        frame = draw_detections(frame, detections, track_store)
+    with timed(timer, "write"):
+        out.write(frame)
 
 
 def process_video(
@@ -53,75 +528,621 @@ def process_video(
     tray_classifier: YOLO,
     conf: float = 0.25,
     iou: float = 0.7,
-    device="cpu"
+    device="cpu",
+    reclassify_interval: int = 30,
+    reclassify_iou: float = 0.7,
+    reclassify_conf: float = 0.5,
+    pipeline: bool = False,
+    queue_size: int = 8,
+    encoder_preset: str = "medium",
+    encoder_crf: int = 23,
+    detect_stride: int = 1,
+    adaptive_stride: bool = False,
+    motion_threshold: float = 0.0,
+    motion_regions: list | None = None,
+    camera_config: CameraConfig | None = None,
+    output_detections: str | None = None,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    timer: StageTimer | None = None,
+    trace_path: str | None = None
 ):
-    cap     = cv2.VideoCapture(input_video)
-    width   = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height  = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps     = int(cap.get(cv2.CAP_PROP_FPS))
+    """Detect, track and classify objects in a video, then write the annotated video.
+
+    With `pipeline=True`, decoding, inference and drawing / encoding run as three stages
+    in separate threads connected by bounded queues of `queue_size` frames,
+    so that video I/O overlaps with model inference. Frame order is kept.
+
+    Annotated frames are piped to a single ffmpeg process that writes the H.264 `output_video`
+    directly, using `encoder_preset` and `encoder_crf`.
+
+    With `detect_stride` > 1, the detector only runs every `detect_stride` frames, see `StridedTracking`.
+    With `motion_threshold` > 0, frames without motion (inside `motion_regions` if given) reuse
+    the detections of the previous frame, see `MotionGate`.
+
+    `camera_config` sets the detector input resolution and the regions of interest fed to the detector,
+    see `InferenceRegion`. Its regions of interest are also used as motion regions if none are given.
+
+    If `output_detections` is given, the per-frame detections are also saved to this `.npz` file
+    (see `DetectionWriter`), e.g. to draw them again on single frames with `draw_stored_detections`.
+
+    `progress_callback(frames_processed, n_frames)` is called after each inferred frame.
+    Setting `cancel_event` stops the processing with a `ProcessingCancelled` exception.
+
+    The time spent in each stage (decode, motion, detect_track, classify, draw, write, ffmpeg) is
+    accumulated in `timer` and reported in `stats["stages"]`, and the processed frames, detections and
+    classifier calls in `stats["counters"]`. If `trace_path` is given, every timed stage is also saved
+    there as a Chrome trace JSON, see `ChromeTrace`.
+    """
+    start       = time.perf_counter()
+    timer       = timer if timer is not None else StageTimer()
+    trace       = ChromeTrace() if trace_path is not None else None
+    if trace is not None:
+        timer.hooks.append(trace)
+
+    cap         = cv2.VideoCapture(input_video)
+    width       = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height      = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps         = cap.get(cv2.CAP_PROP_FPS)
+    n_frames    = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
-    out     = cv2.VideoWriter(temp_video, cv2.VideoWriter_fourcc(*"MP4V"), fps, (width, height))
+    out         = FFmpegWriter(output_video, width, height, fps, preset=encoder_preset, crf=encoder_crf)
+    writer      = None
+    if output_detections is not None:
+        writer  = DetectionWriter(output_detections, video_stats={"n_frames": n_frames, "fps": fps})
 
-    track_history = defaultdict(lambda: [])
+    reset_tracker(detector)
 
-    # Iterate through the frames in the video
-    while True:
-        has_frame, frame = cap.read()
+    region          = InferenceRegion(width, height, camera_config)
+    motion_regions  = motion_regions or (camera_config.rois if camera_config is not None else None)
 
-        if not has_frame:
-            print("Done")
-            break
-        
-        # Initate an annotator to draw ion the frame
-        annotator           = Annotator(frame, line_width=2, font_size=20)
-        tracking_results    = detector.track(
-            frame, 
-            persist=True, 
-            conf=conf, 
-            iou=iou, 
-            imgsz=(width, height),
-            device=device
+    track_store   = TrackStore()
+    cls_cache     = ClassificationCache(reclassify_interval, reclassify_iou, reclassify_conf)
+    strided       = StridedTracking(detector, cls_cache, detect_stride, adaptive_stride, region=region)
+    motion_gate   = MotionGate(motion_threshold, regions=motion_regions) if motion_threshold > 0 else None
+    last_dets     = []
+    stats         = {}
+
+    def infer(frame, frame_idx):
+        nonlocal last_dets
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProcessingCancelled(f"Processing of {input_video} was cancelled")
+
+        is_static = False
+        if motion_gate is not None:
+            with timed(timer, "motion"):
+                is_static = motion_gate.is_static(frame)
+
+        if is_static:
+            detections = last_dets
+        else:
+            detections = strided(lambda: track_frame(
+                frame, detector, dish_classifier, tray_classifier, cls_cache, frame_idx,
+                conf=conf, iou=iou, imgsz=region.imgsz, device=device, region=region, timer=timer
+            ))
+            last_dets = detections
+
+        timer.count("frames")
+        timer.count("detections", len(detections))
+        if writer is not None:
+            writer.add_frame(frame_idx - 1, detections)
+
+        if progress_callback is not None:
+            progress_callback(frame_idx, n_frames)
+
+        return detections
+
+    if pipeline:
+        stop_event      = threading.Event()
+        decoded_queue   = FrameQueue("decoded", queue_size)
+        inferred_queue  = FrameQueue("inferred", queue_size)
+        decoder         = StageThread(
+            "decoder", lambda: decode_frames(cap, decoded_queue, stop_event, timer), stop_event
+        )
+        encoder         = StageThread(
+            "encoder", lambda: encode_frames(inferred_queue, out, track_store, stop_event, timer), stop_event
         )
+        decoder.start()
+        encoder.start()
 
-        if tracking_results[0].boxes.is_track and tracking_results[0].boxes is not None:
-            boxes       = tracking_results[0].boxes.xyxy
-            classes     = tracking_results[0].boxes.cls.int()
-            names       = [detector.names[i.item()] for i in  classes]
-            track_ids   = tracking_results[0].boxes.id.int().cpu().tolist()
-
-            # Iterate through tracking results, classify dish and tray
-            for bbox, cls, name, track_id in zip(boxes, classes, names, track_ids):
-                center_x = (bbox[0] + bbox[2]) // 2
-                center_y = (bbox[1] + bbox[3]) // 2
-                
-                # Track center of the box
-                track_history[track_id].append((center_x, center_y))
-                if len(track_history[track_id]) > 30:
-                    track_history[track_id].pop(0)
-
-                # Crop image using detected box to be fed into the classifiers
-                cropped = crop_image(frame, bbox)
-
-                if cls == 0:    # dish
-                    subclass = dish_classifier(cropped, device=device)
-                    subclass_name = dish_classifier.names[subclass[0].probs.top1]
-                elif cls == 1:  # tray
-                    subclass == tray_classifier(cropped, device=device)
-                    subclass_name = tray_classifier.names[subclass[0].probs.top1]
-                
-                # Draw bbox
-                track_color = colors(int(track_id), True)
-                annotator.box_label(box=bbox, color=track_color, label=f"{name}-{subclass_name}")
-
-                # Draw tracking line
-                points = np.hstack(track_history[track_id]).astype(np.int32).reshape((-1, 1, 2))
-                cv2.polylines(frame, [points], isClosed=False, color=track_color, thickness=5)
+        # Inference stage runs on the calling thread
+        try:
+            while True:
+                item = decoded_queue.get(stop_event)
+                if item is END_OF_STREAM:
+                    break
 
-        out.write(frame)
-    
-    out.release()
-    cap.release()
+                frame_idx, frame = item
+                inferred_queue.put((frame, infer(frame, frame_idx)), stop_event)
+        except BaseException:
+            stop_event.set()
+            raise
+        finally:
+            inferred_queue.put(END_OF_STREAM, stop_event)
+            decoder.join()
+            encoder.join()
+            with timed(timer, "ffmpeg"):
+                out.release()
+            cap.release()
+
+        decoder.raise_error()
+        encoder.raise_error()
+        print("Done")
+        stats["queues"] = {q.name: q.stats() for q in (decoded_queue, inferred_queue)}
+
+    else:
+        frame_idx = 0
+
+        # Iterate through the frames in the video
+        try:
+            while True:
+                with timed(timer, "decode"):
+                    has_frame, frame = cap.read()
+
+                if not has_frame:
+                    print("Done")
+                    break
+
+                frame_idx += 1
+                write_frame(out, frame, infer(frame, frame_idx), track_store, timer)
+        finally:
+            with timed(timer, "ffmpeg"):
+                out.release()
+            cap.release()
+
+    if writer is not None:
+        writer.close()
+
+    stats["classification_cache"] = cls_cache.stats()
+    stats["detection_stride"] = strided.stats()
+    stats["tracks"] = track_store.stats()
+    if motion_gate is not None:
+        stats["motion_gate"] = motion_gate.stats()
+    stats["stages"] = timer.summary()
+    stats["counters"] = timer.counter_summary()
+    stats["elapsed_s"] = time.perf_counter() - start
+
+    if trace is not None:
+        timer.hooks.remove(trace)
+        trace.save(trace_path)
+
+    print(f"Stats: {stats}")
+    return PredictionOutput(
+        output_video=output_video, detections_path=output_detections, trace_path=trace_path, stats=stats
+    )
+
+
+def iter_frame_detections(
+    input_video: str,
+    detector: YOLO, 
+    dish_classifier: YOLO, 
+    tray_classifier: YOLO,
+    start_frame: int = 0,
+    end_frame: int | None = None,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    device="cpu",
+    reclassify_interval: int = 30,
+    reclassify_iou: float = 0.7,
+    reclassify_conf: float = 0.5,
+    detect_stride: int = 1,
+    adaptive_stride: bool = False,
+    motion_threshold: float = 0.0,
+    motion_regions: list | None = None,
+    camera_config: CameraConfig | None = None,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    timer: StageTimer | None = None
+):
+    """Detect, track and classify objects in the frames [start_frame, end_frame) of a video,
+    without drawing or encoding anything. Frame indices count from 0.
+    See `StridedTracking` for `detect_stride` and `adaptive_stride`,
+    `MotionGate` for `motion_threshold` and `motion_regions`, and `process_video` for `camera_config`
+    and `timer`, which also counts the frames and detections.
+
+    Yields
+    ------
+    tuple[int, list[dict]]
+        Frame index and detections of the frame, in the format returned by `track_frame`
+    """
+    cap         = cv2.VideoCapture(input_video)
+    width       = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height      = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    n_frames    = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    end_frame   = n_frames if end_frame is None else min(end_frame, n_frames)
+
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    region          = InferenceRegion(width, height, camera_config)
+    motion_regions  = motion_regions or (camera_config.rois if camera_config is not None else None)
+
+    reset_tracker(detector)
+    cls_cache   = ClassificationCache(reclassify_interval, reclassify_iou, reclassify_conf)
+    strided     = StridedTracking(detector, cls_cache, detect_stride, adaptive_stride, region=region)
+    motion_gate = MotionGate(motion_threshold, regions=motion_regions) if motion_threshold > 0 else None
+    detections  = []
+
+    try:
+        for frame_idx in range(start_frame, end_frame):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessingCancelled(f"Processing of {input_video} was cancelled")
+
+            with timed(timer, "decode"):
+                has_frame, frame = cap.read()
+            if not has_frame:
+                break
+
+            # Static frames keep the detections of the previous frame
+            if motion_gate is None or not motion_gate.is_static(frame):
+                detections = strided(lambda: track_frame(
+                    frame, detector, dish_classifier, tray_classifier, cls_cache, frame_idx + 1,
+                    conf=conf, iou=iou, imgsz=region.imgsz, device=device, region=region, timer=timer
+                ))
+
+            if timer is not None:
+                timer.count("frames")
+                timer.count("detections", len(detections))
+
+            if progress_callback is not None:
+                progress_callback(frame_idx - start_frame + 1, end_frame - start_frame)
+
+            yield frame_idx, detections
+    finally:
+        cap.release()
+
+
+def detect_frames(input_video: str, detector: YOLO, dish_classifier: YOLO, tray_classifier: YOLO, **kwargs) -> list[list[dict]]:
+    """Detections of each frame in [start_frame, end_frame), see `iter_frame_detections` for the arguments"""
+    return [
+        detections for _, detections
+        in iter_frame_detections(input_video, detector, dish_classifier, tray_classifier, **kwargs)
+    ]
+
+
+def analyze_video(
+    input_video: str,
+    output_detections: str,
+    detector: YOLO, 
+    dish_classifier: YOLO, 
+    tray_classifier: YOLO,
+    write_ndjson: bool = True,
+    **kwargs
+) -> PredictionOutput:
+    """Analytics-only mode: detect, track and classify objects in a video and save the detections,
+    without drawing or encoding a video.
+
+    Detections are saved to the compact `.npz` file `output_detections`, and streamed frame by frame
+    to a `.ndjson` file next to it if `write_ndjson` is True. Use `render_detections` to render
+    the annotated video from the saved detections later.
+    See `iter_frame_detections` for the other arguments.
+    """
+    start       = time.perf_counter()
+    timer       = kwargs.pop("timer", None) or StageTimer()
+    stats       = get_video_stats(input_video)
+    ndjson_path = str(Path(output_detections).with_suffix(".ndjson")) if write_ndjson else None
+    writer      = DetectionWriter(output_detections, ndjson_path=ndjson_path, video_stats=stats)
+
+    try:
+        for frame_idx, detections in iter_frame_detections(
+            input_video, detector, dish_classifier, tray_classifier, timer=timer, **kwargs
+        ):
+            writer.add_frame(frame_idx, detections)
+    finally:
+        writer.close()
+
+    print("Done")
+    return PredictionOutput(
+        output_video="",
+        detections_path=output_detections,
+        detections_ndjson_path=ndjson_path,
+        stats={
+            "n_frames": writer.n_frames,
+            "n_detections": writer.n_detections,
+            "stages": timer.summary(),
+            "counters": timer.counter_summary(),
+            "elapsed_s": time.perf_counter() - start,
+        },
+    )
+
+
+def render_video(
+    input_video: str,
+    output_video: str,
+    detections: list[list[dict]],
+    encoder_preset: str = "medium",
+    encoder_crf: int = 23,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None
+) -> str:
+    """Draw per-frame detections on the frames of the input video and encode the result.
+    `detections[i]` holds the detections of the i-th frame (counting from 0).
+    """
+    cap         = cv2.VideoCapture(input_video)
+    width       = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height      = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps         = cap.get(cv2.CAP_PROP_FPS)
+    n_frames    = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    out         = FFmpegWriter(output_video, width, height, fps, preset=encoder_preset, crf=encoder_crf)
+
+    track_store   = TrackStore()
+    frame_idx     = 0
+
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessingCancelled(f"Rendering of {input_video} was cancelled")
+
+            has_frame, frame = cap.read()
+            if not has_frame:
+                break
+
+            frame_detections = detections[frame_idx] if frame_idx < len(detections) else []
+            out.write(draw_detections(frame, frame_detections, track_store))
+            frame_idx += 1
+
+            if progress_callback is not None:
+                progress_callback(frame_idx, n_frames)
+    finally:
+        out.release()
+        cap.release()
+
+    return output_video
+
+
+def render_detections(
+    input_video: str,
+    detections_path: str,
+    output_video: str,
+    **kwargs
+) -> PredictionOutput:
+    """Render the annotated video from detections saved by `analyze_video`.
+    See `render_video` for the other arguments.
+    """
+    render_video(input_video, output_video, load_detections(detections_path), **kwargs)
+    return PredictionOutput(output_video=output_video, detections_path=detections_path)
+
+
+DROP_POLICIES = ("drop_oldest", "latest", "adaptive_stride")
+
+
+class StreamStats:
+    """Latency and frame drop statistics of a live stream"""
+
+    def __init__(self, source_fps: float = 0.0):
+        self.source_fps     = source_fps
+        self.captured       = 0
+        self.processed      = 0
+        self.dropped        = 0
+        self.stride         = 1
+        self.latency_sum    = 0.0
+        self.latency_max    = 0.0
+        self.started_at     = time.monotonic()
+
+    def add_latency(self, latency: float):
+        self.processed      += 1
+        self.latency_sum    += latency
+        self.latency_max    = max(self.latency_max, latency)
+
+    def to_dict(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            "source_fps": self.source_fps,
+            "captured": self.captured,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "drop_rate": self.dropped / self.captured if self.captured > 0 else 0.0,
+            "processing_fps": self.processed / elapsed,
+            "mean_latency": self.latency_sum / self.processed if self.processed > 0 else 0.0,
+            "max_latency": self.latency_max,
+            "stride": self.stride,
+        }
+
+
+class LiveFrameReader:
+    """Read frames from a capture in a background thread into a bounded buffer.
+
+    When the buffer is full, the oldest frame is dropped so that the reader never waits for inference.
+    Video files are replayed at their native fps to stand in for a live camera.
+    """
+
+    def __init__(self, cap: cv2.VideoCapture, stats: StreamStats, buffer_size: int, realtime: bool, max_read_failures: int = 30):
+        self.cap                = cap
+        self.stats              = stats
+        self.buffer             = deque(maxlen=buffer_size)
+        self.realtime           = realtime
+        self.max_read_failures  = max_read_failures
+        self.condition          = threading.Condition()
+        self.stopped            = False
+        self.thread             = threading.Thread(target=self._run, name="stream-reader", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self):
+        frame_interval  = 1 / self.stats.source_fps if self.stats.source_fps > 0 else 0
+        next_time       = time.monotonic()
+        failures        = 0
+        frame_idx       = 0
+
+        while not self.stopped:
+            has_frame, frame = self.cap.read()
+
+            if not has_frame:
+                failures += 1
+                # Files end on the first failed read, live sources may recover
+                if self.realtime or failures >= self.max_read_failures:
+                    break
+                continue
+
+            failures    = 0
+            frame_idx   += 1
+
+            if self.realtime and frame_interval > 0:
+                next_time += frame_interval
+                time.sleep(max(next_time - time.monotonic(), 0))
+
+            with self.condition:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.stats.dropped += 1
+                self.buffer.append((frame_idx, time.monotonic(), frame))
+                self.stats.captured += 1
+                self.condition.notify_all()
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def next_frames(self, policy: str, stride: int = 1) -> list | None:
+        """Wait for new frames and take them from the buffer according to the drop policy.
+
+        Returns
+        -------
+        list | None
+            The (frame_idx, capture_time, frame) to process followed by the frames dropped in favor of it,
+            or None when the stream has ended
+        """
+        with self.condition:
+            while len(self.buffer) == 0 and not self.stopped:
+                self.condition.wait()
+
+            if len(self.buffer) == 0:
+                return None
+
+            if policy == "latest":
+                items = list(self.buffer)[::-1]
+                self.buffer.clear()
+            elif policy == "adaptive_stride":
+                items = [self.buffer.popleft()]
+                # Skip the next stride - 1 frames that are already buffered
+                while len(items) < stride and len(self.buffer) > 0:
+                    items.append(self.buffer.popleft())
+                items = [items[-1]] + items[:-1]
+            else:
+                items = [self.buffer.popleft()]
+
+            return items
+
+
+def open_source(source: str | int) -> tuple[cv2.VideoCapture, bool]:
+    """Open a video source that OpenCV can read: an RTSP / HTTP URL, a device index or a video file.
+
+    Returns
+    -------
+    tuple[cv2.VideoCapture, bool]
+        The capture, and whether the source is a local file
+    """
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+
+    is_file = isinstance(source, str) and Path(source).is_file()
+    cap     = cv2.VideoCapture(source)
+
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video source: {source}")
+
+    return cap, is_file
+
+
+def process_stream(
+    source: str | int,
+    detector: YOLO, 
+    dish_classifier: YOLO, 
+    tray_classifier: YOLO,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    device="cpu",
+    reclassify_interval: int = 30,
+    reclassify_iou: float = 0.7,
+    reclassify_conf: float = 0.5,
+    drop_policy: str = "latest",
+    buffer_size: int = 30,
+    realtime: bool | None = None,
+    draw: bool = True,
+    camera_config: CameraConfig | None = None
+):
+    """Process a live video source and yield the results frame by frame.
+
+    Frames are read in a background thread. When inference falls behind the source, frames are
+    dropped according to `drop_policy`:
+    - "drop_oldest": process frames in order, dropping the oldest ones when the buffer of `buffer_size` is full
+    - "latest": always process the most recent frame, dropping all older buffered frames
+    - "adaptive_stride": process every n-th frame, n being adapted so that inference keeps up with the source fps
+
+    Parameters
+    ----------
+    source : str | int
+        RTSP / HTTP URL, device index, or video file
+    realtime : bool | None, optional
+        Replay the source at its native fps. By default, only files are replayed in real time.
+    draw : bool, optional
+        Draw the detections on the yielded frames, by default True
+    camera_config : CameraConfig | None, optional
+        Detector input resolution and regions of interest, see `InferenceRegion`
+
+    Yields
+    ------
+    dict
+        With keys: frame_idx (counting from 1), frame, detections, latency (secs from capture to result),
+        and stats, the `StreamStats` of the whole stream
+    """
+    assert drop_policy in DROP_POLICIES, f"drop_policy must be one of {DROP_POLICIES}"
+
+    cap, is_file    = open_source(source)
+    width           = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height          = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    stats           = StreamStats(cap.get(cv2.CAP_PROP_FPS))
+    reader          = LiveFrameReader(cap, stats, buffer_size, is_file if realtime is None else realtime)
+    region          = InferenceRegion(width, height, camera_config)
+
+    reset_tracker(detector)
+    track_store     = TrackStore()
+    cls_cache       = ClassificationCache(reclassify_interval, reclassify_iou, reclassify_conf)
+    infer_time      = 0.0
+
+    reader.start()
+    try:
+        while True:
+            items = reader.next_frames(drop_policy, stats.stride)
+            if items is None:
+                break
+
+            frame_idx, capture_time, frame = items[0]
+            stats.dropped += len(items) - 1
+
+            start_time  = time.monotonic()
+            detections  = track_frame(
+                frame, detector, dish_classifier, tray_classifier, cls_cache, frame_idx,
+                conf=conf, iou=iou, imgsz=region.imgsz, device=device, region=region
+            )
+
+            if draw:
+                draw_detections(frame, detections, track_store)
+
+            # Exponential moving average of the inference time, used to adapt the stride
+            frame_time = time.monotonic() - start_time
+            infer_time = frame_time if infer_time == 0 else 0.9 * infer_time + 0.1 * frame_time
+            if drop_policy == "adaptive_stride" and stats.source_fps > 0:
+                stats.stride = max(1, int(np.ceil(infer_time * stats.source_fps)))
+
+            latency = time.monotonic() - capture_time
+            stats.add_latency(latency)
 
-    # Convert cv2 format to x264
-    subprocess.call(args=f"ffmpeg -y -i {temp_video} -c:v libx264 {output_video}".split(" "))
-    return PredictionOutput(output_video=output_video)
+            yield {
+                "frame_idx": frame_idx,
+                "frame": frame,
+                "detections": detections,
+                "latency": latency,
+                "stats": stats,
+            }
+    finally:
+        reader.stop()
+        cap.release()
+        print(f"Stream stats: {stats.to_dict()}")
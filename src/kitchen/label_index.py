@@ -0,0 +1,255 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from kitchen.datasets import find_label_sources
+from kitchen.visual_tasks import parse_yolo_labels
+from utils.file_tools import read_json_file, write_json_file
+
+
+INDEX_VERSION = 1
+
+# One row per box. Boxes are xyxy normalized by the image size, like the YOLO labels they come from
+LABEL_DTYPE = np.dtype([
+    ("image_id", np.int32),
+    ("class_id", np.int32),
+    ("xyxy", np.float32, (4,)),
+])
+
+
+def _image_size(image_path: str) -> tuple[int, int]:
+    """(width, height) read from the image header, or (0, 0) if the image can not be read"""
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError:
+        return (0, 0)
+
+
+class LabelIndex:
+    """All the YOLO labels of a dataset directory, parsed once into a memory-mapped array.
+
+    The label files and images are found with `find_label_sources`. The index is stored in
+    `<cache_dir>/labels.npy` (rows of `LABEL_DTYPE`) and `<cache_dir>/index.json` (the images, the
+    modification time and size of their label files, their image size and their rows). `refresh`,
+    called when the index is opened, only parses again the label files that changed since.
+
+    Example
+    -------
+    >>> index = LabelIndex("data/detection", names={0: "dish", 1: "tray"})
+    >>> index.stats()
+    >>> index.validate()
+    >>> class_ids, boxes = index.image_boxes("train_img_000001", pixels=True)
+    """
+
+    def __init__(self, source_dir: Path | str, cache_dir: Path | str | None = None, names: dict[int, str] | None = None):
+        self.source_dir = Path(source_dir)
+        self.cache_dir  = Path(cache_dir) if cache_dir is not None else self.source_dir / ".label_index"
+        self.names      = names
+        self.refresh()
+
+    @property
+    def labels_path(self) -> Path:
+        return self.cache_dir / "labels.npy"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.cache_dir / "index.json"
+
+    def _load(self):
+        meta        = read_json_file(self.meta_path)
+        self.images = meta["images"]
+        self.keys   = {image["key"]: image_id for image_id, image in enumerate(self.images)}
+        # An empty array can not be memory-mapped
+        n_rows      = sum(image["count"] for image in self.images)
+        self.labels = np.load(self.labels_path, mmap_mode="r" if n_rows > 0 else None)
+
+        self.image_sizes = np.array(
+            [(image["width"], image["height"]) for image in self.images], dtype=np.float32
+        ).reshape(-1, 2)
+
+    def refresh(self) -> bool:
+        """Update the index with the label files added, changed or deleted since it was built.
+        Returns whether it was updated.
+        """
+        sources = find_label_sources(self.source_dir)
+        for source in sources:
+            stat                = os.stat(source["label_path"])
+            source["signature"] = [stat.st_mtime_ns, stat.st_size]
+
+        previous = {}
+        if self.meta_path.exists() and self.labels_path.exists():
+            if read_json_file(self.meta_path).get("version") == INDEX_VERSION:
+                self._load()
+                previous = {image["key"]: image for image in self.images}
+
+        if [(s["key"], s["signature"]) for s in sources] == [(key, image["signature"]) for key, image in previous.items()]:
+            return False
+
+        images      = []
+        chunks      = []
+        start       = 0
+        n_parsed    = 0
+        for image_id, source in enumerate(sources):
+            image = previous.get(source["key"])
+
+            if image is not None and image["signature"] == source["signature"]:
+                rows = np.array(self.labels[image["start"]:image["start"] + image["count"]])
+                rows["image_id"] = image_id
+                image = dict(image)
+            else:
+                rows    = np.zeros(0, dtype=LABEL_DTYPE)
+                error   = None
+                try:
+                    with open(source["label_path"], "r", encoding="utf-8") as f:
+                        class_ids, yolo_boxes = parse_yolo_labels(f.read())
+                    rows                = np.zeros(len(class_ids), dtype=LABEL_DTYPE)
+                    rows["image_id"]    = image_id
+                    rows["class_id"]    = class_ids
+                    rows["xyxy"]        = np.hstack([
+                        yolo_boxes[:, :2] - yolo_boxes[:, 2:] / 2, yolo_boxes[:, :2] + yolo_boxes[:, 2:] / 2
+                    ])
+                except ValueError as e:
+                    error = f"{source['label_path']}: {e}"
+
+                width, height = _image_size(source["image_path"])
+                image = {
+                    "key": source["key"],
+                    "label_path": source["label_path"],
+                    "image_path": source["image_path"],
+                    "signature": source["signature"],
+                    "width": width,
+                    "height": height,
+                    "error": error,
+                }
+                n_parsed += 1
+
+            image["start"], image["count"] = start, len(rows)
+            start += len(rows)
+            images.append(image)
+            chunks.append(rows)
+
+        # Write next to the index, then swap, so that readers never see a half-written index
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        labels      = np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=LABEL_DTYPE)
+        tmp_path    = self.labels_path.with_suffix(".tmp.npy")
+        np.save(tmp_path, labels)
+        os.replace(tmp_path, self.labels_path)
+        write_json_file({"version": INDEX_VERSION, "images": images}, self.meta_path)
+
+        print(f"Indexed {len(images)} label files of {self.source_dir} ({n_parsed} parsed)")
+        self._load()
+        return True
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def n_images(self) -> int:
+        return len(self.images)
+
+    def boxes(self, pixels: bool = False) -> np.ndarray:
+        """(N, 4) xyxy boxes of all the labels, normalized or in pixels (NaN if the image size is unknown)"""
+        boxes = np.asarray(self.labels["xyxy"], dtype=np.float32)
+        if not pixels:
+            return boxes
+        sizes = self.image_sizes[self.labels["image_id"]]
+        sizes = np.where(sizes > 0, sizes, np.nan)
+        return boxes * np.tile(sizes, 2)
+
+    def box_sizes(self, pixels: bool = False) -> np.ndarray:
+        """(N, 2) widths and heights of all the boxes"""
+        boxes = self.boxes(pixels)
+        return boxes[:, 2:] - boxes[:, :2]
+
+    def class_counts(self) -> dict:
+        """Number of boxes per class, by name if the index has `names`"""
+        counts = np.bincount(self.labels["class_id"]) if len(self) > 0 else np.zeros(0, dtype=int)
+        return {
+            (self.names.get(class_id, class_id) if self.names else class_id): int(count)
+            for class_id, count in enumerate(counts) if count > 0
+        }
+
+    def boxes_per_image(self) -> np.ndarray:
+        return np.array([image["count"] for image in self.images], dtype=np.int64)
+
+    def image_boxes(self, key: str, pixels: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """Class ids and xyxy boxes of an image"""
+        image   = self.images[self.keys[key]]
+        rows    = self.labels[image["start"]:image["start"] + image["count"]]
+        boxes   = np.asarray(rows["xyxy"], dtype=np.float32)
+        if pixels:
+            boxes = boxes * np.array([image["width"], image["height"]] * 2, dtype=np.float32)
+        return np.asarray(rows["class_id"]), boxes
+
+    def images_with_class(self, class_id: int) -> list[str]:
+        """Keys of the images with at least one box of a class"""
+        image_ids = np.unique(self.labels["image_id"][self.labels["class_id"] == class_id])
+        return [self.images[image_id]["key"] for image_id in image_ids]
+
+    def stats(self) -> dict:
+        """Number of images and boxes, boxes per class, and 5% / 50% / 95% quantiles of the box sizes in pixels"""
+        per_image   = self.boxes_per_image()
+        stats       = {
+            "n_images": self.n_images,
+            "n_boxes": len(self),
+            "n_empty_images": int((per_image == 0).sum()),
+            "max_boxes_per_image": int(per_image.max()) if self.n_images > 0 else 0,
+            "class_counts": self.class_counts(),
+        }
+
+        box_sizes = self.box_sizes(pixels=True)
+        if np.isfinite(box_sizes).any():
+            quantiles = [0.05, 0.5, 0.95]
+            for axis, name in enumerate(["box_width_px", "box_height_px"]):
+                stats[name] = dict(zip(quantiles, np.nanquantile(box_sizes[:, axis], quantiles).round(1).tolist()))
+        return stats
+
+    def validate(self, min_size: float = 0.0) -> list[dict]:
+        """Problems of the labels, as dicts with keys: key, row (index of the box in its label file, or None), issue.
+
+        Issues: unparsable label file, unreadable image, box outside the image, box with a width or height
+        of at most `min_size` (normalized), class not in `names`, duplicated box.
+        """
+        issues = [
+            {"key": image["key"], "row": None, "issue": "unparsable labels"}
+            for image in self.images if image["error"] is not None
+        ]
+        issues += [
+            {"key": image["key"], "row": None, "issue": "unreadable image"}
+            for image in self.images if image["width"] == 0
+        ]
+        if len(self) == 0:
+            return issues
+
+        boxes       = self.boxes()
+        sizes       = boxes[:, 2:] - boxes[:, :2]
+        image_ids   = np.asarray(self.labels["image_id"])
+        class_ids   = np.asarray(self.labels["class_id"])
+        eps         = 1e-4
+        checks      = {
+            "outside the image": ((boxes < -eps) | (boxes > 1 + eps)).any(axis=1),
+            "too small": (sizes <= min_size).any(axis=1),
+        }
+        if self.names:
+            checks["unknown class"] = ~np.isin(class_ids, list(self.names))
+
+        # Same image, class and (rounded) coordinates as an earlier row
+        keys            = np.column_stack([image_ids, class_ids, (boxes * 1e4).round().astype(np.int64)])
+        _, first_rows   = np.unique(keys, axis=0, return_index=True)
+        duplicated      = np.ones(len(self), dtype=bool)
+        duplicated[first_rows] = False
+        checks["duplicate"] = duplicated
+
+        starts = np.array([image["start"] for image in self.images], dtype=np.int64)
+        for issue, mask in checks.items():
+            for row in np.flatnonzero(mask):
+                image_id = image_ids[row]
+                issues.append({
+                    "key": self.images[image_id]["key"],
+                    "row": int(row - starts[image_id]),
+                    "issue": issue,
+                })
+        return issues
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap motion detector used to skip the models on static frames.
+
+    Frames are converted to grayscale, downscaled to `scale_width` pixels wide and blurred,
+    then compared with the last frame that passed the gate. A frame is static when the fraction
+    of pixels that changed by more than `pixel_threshold` is below `threshold`.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Fraction of changed pixels (0 to 1) above which the frame is considered moving, by default 0.01
+    pixel_threshold : int, optional
+        Minimum absolute grayscale difference for a pixel to count as changed, by default 25
+    scale_width : int, optional
+        Width of the downscaled frames, by default 160
+    regions : list[list[list[float]]] | None, optional
+        Polygons in full-frame pixel coordinates, e.g. [[[x1, y1], [x2, y2], [x3, y3], ...]].
+        If given, only motion inside these regions is considered.
+    max_static_frames : int, optional
+        Let a frame through after this many consecutive static frames, by default 300. 0 means no limit.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.01,
+        pixel_threshold: int = 25,
+        scale_width: int = 160,
+        regions: list[list[list[float]]] | None = None,
+        max_static_frames: int = 300
+    ):
+        self.threshold          = threshold
+        self.pixel_threshold    = pixel_threshold
+        self.scale_width        = scale_width
+        self.regions            = regions
+        self.max_static_frames  = max_static_frames
+        self.reference          = None
+        self.mask               = None
+        self.static_run         = 0
+        self.n_gated            = 0
+        self.n_passed           = 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height, width   = frame.shape[:2]
+        scale           = self.scale_width / width
+        small_size      = (self.scale_width, max(int(round(height * scale)), 1))
+
+        gray    = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small   = cv2.resize(gray, small_size, interpolation=cv2.INTER_AREA)
+        small   = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self.mask is None and self.regions:
+            self.mask = np.zeros(small.shape, dtype=np.uint8)
+            polygons  = [np.round(np.array(region, dtype=np.float32) * scale).astype(np.int32) for region in self.regions]
+            cv2.fillPoly(self.mask, polygons, 1)
+
+        return small
+
+    def changed_fraction(self, small: np.ndarray) -> float:
+        changed = cv2.absdiff(small, self.reference) > self.pixel_threshold
+
+        if self.mask is not None:
+            area = int(self.mask.sum())
+            return float(np.count_nonzero(changed & (self.mask > 0))) / area if area > 0 else 0.0
+
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def is_static(self, frame: np.ndarray) -> bool:
+        """Return True if nothing changed since the last frame that passed the gate"""
+        small = self._prepare(frame)
+
+        static = (
+            self.reference is not None
+            and self.changed_fraction(small) < self.threshold
+            and (self.max_static_frames == 0 or self.static_run < self.max_static_frames)
+        )
+
+        if static:
+            self.static_run += 1
+            self.n_gated    += 1
+        else:
+            self.reference  = small
+            self.static_run = 0
+            self.n_passed   += 1
+
+        return static
+
+    def stats(self) -> dict:
+        total = self.n_gated + self.n_passed
+        return {
+            "gated_frames": self.n_gated,
+            "passed_frames": self.n_passed,
+            "gated_rate": self.n_gated / total if total > 0 else 0.0,
+        }
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import cv2
+import numpy as np
+
+from kitchen.camera import InferenceRegion
+from kitchen.detections import DetectionWriter
+from kitchen.encoder import FFmpegWriter
+from kitchen.inference import (
+    ClassificationCache,
+    LiveFrameReader,
+    ProcessingCancelled,
+    StreamStats,
+    classify_boxes,
+    decode_frames,
+    draw_detections,
+    open_source,
+)
+from kitchen.pipeline import END_OF_STREAM, FrameQueue, StageThread
+from kitchen.profiling import StageTimer, timed
+from kitchen.tracks import TrackStore
+from utils.schemas import CameraConfig
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+
+OUTPUT_MODES = ("video", "detections")
+
+# Returned by `CameraStream.next_frame` when a live camera has no new frame yet
+NO_FRAME = object()
+
+
+def make_tracker(tracker: str = "botsort.yaml", device="cpu"):
+    """Create a tracker from an Ultralytics tracker config, like the one `detector.track` keeps on its predictor.
+
+    ReID on the detector's own features (`model: auto`) needs the features of `track`,
+    which a batched `predict` does not expose, so it is disabled.
+    """
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import YAML, IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+
+    cfg         = IterableSimpleNamespace(**YAML.load(check_yaml(tracker)))
+    cfg.device  = device
+    if getattr(cfg, "with_reid", False) and getattr(cfg, "model", "auto") == "auto":
+        cfg.with_reid = False
+
+    return TRACKER_MAP[cfg.tracker_type](args=cfg)
+
+
+class CameraStream:
+    """One source of `process_cameras`: its frame reader, tracker and classification state, and output.
+
+    The detector runs at the `imgsz` of the camera config, else at `imgsz`, or else at the native resolution.
+    Local files are decoded in a background thread into a bounded queue and processed frame by frame.
+    Live sources (URL, device index, or files with `realtime`) are read by a `LiveFrameReader`,
+    and only their latest frame is processed, the older ones being dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source: str | int,
+        output_dir: str,
+        output_mode: str = "video",
+        camera_config: CameraConfig | None = None,
+        imgsz: int | None = 640,
+        tracker: str = "botsort.yaml",
+        device="cpu",
+        realtime: bool | None = None,
+        buffer_size: int = 30,
+        max_frames: int | None = None,
+        reclassify_interval: int = 30,
+        reclassify_iou: float = 0.7,
+        reclassify_conf: float = 0.5,
+        encoder_preset: str = "medium",
+        encoder_crf: int = 23
+    ):
+        assert output_mode in OUTPUT_MODES, f"output_mode must be one of {OUTPUT_MODES}"
+        self.name           = name
+        self.cap, is_file   = open_source(source)
+        self.width          = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height         = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps            = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.live           = not is_file or bool(realtime)
+        self.max_frames     = max_frames
+        self.stats          = StreamStats(self.fps)
+        self.region         = InferenceRegion(self.width, self.height, camera_config)
+        # A size shared by the cameras lets their frames go through the detector in the same batch
+        has_imgsz           = camera_config is not None and camera_config.imgsz is not None
+        self.imgsz          = self.region.imgsz if has_imgsz or imgsz is None else imgsz
+        self.tracker        = make_tracker(tracker, device)
+        self.cls_cache      = ClassificationCache(reclassify_interval, reclassify_iou, reclassify_conf)
+        self.track_store    = TrackStore()
+        self.stop_event     = threading.Event()
+        self.n_frames       = 0
+        self.n_detections   = 0
+        self.finished       = False
+
+        if self.live:
+            self.reader = LiveFrameReader(self.cap, self.stats, buffer_size, realtime=is_file)
+        else:
+            self.frame_queue    = FrameQueue(f"{name}-frames", buffer_size)
+            self.reader         = StageThread(
+                f"{name}-decoder", partial(decode_frames, self.cap, self.frame_queue, self.stop_event), self.stop_event
+            )
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if output_mode == "video":
+            self.output_path    = str(output_dir / f"{name}.mp4")
+            self.out            = FFmpegWriter(
+                self.output_path, self.width, self.height, self.fps, preset=encoder_preset, crf=encoder_crf
+            )
+        else:
+            self.output_path    = str(output_dir / f"{name}.npz")
+            self.out            = DetectionWriter(self.output_path, video_stats={
+                "width": self.width, "height": self.height, "fps": self.fps, "source": str(source)
+            })
+
+    def start(self):
+        self.reader.start()
+
+    def next_frame(self):
+        """The next (frame_idx counting from 1, capture time, frame) to process, `NO_FRAME` if a live camera has
+        no new frame yet, or None when the source has ended
+        """
+        if self.max_frames is not None and self.n_frames >= self.max_frames:
+            return None
+
+        if not self.live:
+            item = self.frame_queue.get(self.stop_event)
+            if item is END_OF_STREAM:
+                self.reader.raise_error()
+                return None
+            frame_idx, frame = item
+            return frame_idx, time.monotonic(), frame
+
+        # Only this thread takes frames from the buffer: if it is not empty, `next_frames` does not wait
+        if len(self.reader.buffer) == 0 and not self.reader.stopped:
+            return NO_FRAME
+        items = self.reader.next_frames("latest")
+        if items is None:
+            return None
+        self.stats.dropped += len(items) - 1
+        return items[0]
+
+    def track(
+        self,
+        result,
+        image: np.ndarray,
+        frame_idx: int,
+        dish_classifier: YOLO,
+        tray_classifier: YOLO,
+        device="cpu",
+        timer: StageTimer | None = None
+    ) -> list[dict]:
+        """Update the camera's tracker with the detector result of its frame, then classify the tracked boxes.
+        Returns the detections in the format of `track_frame`.
+        """
+        with timed(timer, "track"):
+            tracks = self.tracker.update(result.boxes.cpu().numpy(), image)
+        if len(tracks) == 0:
+            return []
+
+        # Rows of `tracks`: x1, y1, x2, y2, track_id, score, class, index of the detection
+        boxes       = tracks[:, :4]
+        track_ids   = tracks[:, 4].astype(int).tolist()
+        classes     = tracks[:, 6].astype(int).tolist()
+
+        with timed(timer, "classify"):
+            subclass_names = classify_boxes(
+                image, boxes, classes, dish_classifier, tray_classifier, device=device,
+                track_ids=track_ids, cache=self.cls_cache, frame_idx=frame_idx, timer=timer
+            )
+
+        detections = []
+        for bbox, cls, subclass_name, track_id in zip(boxes.tolist(), classes, subclass_names, track_ids):
+            detections.append({
+                "track_id": track_id,
+                "class_id": cls,
+                "name": result.names[cls],
+                "subclass": subclass_name,
+                "bbox": bbox if self.region.full_frame else self.region.to_frame(bbox),
+            })
+        return detections
+
+    def write(self, frame_idx: int, frame: np.ndarray, detections: list[dict], timer: StageTimer | None = None):
+        self.n_frames       += 1
+        self.n_detections   += len(detections)
+
+        if isinstance(self.out, DetectionWriter):
+            self.out.add_frame(frame_idx - 1, detections)
+            return
+
+        with timed(timer, "draw"):
+            draw_detections(frame, detections, self.track_store)
+        with timed(timer, "write"):
+            self.out.write(frame)
+
+    def close(self):
+        """Stop reading the source and finalize its output"""
+        self.finished = True
+        self.stop_event.set()
+        if self.live:
+            self.reader.stop()
+        elif self.reader.is_alive():
+            self.reader.join()
+        self.cap.release()
+
+        if isinstance(self.out, DetectionWriter):
+            self.out.close()
+        else:
+            self.out.release()
+
+    def summary(self) -> dict:
+        return {
+            "output_path": self.output_path,
+            "n_frames": self.n_frames,
+            "n_detections": self.n_detections,
+            "stream": self.stats.to_dict(),
+            "tracks": self.track_store.stats(),
+            "classification_cache": self.cls_cache.stats(),
+        }
+
+
+def process_cameras(
+    sources: dict[str, str | int],
+    output_dir: str,
+    detector: YOLO,
+    dish_classifier: YOLO,
+    tray_classifier: YOLO,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    device="cpu",
+    output_mode: str = "video",
+    camera_configs: dict[str, CameraConfig] | None = None,
+    max_batch: int = 8,
+    cancel_event: threading.Event | None = None,
+    timer: StageTimer | None = None,
+    **camera_kwargs
+) -> dict:
+    """Detect, track and classify objects on several cameras at once, with one detector call per batch of frames.
+
+    Each round takes the next frame of every camera that has one (all the local files, and the live sources
+    with a new frame) and runs the detector on them in batches of up to `max_batch` frames. Cameras share
+    the detector input size `imgsz` (passed to each `CameraStream`) unless their config sets another one,
+    in which case they are batched separately. The results are routed back to each camera's own tracker, classification cache
+    and output: `<output_dir>/<camera>.mp4` with `output_mode="video"`, or `<camera>.npz` with "detections".
+
+    Parameters
+    ----------
+    sources : dict[str, str | int]
+        Camera name to source: video file, RTSP / HTTP URL or device index
+    camera_configs : dict[str, CameraConfig] | None, optional
+        Detector input size and regions of interest of the cameras, see `InferenceRegion`
+    max_batch : int, optional
+        Maximum number of frames per detector call, by default 8
+    camera_kwargs
+        Passed to each `CameraStream`: imgsz, tracker, realtime, buffer_size, max_frames, reclassify_*, encoder_*
+
+    Returns
+    -------
+    dict
+        With keys: cameras (the summary of each camera), stages and counters (see `StageTimer`), elapsed_s
+    """
+    start           = time.perf_counter()
+    timer           = timer if timer is not None else StageTimer()
+    camera_configs  = camera_configs or {}
+    cameras         = [
+        CameraStream(
+            name, source, output_dir, output_mode, camera_configs.get(name), device=device, **camera_kwargs
+        )
+        for name, source in sources.items()
+    ]
+
+    for camera in cameras:
+        camera.start()
+
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessingCancelled("Processing of the cameras was cancelled")
+
+            active = [camera for camera in cameras if not camera.finished]
+            if len(active) == 0:
+                break
+
+            # Group the frames of this round by detector input size, so that each group is one batched call
+            groups = {}
+            for camera in active:
+                item = camera.next_frame()
+                if item is None:
+                    camera.close()
+                elif item is not NO_FRAME:
+                    imgsz = camera.imgsz if isinstance(camera.imgsz, int) else tuple(camera.imgsz)
+                    groups.setdefault(imgsz, []).append((camera, item))
+
+            if len(groups) == 0:
+                # Only live cameras without a new frame
+                time.sleep(0.002)
+                continue
+
+            for imgsz, group in groups.items():
+                for batch_start in range(0, len(group), max_batch):
+                    batch   = group[batch_start:batch_start + max_batch]
+                    images  = [camera.region.crop(frame) for camera, (_, _, frame) in batch]
+
+                    with timed(timer, "detect"):
+                        results = detector.predict(
+                            images, conf=conf, iou=iou, imgsz=imgsz, device=device, verbose=False
+                        )
+                    timer.count("detector_calls")
+                    timer.count("batched_frames", len(images))
+
+                    for (camera, (frame_idx, capture_time, frame)), image, result in zip(batch, images, results):
+                        detections = camera.track(
+                            result, image, frame_idx, dish_classifier, tray_classifier, device=device, timer=timer
+                        )
+                        camera.write(frame_idx, frame, detections, timer=timer)
+                        camera.stats.add_latency(time.monotonic() - capture_time)
+                        timer.count("frames")
+                        timer.count("detections", len(detections))
+    finally:
+        for camera in cameras:
+            if not camera.finished:
+                camera.close()
+
+    summary = {
+        "cameras": {camera.name: camera.summary() for camera in cameras},
+        "stages": timer.summary(),
+        "counters": timer.counter_summary(),
+        "elapsed_s": time.perf_counter() - start,
+    }
+    print(f"Processed {len(cameras)} cameras: {summary['counters']}")
+    return summary
@@ -0,0 +1,83 @@
+import queue
+import threading
+
+
+# Marker put into a queue to tell the next stage that there are no more frames
+END_OF_STREAM = None
+
+
+class FrameQueue(queue.Queue):
+    """Bounded FIFO queue connecting two pipeline stages.
+
+    `put` blocks while the queue is full, which applies backpressure to the producer stage.
+    Both `put` and `get` give up when `stop_event` is set, so that a failing stage
+    does not leave the other stages blocked forever.
+    The depth of the queue is recorded on every `put` to be reported after the run.
+    """
+
+    def __init__(self, name: str, maxsize: int, poll_interval: float = 0.1):
+        super().__init__(maxsize=maxsize)
+        self.name           = name
+        self.poll_interval  = poll_interval
+        self.n_puts         = 0
+        self.depth_sum      = 0
+        self.depth_max      = 0
+        self.full_waits     = 0
+
+    def put(self, item, stop_event: threading.Event | None = None) -> bool:
+        depth = self.qsize()
+        self.n_puts     += 1
+        self.depth_sum  += depth
+        self.depth_max  = max(self.depth_max, depth)
+
+        if self.full():
+            self.full_waits += 1
+
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            try:
+                super().put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+
+    def get(self, stop_event: threading.Event | None = None):
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return END_OF_STREAM
+            try:
+                return super().get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+
+    def stats(self) -> dict:
+        return {
+            "maxsize": self.maxsize,
+            "mean_depth": self.depth_sum / self.n_puts if self.n_puts > 0 else 0.0,
+            "max_depth": self.depth_max,
+            "full_waits": self.full_waits,
+        }
+
+
+class StageThread(threading.Thread):
+    """Run a pipeline stage in a background thread.
+    An exception raised by the stage sets `stop_event` and is re-raised by `raise_error`.
+    """
+
+    def __init__(self, name: str, target, stop_event: threading.Event):
+        super().__init__(name=name, daemon=True)
+        self.stage_target   = target
+        self.stop_event     = stop_event
+        self.error          = None
+
+    def run(self):
+        try:
+            self.stage_target()
+        except BaseException as e:
+            self.error = e
+            self.stop_event.set()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Pipeline stage '{self.name}' failed") from self.error
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable
+
+
+# Upper bounds in secs of the stage latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageTimer:
+    """Accumulate the wall time spent in each processing stage (decode, detect_track, classify, ...),
+    as totals and latency histograms, along with event counters (frames, detections, ...).
+
+    Stages can be timed from several threads, e.g. the decoder and encoder threads of the pipeline mode.
+    Each hook is called as `hook(stage, start, secs)` after every timed stage, `start` being a
+    `time.perf_counter()` value, see `ChromeTrace`.
+
+    Example
+    -------
+    >>> timer = StageTimer()
+    >>> with timer.stage("decode"):
+    ...     has_frame, frame = cap.read()
+    >>> timer.count("frames")
+    >>> timer.summary()
+    """
+
+    def __init__(self, hooks: list[Callable[[str, float, float], None]] | None = None, buckets: tuple = LATENCY_BUCKETS):
+        self.hooks      = list(hooks or [])
+        self.buckets    = buckets
+        self.totals     = defaultdict(float)
+        self.counts     = defaultdict(int)
+        self.maxima     = defaultdict(float)
+        self.histograms = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self.counters   = defaultdict(int)
+        self.lock       = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start)
+
+    def add(self, name: str, secs: float, start: float | None = None):
+        with self.lock:
+            self.totals[name]   += secs
+            self.counts[name]   += 1
+            self.maxima[name]   = max(self.maxima[name], secs)
+            self.histograms[name][bisect_left(self.buckets, secs)] += 1
+
+        if start is not None:
+            for hook in self.hooks:
+                hook(name, start, secs)
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self) -> dict:
+        """Per stage: number of calls, total secs, mean and max latency in msecs,
+        and the number of calls in each latency bucket (the last one being over the largest bound)
+        """
+        with self.lock:
+            return {
+                name: {
+                    "count": self.counts[name],
+                    "total_s": self.totals[name],
+                    "mean_ms": self.totals[name] * 1000 / self.counts[name],
+                    "max_ms": self.maxima[name] * 1000,
+                    "buckets": list(self.histograms[name]),
+                }
+                for name in self.totals
+            }
+
+    def counter_summary(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+
+def timed(timer: StageTimer | None, name: str):
+    """`timer.stage(name)`, or a no-op context if `timer` is None"""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+class ChromeTrace:
+    """`StageTimer` hook recording each timed stage as a trace event, one row per thread.
+    The saved JSON opens in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.origin     = time.perf_counter()
+        self.events     = []
+        self.threads    = {}
+        self.lock       = threading.Lock()
+
+    def __call__(self, name: str, start: float, secs: float):
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": secs * 1e6,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+            })
+
+    def save(self, output_path: Path | str):
+        thread_names = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in self.threads.items()
+        ]
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": thread_names + self.events, "displayTimeUnit": "ms"}, f)
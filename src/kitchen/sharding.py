@@ -0,0 +1,225 @@
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import cv2
+from pathlib import Path
+
+from kitchen.detections import DetectionWriter
+from kitchen.inference import get_video_stats, render_video
+from kitchen.visual_tasks import box_iou
+from kitchen.workers import ModelWorkerPool
+from utils.schemas import CameraConfig, PredictionOutput
+
+
+def split_segments(n_frames: int, n_segments: int, overlap: int) -> list[tuple[int, int]]:
+    """Split the frames [0, n_frames) into segments of about equal length.
+    Every segment except the first starts `overlap` frames before the end of the previous one.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        List of (start_frame, end_frame), end frame excluded
+    """
+    # Keep each segment longer than the overlap, so that it can be matched with the next one
+    n_segments  = max(1, min(n_segments, n_frames // (2 * overlap + 1)))
+    boundaries  = [round(i * n_frames / n_segments) for i in range(n_segments + 1)]
+
+    segments = []
+    for i in range(n_segments):
+        start = max(boundaries[i] - overlap, 0) if i > 0 else 0
+        segments.append((start, boundaries[i + 1]))
+
+    return segments
+
+
+def match_overlap_tracks(prev_frames: list[list[dict]], next_frames: list[list[dict]], min_iou: float = 0.5) -> dict:
+    """Match the track IDs of two segments using the frames they have in common.
+
+    In each overlap frame, boxes of the same class are greedily paired by IoU,
+    then each track of the next segment is mapped to the previous track it was paired with most often.
+
+    Returns
+    -------
+    dict
+        Mapping of next segment track ID to previous segment track ID
+    """
+    votes = Counter()
+
+    for prev_dets, next_dets in zip(prev_frames, next_frames):
+        pairs = [
+            (box_iou(prev_det["bbox"], next_det["bbox"]), prev_det["track_id"], next_det["track_id"])
+            for prev_det in prev_dets
+            for next_det in next_dets
+            if prev_det["class_id"] == next_det["class_id"]
+        ]
+
+        used_prev, used_next = set(), set()
+        for pair_iou, prev_id, next_id in sorted(pairs, reverse=True):
+            if pair_iou < min_iou:
+                break
+            if prev_id in used_prev or next_id in used_next:
+                continue
+
+            used_prev.add(prev_id)
+            used_next.add(next_id)
+            votes[(next_id, prev_id)] += 1
+
+    mapping, used_prev = {}, set()
+    for (next_id, prev_id), _ in votes.most_common():
+        if next_id in mapping or prev_id in used_prev:
+            continue
+        mapping[next_id] = prev_id
+        used_prev.add(prev_id)
+
+    return mapping
+
+
+def stitch_segments(
+    segments: list[tuple[int, int]],
+    segment_detections: list[list[list[dict]]],
+    min_iou: float = 0.5
+) -> list[list[dict]]:
+    """Merge the detections of overlapping segments into one stream ordered by frame.
+
+    Track IDs are made unique across segments, and tracks crossing a segment boundary keep
+    the ID they had in the previous segment. In the overlap frames, the detections of the
+    previous segment are kept since its tracker has already warmed up.
+    """
+    merged  = []
+    next_id = 1
+
+    for i, ((start, _), frames) in enumerate(zip(segments, segment_detections)):
+        overlap = len(merged) - start if i > 0 else 0
+        overlap = max(min(overlap, len(frames)), 0)
+
+        mapping = match_overlap_tracks(merged[len(merged) - overlap:], frames[:overlap], min_iou) if overlap > 0 else {}
+
+        # New tracks of this segment get fresh global IDs
+        local_ids = sorted({det["track_id"] for dets in frames for det in dets})
+        for track_id in local_ids:
+            if track_id not in mapping:
+                mapping[track_id] = next_id
+                next_id += 1
+
+        for dets in frames[overlap:]:
+            merged.append([{**det, "track_id": mapping[det["track_id"]]} for det in dets])
+
+    return merged
+
+
+def process_video_sharded(
+    input_video: str,
+    output_video: str,
+    worker_pool: ModelWorkerPool,
+    n_shards: int,
+    overlap: int = 15,
+    conf: float = 0.25,
+    iou: float = 0.7,
+    device="cpu",
+    reclassify_interval: int = 30,
+    reclassify_iou: float = 0.7,
+    reclassify_conf: float = 0.5,
+    detect_stride: int = 1,
+    adaptive_stride: bool = False,
+    motion_threshold: float = 0.0,
+    motion_regions: list | None = None,
+    camera_config: CameraConfig | None = None,
+    backend: str = "pytorch",
+    encoder_preset: str = "medium",
+    encoder_crf: int = 23,
+    output_mode: str = "video",
+    output_detections: str | None = None,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    **kwargs
+) -> PredictionOutput:
+    """Process a long video by splitting it into overlapping time segments that are processed
+    in parallel by the worker pool. Track IDs are reconciled across segment boundaries by IoU
+    matching in the overlap frames, then the annotated video is rendered in order.
+    With `output_mode="detections"`, the merged detections are saved to `output_detections`
+    (by default a `.npz` file next to `output_video`) instead of rendering the video, see `analyze_video`.
+    In "video" mode, they are also saved if `output_detections` is given.
+
+    Parameters
+    ----------
+    n_shards : int
+        Number of segments. Lowered for videos too short to be split.
+    overlap : int, optional
+        Number of frames shared by two consecutive segments, by default 15
+    kwargs
+        Other `process_video` options that do not apply to sharded processing
+    """
+    cap         = cv2.VideoCapture(input_video)
+    n_frames    = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segments        = split_segments(n_frames, n_shards, overlap)
+    total_work      = sum(end - start for start, end in segments) + (n_frames if output_mode == "video" else 0)
+    segment_done    = [0] * len(segments)
+    lock            = threading.Lock()
+
+    def report_progress(done: int):
+        if progress_callback is not None:
+            progress_callback(done, total_work)
+
+    def run_segment(i: int):
+        def on_progress(frames_processed, _):
+            with lock:
+                segment_done[i] = frames_processed
+                report_progress(sum(segment_done))
+
+        task = dict(
+            input_video=input_video,
+            start_frame=segments[i][0],
+            end_frame=segments[i][1],
+            conf=conf,
+            iou=iou,
+            device=device,
+            reclassify_interval=reclassify_interval,
+            reclassify_iou=reclassify_iou,
+            reclassify_conf=reclassify_conf,
+            detect_stride=detect_stride,
+            adaptive_stride=adaptive_stride,
+            motion_threshold=motion_threshold,
+            motion_regions=motion_regions,
+            camera_config=camera_config,
+            backend=backend,
+        )
+        return worker_pool.run(task, progress_callback=on_progress, cancel_event=cancel_event, function="detect_frames")
+
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        segment_detections = list(executor.map(run_segment, range(len(segments))))
+
+    detections      = stitch_segments(segments, segment_detections)
+    segments_work   = sum(segment_done)
+    stats           = {
+        "shards": [{"start_frame": start, "end_frame": end} for start, end in segments],
+        "n_tracks": len({det["track_id"] for dets in detections for det in dets}),
+    }
+    print(f"Stats: {stats}")
+
+    if output_mode == "detections" and output_detections is None:
+        output_detections = str(Path(output_video).with_suffix(".npz"))
+
+    if output_detections is not None:
+        writer = DetectionWriter(output_detections, video_stats=get_video_stats(input_video))
+        for frame_idx, frame_detections in enumerate(detections):
+            writer.add_frame(frame_idx, frame_detections)
+        writer.close()
+
+    if output_mode == "detections":
+        return PredictionOutput(output_video="", detections_path=output_detections, stats=stats)
+
+    render_video(
+        input_video,
+        output_video,
+        detections,
+        encoder_preset=encoder_preset,
+        encoder_crf=encoder_crf,
+        progress_callback=lambda frames_rendered, _: report_progress(segments_work + frames_rendered),
+        cancel_event=cancel_event
+    )
+
+    return PredictionOutput(output_video=output_video, detections_path=output_detections, stats=stats)
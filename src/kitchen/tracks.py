@@ -0,0 +1,162 @@
+import numpy as np
+
+
+# Default `track_buffer` of the Ultralytics trackers (see configs/trackers/botsort.yaml):
+# a track lost for more frames is removed by the tracker, and its id is never reused
+TRACK_BUFFER = 30
+
+
+class TrackStore:
+    """Recent trajectory and last label of each track, in preallocated NumPy ring buffers.
+
+    Each track gets a slot holding its last `history_length` box centers. Slots of tracks not seen
+    for more than `max_age` frames are freed and reused by new tracks, so the memory stays bounded
+    on long videos and live streams. The buffers grow (doubling) if more tracks are alive at once
+    than `capacity`.
+
+    Example
+    -------
+    >>> store = TrackStore()
+    >>> store.update(detections)        # once per frame, with the detections of `track_frame`
+    >>> store.polylines([det["track_id"] for det in detections])
+    >>> store.dwell_time(track_id, fps=25)
+    """
+
+    def __init__(self, history_length: int = 30, max_age: int = TRACK_BUFFER, capacity: int = 64):
+        self.history_length = history_length
+        self.max_age        = max_age
+        self.frame_idx      = -1
+        self.n_evicted      = 0
+        self.slots          = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity       = capacity
+        self.points         = np.zeros((capacity, self.history_length, 2), dtype=np.float32)
+        self.heads          = np.zeros(capacity, dtype=np.int64)
+        self.lengths        = np.zeros(capacity, dtype=np.int64)
+        self.track_ids      = np.full(capacity, -1, dtype=np.int64)
+        self.first_frames   = np.zeros(capacity, dtype=np.int64)
+        self.last_frames    = np.zeros(capacity, dtype=np.int64)
+        self.labels         = [None] * capacity
+        self.free_slots     = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        old_capacity    = self.capacity
+        old             = (self.points, self.heads, self.lengths, self.track_ids, self.first_frames, self.last_frames)
+        labels          = self.labels
+
+        self._allocate(old_capacity * 2)
+        for new, previous in zip(
+            (self.points, self.heads, self.lengths, self.track_ids, self.first_frames, self.last_frames), old
+        ):
+            new[:old_capacity] = previous
+        self.labels[:old_capacity]  = labels
+        self.free_slots             = list(range(self.capacity - 1, old_capacity - 1, -1))
+
+    def _slot(self, track_id: int) -> int:
+        slot = self.slots.get(track_id)
+        if slot is None:
+            if len(self.free_slots) == 0:
+                self._grow()
+            slot = self.free_slots.pop()
+            self.slots[track_id]        = slot
+            self.track_ids[slot]        = track_id
+            self.heads[slot]            = 0
+            self.lengths[slot]          = 0
+            self.first_frames[slot]     = self.frame_idx
+        return slot
+
+    def update(self, detections: list[dict], frame_idx: int | None = None):
+        """Add the box centers of a frame's detections, then evict the tracks lost for more than `max_age` frames.
+        Frames are counted by calls to `update` unless `frame_idx` is given.
+        """
+        self.frame_idx = self.frame_idx + 1 if frame_idx is None else frame_idx
+
+        for det in detections:
+            bbox    = det["bbox"]
+            slot    = self._slot(det["track_id"])
+            head    = self.heads[slot]
+
+            self.points[slot, head]     = ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+            self.heads[slot]            = (head + 1) % self.history_length
+            self.lengths[slot]          = min(self.lengths[slot] + 1, self.history_length)
+            self.last_frames[slot]      = self.frame_idx
+            self.labels[slot]           = (det["name"], det["subclass"])
+
+        self.evict()
+
+    def evict(self) -> int:
+        """Free the slots of the tracks lost for more than `max_age` frames. Returns the number of evicted tracks"""
+        expired = np.flatnonzero((self.track_ids >= 0) & (self.frame_idx - self.last_frames > self.max_age))
+        for slot in expired:
+            del self.slots[int(self.track_ids[slot])]
+            self.track_ids[slot]    = -1
+            self.labels[slot]       = None
+            self.free_slots.append(int(slot))
+
+        self.n_evicted += len(expired)
+        return len(expired)
+
+    def _ordered_points(self, slots: np.ndarray) -> np.ndarray:
+        """Points of the slots from oldest to newest, shape (n_slots, history_length, 2).
+        Only the last `lengths[slot]` points of each row are valid.
+        """
+        offsets = (self.heads[slots, None] + np.arange(self.history_length)[None, :]) % self.history_length
+        return self.points[slots[:, None], offsets]
+
+    def polylines(self, track_ids: list[int]) -> list[np.ndarray]:
+        """Trajectory of each track as an int32 array of shape (n_points, 1, 2), ready for `cv2.polylines`.
+        Unknown tracks get an empty array.
+        """
+        slots   = np.array([self.slots.get(track_id, -1) for track_id in track_ids], dtype=np.int64)
+        known   = slots >= 0
+        points  = np.zeros((len(slots), self.history_length, 2), dtype=np.int32)
+        lengths = np.zeros(len(slots), dtype=np.int64)
+
+        if known.any():
+            points[known]   = self._ordered_points(slots[known]).astype(np.int32)
+            lengths[known]  = self.lengths[slots[known]]
+
+        return [
+            points[i, self.history_length - length:].reshape((-1, 1, 2))
+            for i, length in enumerate(lengths)
+        ]
+
+    def trajectory(self, track_id: int) -> np.ndarray:
+        """Last (up to `history_length`) box centers of a track, oldest first, shape (n_points, 2)"""
+        slot = self.slots.get(track_id)
+        if slot is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        return self._ordered_points(np.array([slot]))[0, self.history_length - self.lengths[slot]:]
+
+    def dwell_time(self, track_id: int, fps: float | None = None) -> float | None:
+        """Time between the first and the last frame a track was seen, in frames, or in secs if `fps` is given"""
+        slot = self.slots.get(track_id)
+        if slot is None:
+            return None
+        n_frames = int(self.last_frames[slot] - self.first_frames[slot] + 1)
+        return n_frames / fps if fps else n_frames
+
+    def last_label(self, track_id: int) -> tuple[str, str] | None:
+        """(name, subclass) of the track in the last frame it was seen"""
+        slot = self.slots.get(track_id)
+        return self.labels[slot] if slot is not None else None
+
+    def active_tracks(self) -> list[int]:
+        """Ids of the tracks not evicted yet, including the ones lost for up to `max_age` frames"""
+        return list(self.slots)
+
+    def __contains__(self, track_id: int) -> bool:
+        return track_id in self.slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def stats(self) -> dict:
+        return {
+            "n_tracks": len(self.slots),
+            "capacity": self.capacity,
+            "evicted": self.n_evicted,
+            "memory_kb": (self.points.nbytes + 5 * self.heads.nbytes) / 2**10,
+        }
@@ -1,3 +1,4 @@
+import cv2
 import numpy as np
 from PIL import Image
 
@@ -46,11 +47,8 @@ def bboxes_xyxy_to_yolo_format(bboxes: list[tuple], img_width: int, img_height:
     list[str]
         List of YOLO formatted annotations
     """
-    yolo_annotations = []
-    for bbox in bboxes:
-        yolo_str = bbox_xyxy_to_yolo_format(bbox, img_width, img_height, class_id=class_id)
-        yolo_annotations.append(yolo_str)
-    return yolo_annotations
+    yolo_boxes = bboxes_xyxy_to_yolo(bboxes, img_width, img_height)
+    return format_yolo_labels(np.full(len(yolo_boxes), class_id), yolo_boxes)
 
 
 def yolo_to_bbox_xyxy(yolo_str: str, img_width: int, img_height: int) -> tuple:
@@ -63,6 +61,48 @@ def yolo_to_bbox_xyxy(yolo_str: str, img_width: int, img_height: int) -> tuple:
     return (xmin, ymin, xmax, ymax)
 
 
+def yolo_to_bboxes_xyxy(yolo_boxes: np.ndarray, img_width: int, img_height: int) -> np.ndarray:
+    """Convert an (N, 4) array of normalized YOLO boxes (x_center, y_center, width, height)
+    to an (N, 4) array of xyxy boxes in pixels
+    """
+    yolo_boxes  = np.asarray(yolo_boxes, dtype=np.float64).reshape(-1, 4)
+    centers     = yolo_boxes[:, :2]
+    half_sizes  = yolo_boxes[:, 2:] / 2
+    scale       = np.array([img_width, img_height, img_width, img_height], dtype=np.float64)
+    return np.hstack([centers - half_sizes, centers + half_sizes]) * scale
+
+
+def bboxes_xyxy_to_yolo(bboxes: np.ndarray, img_width: int, img_height: int) -> np.ndarray:
+    """Convert an (N, 4) array of xyxy boxes in pixels to an (N, 4) array of normalized YOLO boxes
+    (x_center, y_center, width, height)
+    """
+    bboxes  = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    scale   = np.array([img_width, img_height], dtype=np.float64)
+    centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2 / scale
+    sizes   = (bboxes[:, 2:] - bboxes[:, :2]) / scale
+    return np.hstack([centers, sizes])
+
+
+def format_yolo_labels(class_ids: np.ndarray, yolo_boxes: np.ndarray) -> list[str]:
+    """Format class ids and an (N, 4) array of YOLO boxes into the lines of a YOLO label file"""
+    return [
+        f"{class_id} {x_center} {y_center} {width} {height}"
+        for class_id, (x_center, y_center, width, height)
+        in zip(np.asarray(class_ids, dtype=int).tolist(), np.asarray(yolo_boxes).reshape(-1, 4).tolist())
+    ]
+
+
+def parse_yolo_labels(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Parse the content of a YOLO label file into an (N,) array of class ids and an (N, 4) array of YOLO boxes.
+    Raises ValueError if the lines do not all have 5 values.
+    """
+    values = np.array(text.split(), dtype=np.float64)
+    if len(values) % 5 != 0:
+        raise ValueError(f"{len(values)} values is not a multiple of 5 (class_id x_center y_center width height)")
+    values = values.reshape(-1, 5)
+    return values[:, 0].astype(np.int64), values[:, 1:]
+
+
 def crop_image(img, bbox: list[tuple[int, int]]):
     """Crops an image based on the provided polygon coordinates. 
     Apply a white background for areas outside of the polygon.
@@ -73,3 +113,69 @@ def crop_image(img, bbox: list[tuple[int, int]]):
     cropped = image_array[points[1]:points[3], points[0]:points[2], :]
 
     return Image.fromarray(cropped).convert("RGB")
+
+
+def crops_to_batch(frame: np.ndarray, bboxes: np.ndarray, size: int, out: np.ndarray | None = None) -> np.ndarray:
+    """Crop xyxy boxes from a BGR frame into a classifier input batch: float32 RGB values in [0, 1],
+    of shape (N, 3, size, size).
+
+    Like the transforms of the YOLO classifiers (resize on the shortest side, then center crop), but the center
+    square of each box is taken first, as a view of the frame: each crop is resized once, then written
+    to the batch with its channels flipped, without copying the frame or going through PIL.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        BGR frame from OpenCV
+    bboxes : np.ndarray
+        (N, 4) xyxy boxes in pixels, truncated to integers like `crop_image`
+    size : int
+        Input size of the classifier
+    out : np.ndarray | None, optional
+        Buffer of shape (M, 3, size, size) with M >= N to write the batch in, reused across calls
+
+    Returns
+    -------
+    np.ndarray
+        The batch, a view of the first N items of `out` if given
+    """
+    height, width   = frame.shape[:2]
+    bboxes          = np.asarray(bboxes).reshape(-1, 4).astype(int)
+    xmin            = np.clip(bboxes[:, 0], 0, width - 1)
+    ymin            = np.clip(bboxes[:, 1], 0, height - 1)
+    # At least one pixel, so that degenerate boxes still get a (blank) crop
+    xmax            = np.clip(bboxes[:, 2], xmin + 1, width)
+    ymax            = np.clip(bboxes[:, 3], ymin + 1, height)
+
+    sides   = np.minimum(xmax - xmin, ymax - ymin)
+    x0      = xmin + (xmax - xmin - sides) // 2
+    y0      = ymin + (ymax - ymin - sides) // 2
+
+    if out is None or len(out) < len(bboxes) or out.shape[1:] != (3, size, size):
+        out = np.empty((len(bboxes), 3, size, size), dtype=np.float32)
+    batch   = out[:len(bboxes)]
+    resized = np.empty((size, size, 3), dtype=np.uint8)
+    scale   = np.float32(1 / 255)
+
+    for i, (x, y, side) in enumerate(zip(x0.tolist(), y0.tolist(), sides.tolist())):
+        # Area interpolation when shrinking, close to the antialiased bilinear resize of the classifier transforms
+        interpolation = cv2.INTER_AREA if side > size else cv2.INTER_LINEAR
+        cv2.resize(frame[y:y + side, x:x + side], (size, size), dst=resized, interpolation=interpolation)
+        np.multiply(resized.transpose(2, 0, 1)[::-1], scale, out=batch[i])
+
+    return batch
+
+
+def box_iou(box1, box2) -> float:
+    """Intersection over union of two boxes in xyxy format"""
+    xmin = max(float(box1[0]), float(box2[0]))
+    ymin = max(float(box1[1]), float(box2[1]))
+    xmax = min(float(box1[2]), float(box2[2]))
+    ymax = min(float(box1[3]), float(box2[3]))
+
+    inter = max(0.0, xmax - xmin) * max(0.0, ymax - ymin)
+    area1 = (float(box1[2]) - float(box1[0])) * (float(box1[3]) - float(box1[1]))
+    area2 = (float(box2[2]) - float(box2[0])) * (float(box2[3]) - float(box2[1]))
+    union = area1 + area2 - inter
+
+    return inter / union if union > 0 else 0.0
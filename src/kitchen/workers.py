@@ -0,0 +1,224 @@
+import multiprocessing as mp
+import queue
+import threading
+from typing import Callable
+
+from kitchen.backends import ModelRegistry
+from kitchen.inference import ProcessingCancelled, analyze_video, detect_frames, process_video
+
+
+# Functions that can be run by the workers. Each takes the three models as keyword arguments.
+WORKER_FUNCTIONS = {
+    "process_video": process_video,
+    "detect_frames": detect_frames,
+    "analyze_video": analyze_video,
+}
+
+
+def _worker_main(models_dir: str, torch_threads: int, warmup: bool, task_queue, result_queue, cancel_event, ready_event):
+    """Entry point of a worker process: load (and warm up) its own models, set `ready_event`,
+    then process videos from the task queue.
+    A task is a (function name, keyword arguments) pair, the function being one of `WORKER_FUNCTIONS`.
+    The keyword arguments may contain a `backend`, whose models are loaded on first use.
+
+    Messages sent back on the result queue:
+    - ("model_load", backend, load time in secs of each model), when the models of a backend are loaded
+    - ("progress", frames_processed, n_frames)
+    - ("done", return value of the function)
+    - ("cancelled", None)
+    - ("error", message)
+    """
+    import torch
+
+    if torch_threads > 0:
+        torch.set_num_threads(torch_threads)
+
+    registry = ModelRegistry(
+        models_dir,
+        on_load=lambda backend, load_times: result_queue.put(("model_load", backend, load_times)),
+        warmup=warmup
+    )
+    try:
+        registry.get("pytorch")
+    except Exception as e:
+        result_queue.put(("error", f"Failed to load models: {e!r}"))
+        return
+    ready_event.set()
+
+    def report_progress(frames_processed: int, n_frames: int):
+        result_queue.put(("progress", frames_processed, n_frames))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        function_name, kwargs = task
+        try:
+            models = registry.get(kwargs.pop("backend", "pytorch"))
+            output = WORKER_FUNCTIONS[function_name](
+                **models,
+                progress_callback=report_progress,
+                cancel_event=cancel_event,
+                **kwargs
+            )
+            result_queue.put(("done", output))
+        except ProcessingCancelled:
+            result_queue.put(("cancelled", None))
+        except Exception as e:
+            result_queue.put(("error", repr(e)))
+
+
+class ModelWorker:
+    """Handle to one worker process, holding its own copy of the models and tracker"""
+
+    def __init__(self, ctx, worker_id: int, models_dir: str, torch_threads: int, warmup: bool = False):
+        self.worker_id      = worker_id
+        self.task_queue     = ctx.Queue()
+        self.result_queue   = ctx.Queue()
+        self.cancel_event   = ctx.Event()
+        self.ready_event    = ctx.Event()
+        self.process        = ctx.Process(
+            target=_worker_main,
+            args=(
+                models_dir, torch_threads, warmup,
+                self.task_queue, self.result_queue, self.cancel_event, self.ready_event
+            ),
+            name=f"model-worker-{worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+
+    def stop(self, timeout: float = 5):
+        if self.process.is_alive():
+            self.cancel_event.set()
+            self.task_queue.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ModelWorkerPool:
+    """Pool of worker processes, each holding its own detector, classifiers and tracker.
+
+    Each video is dispatched to a free worker, so simultaneous videos never share
+    model or tracker state. Workers are started on first use (or with `start`).
+
+    Parameters
+    ----------
+    models_dir : str
+        Directory containing the detector, dish_classifier and tray_classifier model directories
+    n_workers : int
+        Number of worker processes
+    torch_threads : int, optional
+        Number of torch intra-op threads per worker, by default 1. Use 0 to keep torch's default.
+    on_load : Callable, optional
+        `on_load(backend, load_times)`, called when a worker has loaded the models of a backend,
+        see `ModelRegistry`. Reported with the next task run on that worker.
+    warmup : bool, optional
+        Run the models of each worker once on dummy inputs after loading them, by default False
+    """
+
+    def __init__(
+        self,
+        models_dir: str,
+        n_workers: int,
+        torch_threads: int = 1,
+        poll_interval: float = 0.2,
+        on_load: Callable[[str, dict[str, float]], None] | None = None,
+        warmup: bool = False
+    ):
+        self.models_dir     = str(models_dir)
+        self.n_workers      = n_workers
+        self.torch_threads  = torch_threads
+        self.poll_interval  = poll_interval
+        self.on_load        = on_load
+        self.warmup         = warmup
+        self.ctx            = mp.get_context("spawn")
+        self.workers        = []
+        self.free_workers   = queue.Queue()
+        self.lock           = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if len(self.workers) > 0:
+                return
+
+            for worker_id in range(self.n_workers):
+                worker = ModelWorker(self.ctx, worker_id, self.models_dir, self.torch_threads, self.warmup)
+                self.workers.append(worker)
+                self.free_workers.put(worker)
+
+    def shutdown(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+            self.free_workers = queue.Queue()
+
+    def n_free(self) -> int:
+        return self.free_workers.qsize()
+
+    def n_ready(self) -> int:
+        """Number of workers that have loaded their models"""
+        with self.lock:
+            return sum(1 for worker in self.workers if worker.ready_event.is_set())
+
+    def run(
+        self,
+        task: dict,
+        progress_callback: Callable[[int, int], None] | None = None,
+        cancel_event: threading.Event | None = None,
+        function: str = "process_video"
+    ):
+        """Run a task on the next free worker, blocking until it is done, and return its result.
+
+        Parameters
+        ----------
+        task : dict
+            Keyword arguments of the worker function, without the models
+        function : str, optional
+            Name of the function in `WORKER_FUNCTIONS` to run, by default "process_video"
+        """
+        self.start()
+        worker = self.free_workers.get()
+        worker.cancel_event.clear()
+
+        try:
+            worker.task_queue.put((function, task))
+
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    worker.cancel_event.set()
+
+                try:
+                    kind, *payload = worker.result_queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    if not worker.process.is_alive():
+                        raise RuntimeError(f"Model worker {worker.worker_id} exited unexpectedly")
+                    continue
+
+                if kind == "progress":
+                    if progress_callback is not None:
+                        progress_callback(*payload)
+                elif kind == "model_load":
+                    if self.on_load is not None:
+                        self.on_load(*payload)
+                elif kind == "done":
+                    return payload[0]
+                elif kind == "cancelled":
+                    raise ProcessingCancelled(f"Processing of {task.get('input_video')} was cancelled")
+                elif kind == "error":
+                    raise RuntimeError(payload[0])
+        finally:
+            self._release(worker)
+
+    def _release(self, worker: ModelWorker):
+        # Replace a worker that died, so the pool keeps its size
+        if not worker.process.is_alive():
+            worker.stop()
+            worker = ModelWorker(self.ctx, worker.worker_id, self.models_dir, self.torch_threads, self.warmup)
+            with self.lock:
+                self.workers = [w for w in self.workers if w.worker_id != worker.worker_id] + [worker]
+
+        self.free_workers.put(worker)
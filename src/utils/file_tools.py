@@ -3,6 +3,7 @@ import os
 import sys
 import json
 import unicodedata
+import yaml
 
 
 def list_files(input_path: Path | str, extensions) -> list[Path]:
@@ -73,6 +74,12 @@ def read_json_file(input_path: Path | str) -> dict:
     return data
 
 
+def read_yaml_file(input_path: Path | str) -> dict:
+    with open(input_path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    return data or {}
+
+
 def write_ndjson_file(data: list[dict], output_path: Path | str):
     if not isinstance(output_path, Path):
         output_path = Path(output_path)
@@ -85,6 +92,18 @@ def write_ndjson_file(data: list[dict], output_path: Path | str):
             f.write(json.dumps(line) + "\n")
 
 
+def append_ndjson_file(data: list[dict], output_path: Path | str):
+    if not isinstance(output_path, Path):
+        output_path = Path(output_path)
+    
+    if not output_path.parent.exists():
+        output_path.parent.mkdir(parents=True)
+
+    with open(output_path, "a", encoding="utf-8") as f:
+        for line in data:
+            f.write(json.dumps(line) + "\n")
+
+
 def write_json_file(data: dict, output_path: Path | str):
     if not isinstance(output_path, Path):
         output_path = Path(output_path)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Literal
 
 
 class PredictionInput(BaseModel):
@@ -7,7 +8,88 @@ class PredictionInput(BaseModel):
     conf: float
     iou: float
     device: str
+    reclassify_interval: int = 30
+    reclassify_iou: float = 0.7
+    reclassify_conf: float = 0.5
+    detect_stride: int = 1
+    adaptive_stride: bool = False
+    motion_threshold: float = 0.0
+    motion_regions: list[list[list[float]]] | None = None
+    # Name of a camera config in configs/cameras (inference resolution and regions of interest)
+    camera: str | None = None
+    # Inference backend, see kitchen.backends.BACKEND_WEIGHTS
+    backend: Literal["pytorch", "onnx", "onnx_int8", "openvino", "openvino_int8"] = "pytorch"
+    pipeline: bool = False
+    queue_size: int = 8
+    encoder_preset: str = "medium"
+    encoder_crf: int = 23
+    n_shards: int = 1
+    shard_overlap: int = 15
+    # "video" renders the annotated video, "detections" only saves the detections (analytics mode)
+    output_mode: Literal["video", "detections"] = "video"
+    # In "video" mode, also save the detections next to the output video
+    save_detections: bool = False
+    # Save the timed stages as a Chrome trace JSON next to the output video ("video" mode only)
+    trace: bool = False
+
+
+class CameraConfig(BaseModel):
+    name: str = "default"
+    # Longest side of the detector input, the frames are letterboxed to it. None keeps the native resolution.
+    imgsz: int | None = None
+    # Regions of interest fed to the detector, polygons in full-frame pixel coordinates [[[x1, y1], [x2, y2], ...], ...]
+    rois: list[list[list[float]]] = []
+    # Margin in pixels kept around the regions of interest, so that objects crossing their border are not cut off
+    roi_padding: int = 32
+
+
+class RenderInput(BaseModel):
+    in_video_path: str
+    detections_path: str
+    out_video_path: str
+    encoder_preset: str = "medium"
+    encoder_crf: int = 23
+
+
+class ExportInput(BaseModel):
+    in_video_path: str
+    # Dataset directory, exporting several videos to the same directory grows the dataset
+    output_dir: str
+    # Frame sampling, see kitchen.datasets.sample_frames
+    policy: Literal["stride", "uniform", "motion"] = "stride"
+    stride: int = 30
+    n_samples: int = 200
+    motion_threshold: float = 0.05
+    conf: float = 0.25
+    iou: float = 0.7
+    device: str = "cpu"
+    backend: Literal["pytorch", "onnx", "onnx_int8", "openvino", "openvino_int8"] = "pytorch"
+    val_fraction: float = 0.1
+    skip_empty: bool = False
+
+
+class ExportOutput(BaseModel):
+    data_yaml: str
+    n_samples: int
+    n_boxes: int
+    n_train: int
+    n_val: int
 
 
 class PredictionOutput(BaseModel):
-    output_video: str
\ No newline at end of file
+    output_video: str
+    detections_path: str | None = None
+    detections_ndjson_path: str | None = None
+    trace_path: str | None = None
+    stats: dict = {}
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "done", "failed", "cancelled"]
+    frames_processed: int = 0
+    n_frames: int = 0
+    fps: float = 0.0
+    eta: float | None = None  # in secs
+    result: PredictionOutput | None = None
+    error: str | None = None